@@ -0,0 +1,430 @@
+import os
+import shutil
+import argparse
+import tempfile
+
+from typing import Callable, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import open3d as o3d
+
+###############################################################################
+###############################################################################
+
+
+# NOTE this is an out-of-core replacement for `PointCloud.compute_point_cloud_distance`, i.e.
+# it returns the distance from each query point to its nearest reference point, but:
+#  - points are streamed in chunks (e.g. from a memory-mapped .ply file, see `ply_vertices`),
+#  - space is split into slabs (along the longest axis), whose query points are bucketed in temporary
+#    files, together with the reference points within `cutoff` of the slab (i.e. tiles overlap),
+#  - each slab is then loaded and solved with a "local" index (Open3D's KD-tree, by default),
+# so peak memory is bounded by `max_tile_points` (plus the output array), not by the clouds' sizes.
+# Distances greater than or equal to `cutoff` are returned as `cutoff` (since the nearest point
+# might be in another slab), which is fine for the evaluation, as long as `cutoff` is larger than
+# the largest distance of interest (e.g. `plot_stretch * dTau`).
+# Note that it's only used by this file's CLI, since the evaluator reads (and registers) whole
+# point clouds with Open3D, so there would be nothing to stream by the time distances are computed.
+
+CHUNK_SIZE = 1 << 20  # points per chunk when streaming
+TILE_POINTS = 1 << 24  # (approximate) maximum number of query and reference points loaded at once
+MAX_BINS = 1 << 20  # maximum number of bins in the histogram used to choose slab boundaries
+
+DistanceFn = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def open3d_distances(query_points: np.ndarray, reference_points: np.ndarray) -> np.ndarray:
+    """ Returns `compute_point_cloud_distance` (which uses a KD-tree) as a float64 array. """
+    query = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(query_points))
+    reference = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(reference_points))
+    return np.asarray(query.compute_point_cloud_distance(reference), dtype=np.float64)
+
+
+###############################################################################
+###############################################################################
+
+
+# fmt: off
+PLY_DTYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+# fmt: on
+
+
+def ply_vertices(ply_path: str) -> np.memmap:
+    """ Returns a (read-only) structured memmap of the vertices of a binary .ply file, so that its
+        "x", "y" and "z" fields can be read in chunks, without loading the whole file.
+
+        Note: the vertex element must be the first one, and can't have list properties.
+    """
+    with open(ply_path, "rb") as f:
+        assert f.readline().strip() == b"ply", ply_path
+        byte_order, n_of_vertices, fields, element = None, None, [], None
+        while True:
+            line = f.readline()
+            assert line, f"missing end_header in '{ply_path}'"
+            words = line.decode("ascii").split()
+            if not words or words[0] in ["comment", "obj_info"]:
+                continue
+            if words[0] == "end_header":
+                break
+            if words[0] == "format":
+                assert words[1] in ["binary_little_endian", "binary_big_endian"], f"{words[1]} .ply is unsupported"
+                byte_order = "<" if words[1] == "binary_little_endian" else ">"
+            elif words[0] == "element":
+                element = words[1]
+                if element == "vertex":
+                    assert n_of_vertices is None and not fields, "vertex must be the first element"
+                    n_of_vertices = int(words[2])
+                else:
+                    assert n_of_vertices is not None, "vertex must be the first element"
+            elif words[0] == "property" and element == "vertex":
+                assert words[1] != "list", "list properties are unsupported for vertices"
+                fields.append((words[2], byte_order + PLY_DTYPES[words[1]]))
+        offset = f.tell()
+
+    assert n_of_vertices is not None, f"no vertex element in '{ply_path}'"
+    return np.memmap(ply_path, dtype=np.dtype(fields), mode="r", offset=offset, shape=(n_of_vertices,))
+
+
+def xyz_chunks(points: np.ndarray, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, np.ndarray]]:
+    """ Yields `(start, xyz)` float64 chunks of either a `(n, 3)` array, or a structured array
+        with "x", "y" and "z" fields (e.g. from `ply_vertices`), which can be memory-mapped.
+    """
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start : start + chunk_size]
+        if chunk.dtype.names is not None:
+            yield start, np.stack([chunk["x"], chunk["y"], chunk["z"]], axis=1).astype(np.float64)
+        else:
+            yield start, np.asarray(chunk, dtype=np.float64).reshape((-1, 3))
+
+
+###############################################################################
+###############################################################################
+
+
+def slab_edges(
+    query_points: np.ndarray,
+    reference_points: np.ndarray,
+    cutoff: float,
+    max_tile_points: int = TILE_POINTS,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[int, np.ndarray]:
+    """ Returns the axis along which space is split, and the (increasing) edges of the slabs, chosen
+        such that each of them has at most `max_tile_points` query and reference points (unless a
+        single `cutoff`-wide bin already has more than that, as bins aren't split any further).
+    """
+    min_bound, max_bound = np.full(3, np.inf), np.full(3, -np.inf)
+    for points in [query_points, reference_points]:
+        for _, xyz in xyz_chunks(points, chunk_size):
+            min_bound = np.minimum(min_bound, xyz.min(axis=0))
+            max_bound = np.maximum(max_bound, xyz.max(axis=0))
+
+    axis = int(np.argmax(max_bound - min_bound))
+    lo, hi = min_bound[axis], max_bound[axis]
+    n_of_bins = int(min(max(np.ceil((hi - lo) / cutoff), 1), MAX_BINS))
+    bin_edges = np.linspace(lo, hi, n_of_bins + 1)
+
+    counts = np.zeros(n_of_bins, dtype=np.int64)
+    for points in [query_points, reference_points]:
+        for _, xyz in xyz_chunks(points, chunk_size):
+            counts += np.histogram(xyz[:, axis], bin_edges)[0]
+
+    # NOTE greedily merge consecutive bins into slabs (each bin's count includes its reference points,
+    # but not the ones in the overlap with its neighbors, which are at most `cutoff` away from it)
+    edges = [lo]
+    slab_count = 0
+    for i, count in enumerate(counts):
+        if slab_count > 0 and slab_count + count > max_tile_points:
+            edges.append(bin_edges[i])
+            slab_count = 0
+        slab_count += count
+    edges.append(np.inf)
+    edges[0] = -np.inf  # NOTE so that every point is in some slab
+
+    return axis, np.array(edges)
+
+
+def tiled_distances(
+    query_points: np.ndarray,
+    reference_points: np.ndarray,
+    cutoff: float,
+    max_tile_points: int = TILE_POINTS,
+    distance_fn: Optional[DistanceFn] = None,
+    out: Optional[np.ndarray] = None,
+    work_dir: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> np.ndarray:
+    """ Returns the distance from each of the `query_points` to its nearest `reference_points`
+        (clamped to `cutoff`), processing one slab of space at a time (see the note at the top).
+
+        Note: the points can be `(n, 3)` arrays or structured arrays (e.g. from `ply_vertices`),
+        `out` can be a memmap (e.g. from `np.lib.format.open_memmap`), and `work_dir` is where
+        the temporary slab files are written to (default: a new folder in the system's temp dir).
+    """
+    assert cutoff > 0, cutoff
+    if distance_fn is None:
+        distance_fn = open3d_distances
+    if out is None:
+        out = np.empty(len(query_points), dtype=np.float64)
+    assert out.shape == (len(query_points),), out.shape
+
+    if len(query_points) == 0:
+        return out
+    if len(reference_points) == 0:
+        out[:] = cutoff
+        return out
+
+    def solve(query_xyz, reference_xyz):
+        if len(reference_xyz) == 0:
+            return np.full(len(query_xyz), cutoff)
+        return np.minimum(distance_fn(query_xyz, reference_xyz), cutoff)
+
+    # NOTE if everything fits in a single tile, there's no need to bucket points in slabs
+    if len(query_points) + len(reference_points) <= max_tile_points:
+        query_xyz = np.concatenate([xyz for _, xyz in xyz_chunks(query_points, chunk_size)])
+        reference_xyz = np.concatenate([xyz for _, xyz in xyz_chunks(reference_points, chunk_size)])
+        out[:] = solve(query_xyz, reference_xyz)
+        return out
+
+    axis, edges = slab_edges(query_points, reference_points, cutoff, max_tile_points, chunk_size)
+    n_of_slabs = len(edges) - 1
+
+    temp_dir = tempfile.mkdtemp(prefix="tiled_distances_", dir=work_dir)
+
+    def slab_path(name, k):
+        return os.path.join(temp_dir, f"{name}_{k}.bin")
+
+    def append_to_slab(name, k, array):
+        # NOTE slab files are only opened while they're written to, so that the number of slabs
+        # isn't limited by the number of files that can be open at once (e.g. 1024 on Linux)
+        with open(slab_path(name, k), "ab") as f:
+            array.tofile(f)
+
+    try:
+        # Bucket the query points (with their indices) in the slab they are in.
+        for start, xyz in xyz_chunks(query_points, chunk_size):
+            slabs = np.searchsorted(edges, xyz[:, axis], side="right") - 1
+            order = np.argsort(slabs, kind="stable")
+            bounds = np.searchsorted(slabs[order], np.arange(n_of_slabs + 1))
+            rows = np.column_stack([xyz, (start + np.arange(len(xyz))).astype(np.float64)])[order]
+            for k in np.flatnonzero(np.diff(bounds)):
+                append_to_slab("query", k, rows[bounds[k] : bounds[k + 1]])
+
+        # Bucket the reference points in every slab that they are within `cutoff` of.
+        for _, xyz in xyz_chunks(reference_points, chunk_size):
+            first = np.searchsorted(edges, xyz[:, axis] - cutoff, side="right") - 1
+            last = np.searchsorted(edges, xyz[:, axis] + cutoff, side="right") - 1
+            for offset in range(int(np.max(last - first)) + 1):
+                slabs = np.where(first + offset <= last, first + offset, -1)
+                order = np.argsort(slabs, kind="stable")
+                bounds = np.searchsorted(slabs[order], np.arange(n_of_slabs + 1))
+                for k in np.flatnonzero(np.diff(bounds)):
+                    append_to_slab("reference", k, xyz[order[bounds[k] : bounds[k + 1]]])
+
+        # Solve each slab independently (NOTE point indices are stored as float64, which is exact up to 2^53).
+        for k in range(n_of_slabs):
+            if not os.path.isfile(slab_path("query", k)):
+                continue
+            rows = np.fromfile(slab_path("query", k), dtype=np.float64).reshape((-1, 4))
+            if os.path.isfile(slab_path("reference", k)):
+                reference_xyz = np.fromfile(slab_path("reference", k), dtype=np.float64).reshape((-1, 3))
+            else:
+                reference_xyz = np.empty((0, 3))
+            out[rows[:, 3].astype(np.int64)] = solve(rows[:, :3], reference_xyz)
+            del rows, reference_xyz
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return out
+
+
+###############################################################################
+###############################################################################
+
+
+# NOTE since distances are clamped to `cutoff`, nearest neighbors only need to be searched in the
+# 27 voxels around each query point (if voxels are at least `cutoff` wide), so instead of a KD-tree,
+# the reference points are bucketed by voxel, and the voxels are looked up by their (packed) keys.
+# Queries are split in chunks, which are run across threads (numpy releases the GIL), and both
+# directions of the evaluation (i.e. s -> t and t -> s) share the same pool of threads.
+
+QUERY_CHUNK_SIZE = 1 << 16  # query points per task
+MAX_PAIRS = 1 << 22  # maximum number of (query, reference) point pairs whose distances are computed at once
+
+# NOTE neighbors are visited from the query's own voxel outwards, so that most of the other voxels can be
+# skipped (i.e. when they're farther from the query point than the nearest neighbor found so far)
+NEIGHBOR_OFFSETS = sorted(
+    [(i, j, k) for i in [-1, 0, 1] for j in [-1, 0, 1] for k in [-1, 0, 1]],
+    key=lambda offset: sum(abs(o) for o in offset),
+)
+
+
+class VoxelHashGrid:
+    """ Reference points bucketed in voxels with `cell_size` edges (which should be close to the cutoff
+        distance used in queries, see `distances`), sorted by their voxel keys.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float):
+        points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+        assert len(points) > 0 and cell_size > 0, (points.shape, cell_size)
+
+        self.cell_size = cell_size
+        self.origin = points.min(axis=0)
+        cells = np.floor((points - self.origin) / cell_size).astype(np.int64)
+        self.dims = cells.max(axis=0) + 1
+        assert np.prod(self.dims.astype(float)) < 2.0 ** 62, f"too many voxels ({self.dims}), increase cell_size"
+
+        keys = self.pack(cells)
+        order = np.argsort(keys, kind="stable")
+        self.points = points[order]
+        self.keys, self.starts, self.counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    def pack(self, cells: np.ndarray) -> np.ndarray:
+        return (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2] + cells[:, 2]
+
+    def distances(self, query_points: np.ndarray, cutoff: float) -> np.ndarray:
+        """ Returns the distance from each query point to its nearest (reference) point, clamped to `cutoff`,
+            which is exact (i.e. the same as a KD-tree's) for distances below it, if `cutoff <= cell_size`.
+        """
+        assert cutoff <= self.cell_size, (cutoff, self.cell_size)
+        query_points = np.asarray(query_points, dtype=np.float64).reshape((-1, 3))
+        query_cells = np.floor((query_points - self.origin) / self.cell_size).astype(np.int64)
+        best = np.full(len(query_points), cutoff * cutoff)  # NOTE squared distances
+
+        for offset in NEIGHBOR_OFFSETS:
+            cells = query_cells + offset
+            queries = np.flatnonzero(np.all((cells >= 0) & (cells < self.dims), axis=1))
+
+            # Skip voxels which are farther from the query point than its nearest neighbor (so far).
+            box_min = self.origin + cells[queries] * self.cell_size
+            gap = np.maximum(box_min - query_points[queries], query_points[queries] - box_min - self.cell_size)
+            gap = np.maximum(gap, 0)
+            queries = queries[np.sum(gap * gap, axis=1) < best[queries]]
+
+            # Find the (non-empty) voxels.
+            keys = self.pack(cells[queries])
+            slots = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            is_found = self.keys[slots] == keys
+            queries, slots = queries[is_found], slots[is_found]
+
+            # Compute the distances to the voxels' points, in batches of (at most) `MAX_PAIRS` pairs.
+            counts = self.counts[slots]
+            batch_ends = np.cumsum(counts)
+            i = 0
+            while i < len(queries):
+                j = max(int(np.searchsorted(batch_ends, batch_ends[i] - counts[i] + MAX_PAIRS, side="right")), i + 1)
+                batch_counts = counts[i:j]
+                segment_starts = np.cumsum(batch_counts) - batch_counts
+                n_of_pairs = int(batch_counts.sum())
+                pair_points = (
+                    np.arange(n_of_pairs)
+                    - np.repeat(segment_starts, batch_counts)
+                    + np.repeat(self.starts[slots[i:j]], batch_counts)
+                )
+                diff = np.repeat(query_points[queries[i:j]], batch_counts, axis=0) - self.points[pair_points]
+                min_d2 = np.minimum.reduceat(np.einsum("ij,ij->i", diff, diff), segment_starts)
+                best[queries[i:j]] = np.minimum(best[queries[i:j]], min_d2)
+                i = j
+
+        return np.sqrt(best)
+
+
+def submit_voxel_hash_queries(executor, grid, query_points, cutoff, chunk_size=QUERY_CHUNK_SIZE):
+    """ Submits the `grid.distances` of each chunk of `query_points`, returning a "future" array. """
+    futures = [
+        (start, executor.submit(grid.distances, query_points[start : start + chunk_size], cutoff))
+        for start in range(0, len(query_points), chunk_size)
+    ]
+
+    def result():
+        distances = np.empty(len(query_points), dtype=np.float64)
+        for start, future in futures:
+            distances[start : start + chunk_size] = future.result()
+        return distances
+
+    return result
+
+
+def voxel_hash_distances(
+    query_points: np.ndarray,
+    reference_points: np.ndarray,
+    cutoff: float,
+    executor: Optional[ThreadPoolExecutor] = None,
+    chunk_size: int = QUERY_CHUNK_SIZE,
+) -> np.ndarray:
+    """ Returns the distance from each of the `query_points` to its nearest `reference_points`
+        (clamped to `cutoff`), computed with a `VoxelHashGrid` in chunks, which are run on `executor`
+        (if it's None, a `ThreadPoolExecutor` with `os.cpu_count()` threads is used).
+    """
+    query_points = np.asarray(query_points, dtype=np.float64).reshape((-1, 3))
+    if len(query_points) == 0 or len(reference_points) == 0:
+        return np.full(len(query_points), cutoff)
+    if executor is None:
+        with ThreadPoolExecutor(os.cpu_count()) as executor:
+            return voxel_hash_distances(query_points, reference_points, cutoff, executor, chunk_size)
+
+    grid = VoxelHashGrid(reference_points, cutoff)
+    return submit_voxel_hash_queries(executor, grid, query_points, cutoff, chunk_size)()
+
+
+def bidirectional_voxel_hash_distances(
+    s_points: np.ndarray,
+    t_points: np.ndarray,
+    cutoff: float,
+    executor: Optional[ThreadPoolExecutor] = None,
+    chunk_size: int = QUERY_CHUNK_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns `voxel_hash_distances(s_points, t_points)` and `voxel_hash_distances(t_points, s_points)`,
+        but with both grids built, and the chunks of both directions run, concurrently (on `executor`).
+    """
+    s_points = np.asarray(s_points, dtype=np.float64).reshape((-1, 3))
+    t_points = np.asarray(t_points, dtype=np.float64).reshape((-1, 3))
+    if len(s_points) == 0 or len(t_points) == 0:
+        return np.full(len(s_points), cutoff), np.full(len(t_points), cutoff)
+    if executor is None:
+        with ThreadPoolExecutor(os.cpu_count()) as executor:
+            return bidirectional_voxel_hash_distances(s_points, t_points, cutoff, executor, chunk_size)
+
+    t_grid = executor.submit(VoxelHashGrid, t_points, cutoff)
+    s_grid = executor.submit(VoxelHashGrid, s_points, cutoff)
+    s_to_t = submit_voxel_hash_queries(executor, t_grid.result(), s_points, cutoff, chunk_size)
+    t_to_s = submit_voxel_hash_queries(executor, s_grid.result(), t_points, cutoff, chunk_size)
+    return s_to_t(), t_to_s()
+
+
+###############################################################################
+###############################################################################
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute the (clamped) distance from each point of a .ply to its nearest point in another one."
+    )
+
+    parser.add_argument("query_ply", type=str, help="Path to the binary .ply with the query points")
+    parser.add_argument("reference_ply", type=str, help="Path to the binary .ply with the reference points")
+    parser.add_argument("out_npy", type=str, help="Path to the output .npy file (written as a memmap)")
+
+    parser.add_argument("--cutoff", type=float, required=True, help="Distances above it are clamped to it")
+    parser.add_argument("--max-tile-points", type=int, default=TILE_POINTS, help="Points loaded at once")
+    parser.add_argument("--work-dir", type=str, help="Where temporary files are written to")
+
+    args = parser.parse_args()
+
+    query_points = ply_vertices(args.query_ply)
+    reference_points = ply_vertices(args.reference_ply)
+    distances = np.lib.format.open_memmap(args.out_npy, mode="w+", dtype=np.float64, shape=(len(query_points),))
+
+    tiled_distances(
+        query_points, reference_points, args.cutoff, args.max_tile_points, out=distances, work_dir=args.work_dir
+    )
+    distances.flush()
+    print(f"Wrote {len(distances)} distances to '{args.out_npy}'")
+
+
+###############################################################################
+###############################################################################
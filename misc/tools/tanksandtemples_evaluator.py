@@ -36,8 +36,12 @@
 
 
 import os
-import copy
+import sys
+import json
+import time
+import hashlib
 import argparse
+import contextlib
 
 import numpy as np
 import open3d as o3d
@@ -55,6 +59,146 @@ except AttributeError:
 # ----------------------------------------------------------------------------
 
 
+# NOTE stage profiling is enabled with `evaluate_reconstruction(..., profile=True)` (i.e.
+# `--profile`), or by setting this environment variable to 1, in which case a
+# "{scene_name}.profile.json" report is written to the output folder (next to the other outputs,
+# such as "{scene_name}.prf_tau_plotstr.txt")
+PROFILE_ENV = "FF_PROFILE_EVALUATION"
+
+
+def is_profiling_enabled():
+    return os.environ.get(PROFILE_ENV, "0").lower() not in ["", "0", "false", "no", "off"]
+
+
+def peak_rss():
+    """Returns the peak resident set size (in bytes) of this process so far (or None)."""
+    try:
+        import resource  # NOTE not available on Windows
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # NOTE Linux reports it in KiB
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        # NOTE Windows' peak working set
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    except ImportError:
+        return None
+
+
+class StageProfiler:
+    """Records the wall time, CPU time (of all threads) and peak RSS of each stage of an evaluation,
+    rewriting the JSON report after every stage, so that it's complete even if a later one fails.
+    """
+
+    active = None  # NOTE the profiler used by `profile_stage` (i.e. the last one started)
+
+    def __init__(self, json_path):
+        self.json_path = json_path
+        self.stages = []
+
+    @staticmethod
+    def start(json_path):
+        """Makes a new profiler active (until another one starts), unless `json_path` is None."""
+        StageProfiler.active = None if json_path is None else StageProfiler(json_path)
+        return StageProfiler.active
+
+    def record(self, name, wall_time, cpu_time, peak_rss_before, peak_rss_after):
+        self.stages.append(
+            {
+                "name": name,
+                "wall_time": wall_time,
+                "cpu_time": cpu_time,
+                "peak_rss": peak_rss_after,
+                # NOTE how much the stage raised the process' peak RSS (i.e. 0 if it didn't)
+                "peak_rss_increase": (
+                    None
+                    if peak_rss_before is None or peak_rss_after is None
+                    else peak_rss_after - peak_rss_before
+                ),
+            }
+        )
+        self.save()
+
+    def save(self):
+        peak_rss_values = [
+            stage["peak_rss"] for stage in self.stages if stage["peak_rss"] is not None
+        ]
+        report = {
+            "stages": self.stages,
+            "total": {
+                "wall_time": sum(stage["wall_time"] for stage in self.stages),
+                "cpu_time": sum(stage["cpu_time"] for stage in self.stages),
+                "peak_rss": max(peak_rss_values) if peak_rss_values else None,
+            },
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.json_path)), exist_ok=True)
+        with open(self.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """Records the enclosed code as a stage of the active `StageProfiler` (if there's one)."""
+    profiler = StageProfiler.active
+    if profiler is None:
+        yield
+        return
+
+    peak_rss_before = peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    yield
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    profiler.record(name, wall_time, cpu_time, peak_rss_before, peak_rss())
+
+
+# ----------------------------------------------------------------------------
+
+
+def read_log(log_file_path):
+    """Parses a whole .log trajectory file at once, into (N, 3) metadata and (N, 4, 4) matrices."""
+    with open(log_file_path, "r") as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    assert len(lines) % 5 == 0, "%s has %d (non-empty) lines" % (log_file_path, len(lines))
+    n_of_poses = len(lines) // 5
+    if n_of_poses == 0:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros((0, 4, 4))
+
+    # NOTE every five lines are an item: a line with its metadata, followed by a 4x4 matrix
+    metadata = np.array(" ".join(lines[0::5]).split(), dtype=np.int64).reshape((n_of_poses, -1))
+    del lines[0::5]
+    matrices = np.array(" ".join(lines).split(), dtype=np.float64).reshape((n_of_poses, 4, 4))
+    return metadata, matrices
+
+
+def write_log(log_file_path, matrices, metadata=None):
+    """Writes the (N, 4, 4) `matrices` to a .log trajectory file, formatting all of them at once.
+    If `metadata` is None, then [i, i, 0] is used for the i-th matrix (otherwise, it's (N, k) ints).
+    """
+    matrices = np.asarray(matrices, dtype=np.float64).reshape((-1, 4, 4))
+    n_of_poses = len(matrices)
+    if n_of_poses == 0:
+        open(log_file_path, "w").close()
+        return
+    if metadata is None:
+        metadata = np.column_stack(
+            [np.arange(n_of_poses), np.arange(n_of_poses), np.zeros(n_of_poses)]
+        )
+    metadata = np.asarray(metadata).astype(np.int64).reshape((n_of_poses, -1))
+
+    # NOTE the same as formatting each element with "{0:.12f}".format (and metadata with str), but
+    # in a single % operation, with a format string made of one "block" per pose (i.e. five lines)
+    block_format = " ".join(["%d"] * metadata.shape[1]) + "\n" + "%.12f %.12f %.12f %.12f\n" * 4
+    values = np.concatenate(
+        [metadata.astype(object), matrices.reshape((n_of_poses, 16)).astype(object)], axis=1
+    )
+    with open(log_file_path, "w") as f:
+        f.write((block_format * n_of_poses) % tuple(values.ravel().tolist()))
+
+
 class Trajectory:
     def __init__(self, camera_poses=None):
         self.camera_poses = [] if camera_poses is None else camera_poses
@@ -73,50 +217,137 @@ class Trajectory:
     # Trajectory file (.log) format parse reference:
     # http://redwood-data.org/indoor/fileformat.html
 
+    @staticmethod
+    def from_arrays(metadata, matrices):
+        # NOTE each camera pose's metadata and matrix are views of `metadata` and `matrices`
+        return Trajectory(
+            [Trajectory.CameraPose(meta, mat) for meta, mat in zip(metadata, matrices)]
+        )
+
+    def arrays(self):
+        """Returns the (N, k) metadata and (N, 4, 4) matrices of the poses (see `read_log`)."""
+        return np.array([x.metadata for x in self.camera_poses], dtype=np.int64), self.matrices()
+
+    def matrices(self):
+        return np.array([x.pose for x in self.camera_poses], dtype=np.float64).reshape((-1, 4, 4))
+
+    def camera_positions(self):
+        return self.matrices()[:, :3, 3]
+
+    def __len__(self):
+        return len(self.camera_poses)
+
     @staticmethod
     def read(log_file_path):
-        traj = []
-        with open(log_file_path, "r") as f:
-            metastr = f.readline()
-            while metastr:
-                metadata = map(int, metastr.split())
-                mat = np.zeros(shape=(4, 4))
-                for i in range(4):
-                    mat[i, :] = np.fromstring(f.readline(), dtype=float, sep=" \t")
-                traj.append(Trajectory.CameraPose(metadata, mat))
-                metastr = f.readline()
-        return Trajectory(traj)
+        return Trajectory.from_arrays(*read_log(log_file_path))
 
     def write(self, log_file_path):
-        with open(log_file_path, "w") as f:
-            for x in self.camera_poses:
-                p = x.pose.tolist()
-                f.write(" ".join(map(str, x.metadata)) + "\n")
-                f.write("\n".join(" ".join(map("{0:.12f}".format, p[i])) for i in range(4)))
-                f.write("\n")
+        metadata, matrices = self.arrays()
+        write_log(log_file_path, matrices, metadata)
 
     def point_cloud(self):
         pcd = o3d.geometry.PointCloud()
-        for x in self.camera_poses:
-            pcd.points.append(x.pose[:3, 3])
+        pcd.points = o3d.utility.Vector3dVector(self.camera_positions())
         return pcd
 
 
 # ----------------------------------------------------------------------------
 
 
-def cropped_pcd(pcd, crop_volume, transformation=None):
-    pcd_copy = copy.deepcopy(pcd)
-    if transformation is not None:
-        pcd_copy.transform(transformation)
+CROP_CHUNK_SIZE = 1 << 20  # points per chunk when transforming (or testing) coordinates
+
+
+def transform_points(points, transformation, out=None, chunk_size=CROP_CHUNK_SIZE):
+    """Returns `points @ R.T + t` (like `PointCloud.transform`), computed in chunks of `chunk_size`
+    rows, so that it's written directly to `out` (which is allocated if None, and can alias
+    `points`)."""
+    points = np.asarray(points)
+    transformation = np.asarray(transformation, dtype=np.float64)
+    R, t = transformation[:3, :3], transformation[:3, 3]
+    if out is None:
+        out = np.empty(points.shape, dtype=np.float64)
+    assert out.shape == points.shape, (out.shape, points.shape)
+
+    for i in range(0, len(points), chunk_size):
+        chunk = points[i : i + chunk_size]
+        np.matmul(chunk, R.T, out=out[i : i + chunk_size])
+        out[i : i + chunk_size] += t
+    return out
+
+
+def crop_mask(points, crop_volume, chunk_size=CROP_CHUNK_SIZE):
+    """Returns a boolean mask of the `points` inside of `crop_volume`, with the same semantics as
+    `crop_volume.crop_point_cloud(pcd)` and `pcd.crop(crop_volume)` (but without copying `pcd`)."""
+    points = np.asarray(points)
+    mask = np.empty(len(points), dtype=bool)
 
-    if crop_volume is None:
-        return pcd_copy
     if isinstance(crop_volume, o3d.geometry.AxisAlignedBoundingBox):
-        return pcd_copy.crop(crop_volume)
-    else:
-        assert isinstance(crop_volume, o3d.visualization.SelectionPolygonVolume)
-        return crop_volume.crop_point_cloud(pcd_copy)
+        min_bound, max_bound = np.asarray(crop_volume.min_bound), np.asarray(crop_volume.max_bound)
+        for i in range(0, len(points), chunk_size):
+            chunk = points[i : i + chunk_size]
+            mask[i : i + chunk_size] = np.all((chunk >= min_bound) & (chunk <= max_bound), axis=1)
+        return mask
+
+    assert isinstance(crop_volume, o3d.visualization.SelectionPolygonVolume)
+    # NOTE (u, v) are the polygon's coordinates, and w is its orthogonal axis (see Open3D's
+    # `SelectionPolygonVolume::CropInPolygon`), so a point is inside of it if its (u, v) projection
+    # is to the right of an odd number of polygon edges, and w is within [axis_min, axis_max]
+    # (as in Open3D, any orthogonal_axis other than X and Y, e.g. an empty string, is the same as Z)
+    u, v, w = {"X": (1, 2, 0), "Y": (0, 2, 1)}.get(crop_volume.orthogonal_axis.upper(), (0, 1, 2))
+    polygon = np.asarray(crop_volume.bounding_polygon)
+    ui, vi = polygon[:, u], polygon[:, v]
+    uj, vj = np.roll(ui, -1), np.roll(vi, -1)  # NOTE edge k goes from vertex k to vertex k + 1
+    dv = np.where(vj != vi, vj - vi, 1.0)  # NOTE edges with vj == vi never cross a point
+
+    for i in range(0, len(points), chunk_size):
+        chunk = points[i : i + chunk_size]
+        pu, pv, pw = chunk[:, u], chunk[:, v], chunk[:, w]
+        is_inside = (pw >= crop_volume.axis_min) & (pw <= crop_volume.axis_max)
+        n_of_nodes = np.zeros(len(chunk), dtype=np.int32)
+        for k in range(len(polygon)):
+            crosses = ((vi[k] < pv) & (vj[k] >= pv)) | ((vj[k] < pv) & (vi[k] >= pv))
+            n_of_nodes += crosses & (ui[k] + (pv - vi[k]) / dv[k] * (uj[k] - ui[k]) < pu)
+        mask[i : i + chunk_size] = is_inside & (n_of_nodes % 2 == 1)
+    return mask
+
+
+def cropped_pcd(pcd, crop_volume, transformation=None, buffer=None, copy=True):
+    """Returns a new point cloud with the points of `pcd` (after being transformed by
+    `transformation`) that are inside of `crop_volume`, without deep-copying `pcd` (as only its
+    selected points are copied).
+
+    Note: `buffer` is an optional (n, 3) float64 array, which is reused to store the transformed
+    points, and if `copy` is False, then `pcd` itself is returned when it isn't transformed nor has
+    points cropped."""
+    points = np.asarray(pcd.points)  # NOTE this is a view of pcd's points, not a copy
+    if transformation is not None:
+        points = transform_points(points, transformation, out=buffer)
+
+    indices = None if crop_volume is None else np.flatnonzero(crop_mask(points, crop_volume))
+    if not copy and transformation is None and (indices is None or len(indices) == len(points)):
+        return pcd
+
+    def selected(array):
+        return array if indices is None else array[indices]
+
+    cropped = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(selected(points)))
+    if pcd.has_colors():
+        cropped.colors = o3d.utility.Vector3dVector(selected(np.asarray(pcd.colors)))
+    if pcd.has_normals():
+        normals = selected(np.asarray(pcd.normals))
+        if transformation is not None:
+            # NOTE normals are only rotated (i.e. like in `PointCloud.transform`)
+            normals = normals @ np.asarray(transformation, dtype=np.float64)[:3, :3].T
+        cropped.normals = o3d.utility.Vector3dVector(normals)
+    return cropped
+
+
+def point_cloud_from_arrays(points, normals=None):
+    """Returns a new point cloud with (copies of) `points` and, optionally, `normals`."""
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
+    if normals is not None:
+        pcd.normals = o3d.utility.Vector3dVector(normals)
+    return pcd
 
 
 def uniform_downsample(pcd, max_points):
@@ -130,33 +361,10 @@ def voxel_downsample(pcd, voxel_size=0.01):
     return pcd.voxel_down_sample(voxel_size)
 
 
-def uniform_registration(
-    source_pcd,
-    target_pcd,
-    source_align,
-    target_crop_volume,
-    threshold,
-    max_iteration,
-    max_size=None,
-    verbose=True,
-):
-    if max_size is not None:
-        max_points = max_size // 4
-    else:
-        max_size, max_points = int(16e6), int(4e6)
-
-    if verbose:
-        print("[Registration] max_size: %d, threshold: %f" % (max_size, threshold))
-        o3d.utility.set_verbosity_level(o3d.utility.VerbosityLevel.Debug)
-
-    # NOTE source_align takes source_pcd to the same coordinate system as target_pcd,
-    # hence why we use target_crop_volume for both (since it is in the target frame).
-    source_pcd = cropped_pcd(source_pcd, target_crop_volume, source_align)
-    target_pcd = cropped_pcd(target_pcd, target_crop_volume)
-
-    registration = o3d_registration.registration_icp(
-        source=uniform_downsample(source_pcd, max_points),
-        target=uniform_downsample(target_pcd, max_points),
+def icp_registration(source_pcd, target_pcd, threshold, max_iteration):
+    return o3d_registration.registration_icp(
+        source=source_pcd,
+        target=target_pcd,
         max_correspondence_distance=threshold,
         init=np.identity(4),
         estimation_method=o3d_registration.TransformationEstimationPointToPoint(with_scaling=True),
@@ -165,94 +373,578 @@ def uniform_registration(
         ),
     )
 
-    # NOTE compose the source_align with the registration alignment matrix.
-    return np.matmul(registration.transformation, source_align)
 
+class RegistrationPipeline:
+    """Coarse-to-fine refinement of a source to target alignment, with three stages of ICP (see
+    `stages`): on dTau and dTau / 2 voxel downsampled point clouds, and then on uniformly
+    downsampled ones. The target is cropped once and its downsampled "pyramid" levels are cached, so
+    that only the (transformed) source is recomputed in each stage, or for each source registered to
+    it.
+    """
 
-def voxel_registration(
-    source_pcd,
-    target_pcd,
-    source_align,
-    target_crop_volume,
-    threshold,
-    max_iteration,
-    voxel_size,
-    verbose=True,
+    def __init__(
+        self,
+        target_pcd,
+        target_crop_volume,
+        dtau_threshold,
+        max_iteration=20,
+        max_size=None,
+        verbose=True,
+        is_target_cropped=False,
+    ):
+        self.target_crop_volume = target_crop_volume
+        self.dtau_threshold = dtau_threshold
+        self.max_iteration = max_iteration
+        self.max_points = int(4e6) if max_size is None else max_size // 4
+        self.verbose = verbose
+
+        # NOTE the target is only copied if cropping removes any of its points, i.e. not when
+        # there's no crop volume, or when it's "cropped" by its own AABB (`use_target_aabb_to_crop`)
+        if is_target_cropped:
+            self._target_pcd = target_pcd
+        else:
+            self._target_pcd = cropped_pcd(target_pcd, target_crop_volume, copy=False)
+        self._target_levels = {}
+        self._has_new_levels = False  # NOTE i.e. whether `save` would write anything new
+
+        # NOTE arrays (e.g. views of shared memory) from which the target and its levels are only
+        # turned into point clouds when first used, instead of copied up front (see `from_arrays`)
+        self._target_points = None
+        self._level_arrays = {}
+
+    @property
+    def target_pcd(self):
+        if self._target_pcd is None:
+            self._target_pcd = point_cloud_from_arrays(self._target_points)
+        return self._target_pcd
+
+    def target_bounding_box(self):
+        """Returns the cropped target's AABB (without turning lazily loaded points into a cloud)."""
+        if self._target_pcd is None:
+            min_bound, max_bound = self._target_points.min(axis=0), self._target_points.max(axis=0)
+            return o3d.geometry.AxisAlignedBoundingBox(min_bound, max_bound)
+        return self._target_pcd.get_axis_aligned_bounding_box()
+
+    def stages(self):
+        """Returns the `(downsample, size, threshold)` parameters of each registration stage."""
+        return [
+            ("voxel", self.dtau_threshold, self.dtau_threshold * 80),
+            ("voxel", self.dtau_threshold / 2, self.dtau_threshold * 20),
+            ("uniform", self.max_points, self.dtau_threshold * 2),
+        ]
+
+    @staticmethod
+    def downsample(pcd, downsample, size):
+        if downsample == "voxel":
+            return voxel_downsample(pcd, size)
+        assert downsample == "uniform", downsample
+        return uniform_downsample(pcd, size)
+
+    def target_level(self, downsample, size):
+        """Returns the (cropped) target downsampled by `downsample` ("voxel" or "uniform") with
+        `size`, computing it only the first time it's requested.
+        """
+        key = (downsample, size)
+        if key not in self._target_levels:
+            if key in self._level_arrays:
+                self._target_levels[key] = point_cloud_from_arrays(*self._level_arrays[key])
+            else:
+                self._target_levels[key] = RegistrationPipeline.downsample(
+                    self.target_pcd, downsample, size
+                )
+                self._has_new_levels = True
+        return self._target_levels[key]
+
+    def evaluation_target(self, voxel_size):
+        """Returns the target level used by `evaluate_histogram` (i.e. with estimated normals)."""
+        target = self.target_level("voxel", voxel_size)
+        if not target.has_normals():
+            target.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamKNN(knn=20))
+            self._has_new_levels = True
+        return target
+
+    def arrays(self):
+        """Returns the cropped target and its (computed) levels as arrays (see `from_arrays`)."""
+        if self._target_pcd is None:
+            arrays = {"target_points": self._target_points}
+        else:
+            arrays = {"target_points": np.asarray(self._target_pcd.points)}
+
+        level_arrays = dict(self._level_arrays)  # NOTE i.e. lazily loaded levels (used or not)
+        for key, pcd in self._target_levels.items():
+            level_arrays[key] = (
+                np.asarray(pcd.points),
+                np.asarray(pcd.normals) if pcd.has_normals() else None,
+            )
+
+        levels = []
+        for i, ((downsample, size), (points, normals)) in enumerate(level_arrays.items()):
+            levels.append([downsample, size])
+            arrays[f"level_{i}_points"] = points
+            if normals is not None:
+                arrays[f"level_{i}_normals"] = normals
+        arrays["levels"] = np.array(json.dumps(levels))
+        return arrays
+
+    def save(self, npz_path):
+        """Writes the cropped target and its (computed) levels to `npz_path`, e.g. to a
+        `gt_cache_path`.
+        Returns False if nothing new had to be written.
+        """
+        if not self._has_new_levels and os.path.isfile(npz_path):
+            return False
+
+        os.makedirs(os.path.dirname(os.path.abspath(npz_path)), exist_ok=True)
+        temp_path = f"{npz_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, **self.arrays())
+        os.replace(temp_path, npz_path)  # NOTE so that partially written files are never read
+
+        self._has_new_levels = False
+        return True
+
+    @staticmethod
+    def from_arrays(
+        arrays,
+        target_crop_volume,
+        dtau_threshold,
+        max_iteration=20,
+        max_size=None,
+        verbose=True,
+        lazy=False,
+    ):
+        """Creates a `RegistrationPipeline` from the `arrays` of another one, e.g. from a loaded
+        .npz file or from views of shared memory. By default, they're copied (so they can be
+        released afterwards), but if `lazy` is True, then they're kept, and each point cloud is only
+        copied from them when it's first used (so the arrays must outlive the pipeline), e.g. the
+        (full) cropped target never is when every level it's downsampled to is in `arrays`.
+        """
+        array_names = list(arrays.keys())
+        level_arrays = {
+            (downsample, size): (
+                arrays[f"level_{i}_points"],
+                arrays[f"level_{i}_normals"] if f"level_{i}_normals" in array_names else None,
+            )
+            for i, (downsample, size) in enumerate(json.loads(str(arrays["levels"])))
+        }
+
+        if lazy:
+            pipeline = RegistrationPipeline(
+                None,
+                target_crop_volume,
+                dtau_threshold,
+                max_iteration,
+                max_size,
+                verbose,
+                is_target_cropped=True,
+            )
+            pipeline._target_points = arrays["target_points"]
+            pipeline._level_arrays = level_arrays
+            return pipeline
+
+        pipeline = RegistrationPipeline(
+            point_cloud_from_arrays(arrays["target_points"]),
+            target_crop_volume,
+            dtau_threshold,
+            max_iteration,
+            max_size,
+            verbose,
+            is_target_cropped=True,
+        )
+        for key, (points, normals) in level_arrays.items():
+            pipeline._target_levels[key] = point_cloud_from_arrays(points, normals)
+
+        return pipeline
+
+    @staticmethod
+    def load(
+        npz_path, target_crop_volume, dtau_threshold, max_iteration=20, max_size=None, verbose=True
+    ):
+        """Creates a `RegistrationPipeline` with the cropped target and levels written by `save`."""
+        with np.load(npz_path, allow_pickle=False) as npz:
+            return RegistrationPipeline.from_arrays(
+                npz, target_crop_volume, dtau_threshold, max_iteration, max_size, verbose
+            )
+
+    def precompute_levels(self, skip_refinement=False):
+        """Computes every target level used by `evaluate_reconstruction` (e.g. to share them)."""
+        if not skip_refinement:
+            for downsample, size, _ in self.stages():
+                self.target_level(downsample, size)
+        self.evaluation_target(self.dtau_threshold / 2)
+
+    def register(self, source_pcd, source_align):
+        """Refines `source_align` (which takes `source_pcd` to the target's coordinate system)."""
+        # NOTE the transformed source points are written to the same buffer in every stage
+        buffer = np.empty((len(source_pcd.points), 3), dtype=np.float64)
+        for downsample, size, threshold in self.stages():
+            if self.verbose:
+                print("[Registration] %s: %s, threshold: %f" % (downsample, size, threshold))
+                o3d.utility.set_verbosity_level(o3d.utility.VerbosityLevel.Debug)
+
+            with profile_stage("icp (%s: %s)" % (downsample, size)):
+                # NOTE only the source is cropped (after being transformed) in each stage
+                source = cropped_pcd(source_pcd, self.target_crop_volume, source_align, buffer)
+
+                registration = icp_registration(
+                    RegistrationPipeline.downsample(source, downsample, size),
+                    self.target_level(downsample, size),
+                    threshold,
+                    self.max_iteration,
+                )
+
+            # NOTE compose the source_align with the registration alignment matrix.
+            source_align = np.matmul(registration.transformation, source_align)
+
+        return source_align
+
+
+# ----------------------------------------------------------------------------
+
+
+# NOTE bump this whenever `RegistrationPipeline.save` (or how the target is preprocessed) changes
+GT_CACHE_VERSION = 1
+
+_file_hashes = {}  # NOTE memoizes `file_hash`, since ground-truth files can be quite large
+
+
+def file_hash(path, chunk_size=1 << 24):
+    """Returns the SHA-1 hex digest of the contents of the file at `path`."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_hashes:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha1.update(chunk)
+        _file_hashes[memo_key] = sha1.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def gt_cache_path(
+    gt_cache_dir,
+    target_ply_path,
+    target_crop_json_path,
+    use_target_aabb_to_crop,
+    dtau_threshold,
+    max_size=None,
+    target_transform_key=None,
 ):
-    if verbose:
-        print("[Registration] voxel_size: %d, threshold: %f" % (voxel_size, threshold))
-        o3d.utility.set_verbosity_level(o3d.utility.VerbosityLevel.Debug)
-
-    # NOTE source_align takes source_pcd to the same coordinate system as target_pcd,
-    # hence why we use target_crop_volume for both (since it is in the target frame).
-    source_pcd = cropped_pcd(source_pcd, target_crop_volume, source_align)
-    target_pcd = cropped_pcd(target_pcd, target_crop_volume)
-
-    registration = o3d_registration.registration_icp(
-        source=voxel_downsample(source_pcd, voxel_size),
-        target=voxel_downsample(target_pcd, voxel_size),
-        max_correspondence_distance=threshold,
-        init=np.identity(4),
-        estimation_method=o3d_registration.TransformationEstimationPointToPoint(with_scaling=True),
-        criteria=o3d_registration.ICPConvergenceCriteria(
-            relative_fitness=1e-6, relative_rmse=1e-6, max_iteration=max_iteration
-        ),
+    """Returns the path of the (`RegistrationPipeline.save`) file that caches the preprocessed
+    ground-truth, which is keyed by the contents of `target_ply_path` and `target_crop_json_path`,
+    and by `dtau_threshold`.
+
+    Note: `target_transform_key` should identify the `ply_transform_fn` applied to the target.
+    """
+    if target_crop_json_path is not None:
+        crop = file_hash(target_crop_json_path)
+    else:
+        crop = "aabb" if use_target_aabb_to_crop else None
+
+    key = json.dumps(
+        {
+            "target": file_hash(target_ply_path),
+            "crop": crop,
+            "dtau_threshold": dtau_threshold,
+            "max_size": max_size,
+            "target_transform": target_transform_key,
+            "version": GT_CACHE_VERSION,
+        },
+        sort_keys=True,
+    )
+    name = os.path.splitext(os.path.basename(target_ply_path))[0]
+    return os.path.join(
+        gt_cache_dir, "%s.%s.npz" % (name, hashlib.sha1(key.encode()).hexdigest()[:16])
     )
 
-    # NOTE compose the source_align with the registration alignment matrix.
-    return np.matmul(registration.transformation, source_align)
+
+# NOTE bump this whenever `save_result` (or how the distances are computed) changes
+RESULT_CACHE_VERSION = 1
+
+
+def result_cache_path(
+    result_cache_dir,
+    scene_name,
+    source_ply_path,
+    target_ply_path,
+    target_crop_json_path,
+    use_target_aabb_to_crop,
+    dtau_threshold,
+    alignment_paths=(),
+    skip_refinement=False,
+    max_iteration=20,
+    target_transform_key=None,
+    distance_backend=None,
+):
+    """Returns the path of the (`save_result`) file that caches an evaluation, which is keyed by the
+    contents of every input file (i.e. the .ply files, the crop .json, and the `alignment_paths`,
+    which can be None), and by the parameters that change its alignment or distances (NOTE so it
+    doesn't depend on plot_stretch).
+    """
+    if target_crop_json_path is not None:
+        crop = file_hash(target_crop_json_path)
+    else:
+        crop = "aabb" if use_target_aabb_to_crop else None
+
+    key = json.dumps(
+        {
+            "source": file_hash(source_ply_path),
+            "target": file_hash(target_ply_path),
+            "crop": crop,
+            "alignment": [None if path is None else file_hash(path) for path in alignment_paths],
+            "dtau_threshold": dtau_threshold,
+            "skip_refinement": skip_refinement,
+            "max_iteration": max_iteration,
+            "target_transform": target_transform_key,
+            "distance_backend": distance_backend or "open3d",
+            "version": RESULT_CACHE_VERSION,
+        },
+        sort_keys=True,
+    )
+    return os.path.join(
+        result_cache_dir, "%s.%s.npz" % (scene_name, hashlib.sha1(key.encode()).hexdigest()[:16])
+    )
+
+
+def save_result(
+    npz_path, source_align, s, t, distance_from_s_to_t, distance_from_t_to_s, cutoff, result
+):
+    """Writes the final alignment, the evaluated (i.e. cropped and downsampled) point clouds, their
+    distances (which are clamped to `cutoff`) and metrics to a compressed `npz_path`, e.g. to a
+    `result_cache_path`.
+    """
+    arrays = {
+        "source_align": np.asarray(source_align),
+        "distance_from_s_to_t": np.asarray(distance_from_s_to_t),
+        "distance_from_t_to_s": np.asarray(distance_from_t_to_s),
+        "cutoff": np.array(cutoff),
+        "metrics": np.array(result[:3]),  # NOTE i.e. [precision, recall, fscore]
+    }
+    for name, pcd in [("s", s), ("t", t)]:
+        arrays[f"{name}_points"] = np.asarray(pcd.points)
+        if pcd.has_normals():
+            arrays[f"{name}_normals"] = np.asarray(pcd.normals)
+
+    os.makedirs(os.path.dirname(os.path.abspath(npz_path)), exist_ok=True)
+    temp_path = f"{npz_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temp_path, npz_path)  # NOTE so that partially written files are never read
+
+
+def load_result(npz_path, cutoff):
+    """Returns the arrays (and point clouds "s" and "t") written by `save_result`, or None if
+    there's no such file, or if its distances were clamped to less than `cutoff` (i.e. can't be
+    reused).
+    """
+    if not os.path.isfile(npz_path):
+        return None
+
+    def point_cloud(npz, name):
+        pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(npz[f"{name}_points"]))
+        if f"{name}_normals" in npz.files:
+            pcd.normals = o3d.utility.Vector3dVector(npz[f"{name}_normals"])
+        return pcd
+
+    with np.load(npz_path, allow_pickle=False) as npz:
+        if float(npz["cutoff"]) < cutoff:
+            return None
+        cached = {name: npz[name] for name in npz.files if not name.startswith(("s_", "t_"))}
+        cached["s"], cached["t"] = point_cloud(npz, "s"), point_cloud(npz, "t")
+    return cached
 
 
 # ----------------------------------------------------------------------------
 
 
+def umeyama_alignment(source_points, target_points, with_scaling=True, weights=None):
+    """Returns the 4x4 similarity transformation (i.e. scaled rotation and translation) that
+    minimizes the (weighted) squared distances from `source_points` to `target_points`, in closed
+    form, i.e. Umeyama's method (ref.: https://doi.org/10.1109/34.88573). It's batched over leading
+    dimensions, e.g. for `(k, n, 3)` point arrays, `k` transformations are returned.
+    """
+    source_points = np.asarray(source_points, dtype=np.float64)
+    target_points = np.asarray(target_points, dtype=np.float64)
+    assert source_points.shape == target_points.shape and source_points.shape[-1] == 3
+    if weights is None:
+        weights = np.ones(source_points.shape[:-1])
+    weights = weights / np.sum(weights, axis=-1, keepdims=True)
+
+    source_mean = np.einsum("...n,...ni->...i", weights, source_points)
+    target_mean = np.einsum("...n,...ni->...i", weights, target_points)
+    source_centered = source_points - source_mean[..., None, :]
+    target_centered = target_points - target_mean[..., None, :]
+
+    covariance = np.einsum("...n,...ni,...nj->...ij", weights, target_centered, source_centered)
+    U, D, Vt = np.linalg.svd(covariance)
+    # NOTE flip the last singular vector if needed, so that R is a rotation (and not a reflection)
+    S = np.ones(D.shape)
+    S[..., 2] = np.sign(np.linalg.det(U) * np.linalg.det(Vt))
+    S[..., 2][S[..., 2] == 0] = 1
+    R = np.einsum("...ij,...j,...jk->...ik", U, S, Vt)
+
+    if with_scaling:
+        source_variance = np.einsum(
+            "...n,...ni,...ni->...", weights, source_centered, source_centered
+        )
+        # NOTE degenerate source points (i.e. all in the same position) keep their scale
+        is_degenerate = source_variance <= 0
+        scale = np.where(
+            is_degenerate, 1, np.sum(D * S, axis=-1) / np.where(is_degenerate, 1, source_variance)
+        )
+    else:
+        scale = np.ones(D.shape[:-1])
+
+    transformation = np.zeros(source_points.shape[:-2] + (4, 4))
+    transformation[..., :3, :3] = scale[..., None, None] * R
+    transformation[..., :3, 3] = target_mean - np.einsum(
+        "...ij,...j->...i", transformation[..., :3, :3], source_mean
+    )
+    transformation[..., 3, 3] = 1
+    return transformation
+
+
 def trajectory_alignment(
     source_traj,
     target_traj,
     target_align,
-    randomvar=0,
     max_correspondence_distance=0.2,
     ransac_n=6,
+    ransac_iterations=100,
+    irls_iterations=10,
+    seed=0,
 ):
-    assert len(source_traj.camera_poses) <= 1600
+    """Returns the similarity transformation that aligns the camera positions of `source_traj` to
+    the ones of `target_traj` (after being transformed by `target_align`), whose poses correspond to
+    each other (i.e. i <-> i).
+
+    A (small) RANSAC loop, seeded by `seed`, finds the `ransac_n` cameras whose Umeyama alignment
+    has the most inliers (i.e. cameras closer than `max_correspondence_distance`), and then
+    Umeyama's method is re-run with all of its inliers, weighted by `irls_iterations` of iteratively
+    reweighted least squares (with Cauchy weights), so that outlier cameras have (close to) no
+    influence. With `ransac_iterations=0`, all cameras are used.
+    """
     assert len(source_traj.camera_poses) == len(target_traj.camera_poses)
     camera_poses_len = len(source_traj.camera_poses)
+    assert camera_poses_len >= 3, camera_poses_len
+
+    # NOTE these are the same points as in `Trajectory.point_cloud`
+    source_points = source_traj.camera_positions()
+    target_points = target_traj.camera_positions()
+    target_points = target_points @ target_align[:3, :3].T + target_align[:3, 3]  # XXX
+
+    def residuals(transformation):
+        transformed = (
+            source_points @ transformation[..., :3, :3].swapaxes(-1, -2)
+            + transformation[..., None, :3, 3]
+        )
+        return np.linalg.norm(transformed - target_points, axis=-1)
+
+    is_inlier = np.ones(camera_poses_len, dtype=bool)
+    if ransac_iterations > 0 and camera_poses_len > ransac_n:
+        rng = np.random.default_rng(seed)
+        samples = np.argsort(rng.random((ransac_iterations, camera_poses_len)), axis=1)[
+            :, :ransac_n
+        ]
+        hypotheses = umeyama_alignment(source_points[samples], target_points[samples])
+
+        # NOTE hypotheses are scored in batches, so that at most ~4M residuals are computed at once
+        best_score = (-1, 0.0)
+        batch_size = max(1, (1 << 22) // camera_poses_len)
+        for i in range(0, ransac_iterations, batch_size):
+            batch_residuals = residuals(hypotheses[i : i + batch_size])
+            batch_is_inlier = batch_residuals < max_correspondence_distance
+            for j, hypothesis_is_inlier in enumerate(batch_is_inlier):
+                n_of_inliers = int(np.count_nonzero(hypothesis_is_inlier))
+                # NOTE ties are broken by the (smaller) sum of the inliers' residuals
+                score = (n_of_inliers, -float(np.sum(batch_residuals[j][hypothesis_is_inlier])))
+                if score > best_score:
+                    best_score, is_inlier = score, hypothesis_is_inlier
+        if best_score[0] < 3:
+            # NOTE no consensus, so use every camera
+            is_inlier = np.ones(camera_poses_len, dtype=bool)
+
+    weights = is_inlier.astype(np.float64)
+    transformation = umeyama_alignment(source_points, target_points, weights=weights)
+    for _ in range(irls_iterations):
+        # NOTE Cauchy weights, with max_correspondence_distance as the scale of the residuals
+        cauchy_weights = is_inlier / (
+            1 + (residuals(transformation) / max_correspondence_distance) ** 2
+        )
+        transformation = umeyama_alignment(source_points, target_points, weights=cauchy_weights)
+
+    # NOTE this transformation takes source_traj to the same reference
+    # frame as target_traj after being transformed by target_align XXX.
+    return transformation
 
-    source_traj_pcd = source_traj.point_cloud()  # NOTE trajectory to register
-    target_traj_pcd = target_traj.point_cloud().transform(target_align)  # XXX
-    assert camera_poses_len == len(source_traj_pcd.points) == len(target_traj.points)
 
-    rand_number_added = np.asanyarray(source_traj_pcd.points)
-    rand_number_added *= np.random.rand(camera_poses_len, 3) * randomvar - randomvar / 2 + 1
-    source_traj_pcd_rand = o3d.geometry.PointCloud()
-    source_traj_pcd_rand.points.extend(list(rand_number_added))
+# ----------------------------------------------------------------------------
+
+
+DISTANCE_BACKENDS = ["open3d", "voxel_hash"]
+
+
+def nearest_neighbor_distances(
+    s, t, backend=None, cutoff=None, if_verbose_print=lambda *args, **kwargs: None
+):
+    """Returns the distances from each point of `s` to its nearest point in `t` (and vice versa):
+    - "open3d" (default): `compute_point_cloud_distance` (i.e. a KD-tree), one direction at a time,
+    - "voxel_hash": `point_cloud_distances.bidirectional_voxel_hash_distances` (i.e. multithreaded,
+      with both directions computed concurrently), clamped to `cutoff`.
+
+    Note: for out-of-core distances between .ply files, use point_cloud_distances.py's CLI instead.
+    """
+    if backend is None or backend == "open3d":
+        if_verbose_print("[compute_point_cloud_to_point_cloud_distance]")
+        distance_from_s_to_t = np.asarray(s.compute_point_cloud_distance(t), dtype=np.float64)
+        if_verbose_print("[compute_point_cloud_to_point_cloud_distance]")
+        distance_from_t_to_s = np.asarray(t.compute_point_cloud_distance(s), dtype=np.float64)
+        return distance_from_s_to_t, distance_from_t_to_s
+
+    import point_cloud_distances  # NOTE it's next to this file (in misc/tools/)
 
-    # Rough registration based on aligned structure from motion data
-    corresponding_points = o3d.utility.Vector2iVector(
-        np.asarray([[index, index] for index in range(camera_poses_len)])
+    if_verbose_print("[%s distances] cutoff: %f" % (backend, cutoff))
+    s_points, t_points = np.asarray(s.points), np.asarray(t.points)
+    if backend == "voxel_hash":
+        return point_cloud_distances.bidirectional_voxel_hash_distances(s_points, t_points, cutoff)
+    raise ValueError(
+        "invalid distance backend '%s' (expected one of %s)" % (backend, DISTANCE_BACKENDS)
     )
 
-    # NOTE there's no random seed we can set for Open3D, so this might no be reproducible
-    rr = o3d_registration.RANSACConvergenceCriteria()
-    rr.max_iteration = 100000
-    try:
-        rr.max_validation = 100000
-    except AttributeError:
-        rr.confidence = 0.999
-
-    registration = o3d_registration.registration_ransac_based_on_correspondence(
-        source=source_traj_pcd_rand,
-        target=target_traj_pcd,
-        corres=corresponding_points,
-        max_correspondence_distance=max_correspondence_distance,
-        estimation_method=o3d_registration.TransformationEstimationPointToPoint(with_scaling=True),
-        ransac_n=ransac_n,
-        criteria=rr,
+
+def sorted_distances(distances):
+    """Returns `distances` (e.g. an Open3D `DoubleVector`) as a sorted float64 array."""
+    return np.sort(np.asarray(distances, dtype=np.float64))
+
+
+def precision_recall_fscore(sorted_distance_from_s_to_t, sorted_distance_from_t_to_s, thresholds):
+    """Returns the precision, recall and F-score for each of the distance `thresholds` (i.e. the
+    fraction of distances which are less than it), with one binary search per threshold."""
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    precision = np.searchsorted(sorted_distance_from_s_to_t, thresholds, side="left") / len(
+        sorted_distance_from_s_to_t
     )
+    recall = np.searchsorted(sorted_distance_from_t_to_s, thresholds, side="left") / len(
+        sorted_distance_from_t_to_s
+    )
+    # NOTE the F-score is 0 (instead of NaN) when both precision and recall are 0
+    with np.errstate(invalid="ignore"):
+        fscore = np.where(
+            precision + recall > 0, 2 * recall * precision / (recall + precision), 0.0
+        )
+    return precision, recall, fscore
 
-    # NOTE this transformation takes source_traj to the same reference
-    # frame as target_traj after being transformed by target_align XXX.
-    return registration.transformation
+
+def cumulative_histogram(sorted_distances, bins):
+    """Returns `np.cumsum(np.histogram(distances, bins)[0]) / len(distances)`, but from the sorted
+    distances, i.e. without rescanning them for each histogram (NOTE the last bin is closed)."""
+    counts = np.concatenate(
+        [
+            np.searchsorted(sorted_distances, bins[:-1], side="left"),
+            np.searchsorted(sorted_distances, bins[-1:], side="right"),
+        ]
+    )
+    return (counts[1:] - counts[0]).astype(float) / len(sorted_distances)
 
 
 # ----------------------------------------------------------------------------
@@ -260,6 +952,7 @@ def trajectory_alignment(
 
 class TanksAndTemplesEvaluator:
     @staticmethod
+    @profile_stage("plot")
     def plot_graph(
         scene_name,
         fscore,
@@ -331,6 +1024,16 @@ class TanksAndTemplesEvaluator:
         threshold,
         plot_stretch,
         verbose,
+        # Cropped and downsampled target (with `voxel_size`), e.g. from
+        # `RegistrationPipeline.evaluation_target`
+        target_eval_pcd=None,
+        # Distance thresholds of the F-score curve saved to .prf_curve.txt (default: bin edges)
+        curve_thresholds=None,
+        # Backend used to compute nearest neighbor distances (`DISTANCE_BACKENDS`, default: Open3D)
+        distance_backend=None,
+        # File in which the alignment, point clouds and distances are saved, e.g. from
+        # `result_cache_path`
+        result_cache_path=None,
     ):
         if verbose:
             print("[EvaluateHisto]")
@@ -342,8 +1045,10 @@ class TanksAndTemplesEvaluator:
         scene_file_base = os.path.join(output_folder, scene_name)
         if_verbose_print(scene_file_base + ".precision.ply")
 
-        s = copy.deepcopy(source_pcd).transform(source_align)
-        t = copy.deepcopy(target_pcd)
+        # NOTE `cropped_pcd` returns new point clouds, so neither source_pcd nor target_pcd are
+        # copied (the whole transformed source is only needed for drawing it, i.e. if verbose)
+        s = cropped_pcd(source_pcd, None, source_align) if verbose else None
+        t = target_pcd
 
         if verbose:
             if target_crop_volume is not None:
@@ -363,22 +1068,83 @@ class TanksAndTemplesEvaluator:
             else:
                 o3d.visualization.draw_geometries([s, t])
 
-        if target_crop_volume is not None:
-            s = cropped_pcd(s, target_crop_volume)
-            t = cropped_pcd(t, target_crop_volume)
-        s = s.voxel_down_sample(voxel_size)
-        t = t.voxel_down_sample(voxel_size)
-        s.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamKNN(knn=20))
-        t.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamKNN(knn=20))
+        with profile_stage("crop_and_downsample"):
+            if s is None:
+                s = cropped_pcd(source_pcd, target_crop_volume, source_align)
+            elif target_crop_volume is not None:
+                s = cropped_pcd(s, target_crop_volume)
+            s = s.voxel_down_sample(voxel_size)
+            s.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamKNN(knn=20))
 
-        if_verbose_print("[compute_point_cloud_to_point_cloud_distance]")
-        distance_from_s_to_t = s.compute_point_cloud_distance(t)
+            if target_eval_pcd is not None:
+                t = target_eval_pcd
+            else:
+                if target_crop_volume is not None:
+                    t = cropped_pcd(t, target_crop_volume)
+                t = t.voxel_down_sample(voxel_size)
+                t.estimate_normals(search_param=o3d.geometry.KDTreeSearchParamKNN(knn=20))
+
+        # NOTE distances at (or beyond) the cutoff are only used as "far away" values, by both the
+        # histograms (which end at plot_stretch * threshold) and the colors (at 3 * threshold)
+        cutoff = max(plot_stretch, 3) * threshold
+        with profile_stage("distances"):
+            distance_from_s_to_t, distance_from_t_to_s = nearest_neighbor_distances(
+                s, t, distance_backend, cutoff, if_verbose_print
+            )
         assert len(distance_from_s_to_t), distance_from_s_to_t
-
-        if_verbose_print("[compute_point_cloud_to_point_cloud_distance]")
-        distance_from_t_to_s = t.compute_point_cloud_distance(s)
         assert len(distance_from_t_to_s), distance_from_t_to_s
 
+        result = TanksAndTemplesEvaluator.evaluate_distances(
+            scene_name,
+            output_folder,
+            s,
+            t,
+            distance_from_s_to_t,
+            distance_from_t_to_s,
+            threshold,
+            plot_stretch,
+            verbose,
+            curve_thresholds,
+        )
+
+        if result_cache_path is not None:
+            # NOTE Open3D's distances aren't clamped, so they can be reused with any plot_stretch
+            is_clamped = distance_backend not in [None, "open3d"]
+            with profile_stage("save_result_cache"):
+                save_result(
+                    result_cache_path,
+                    source_align,
+                    s,
+                    t,
+                    distance_from_s_to_t,
+                    distance_from_t_to_s,
+                    cutoff if is_clamped else np.inf,
+                    result,
+                )
+            if_verbose_print("[ResultCache] saved '%s'" % result_cache_path)
+
+        return result
+
+    @staticmethod
+    def evaluate_distances(
+        scene_name,
+        output_folder,
+        s,
+        t,
+        distance_from_s_to_t,
+        distance_from_t_to_s,
+        threshold,
+        plot_stretch,
+        verbose,
+        # Distance thresholds of the F-score curve saved to .prf_curve.txt (default: bin edges)
+        curve_thresholds=None,
+    ):
+        """Writes the colorized point clouds, histograms and P/R/F1 files of the evaluation (i.e.
+        everything after the distances are computed), and returns the same as `evaluate_histogram`.
+        """
+        if_verbose_print = print if verbose else lambda *args, **kwargs: None
+        scene_file_base = os.path.join(output_folder, scene_name)
+
         # Write the distances to bin files
         # np.array(distance_from_s_to_t).astype("float64").tofile(scene_file_base + ".precision.bin")
         # np.array(distance_from_t_to_s).astype("float64").tofile(scene_file_base + ".recall.bin")
@@ -392,43 +1158,66 @@ class TanksAndTemplesEvaluator:
 
         def write_color_distances(path, pcd, distances, max_distance):
             cmap = plt.get_cmap("hot_r")
-            colors = cmap(np.minimum(np.array(distances), max_distance) / max_distance)[:, :3]
-            pcd.colors = o3d.utility.Vector3dVector(colors)
-            o3d.io.write_point_cloud(path, pcd)
+            colors = cmap(np.minimum(distances, max_distance) / max_distance)[:, :3]
+            # NOTE a copy is colorized, since pcd can be shared
+            # (e.g. `RegistrationPipeline.evaluation_target`)
+            colored_pcd = o3d.geometry.PointCloud(
+                o3d.utility.Vector3dVector(np.asarray(pcd.points))
+            )
+            if pcd.has_normals():
+                colored_pcd.normals = o3d.utility.Vector3dVector(np.asarray(pcd.normals))
+            colored_pcd.colors = o3d.utility.Vector3dVector(colors)
+            o3d.io.write_point_cloud(path, colored_pcd)
 
         if_verbose_print("[ViewDistances] Add color coding to visualize error")
-        write_color_distances(source_n_fn, s, distance_from_s_to_t, 3 * threshold)
+        with profile_stage("write_colorized_ply (precision)"):
+            write_color_distances(source_n_fn, s, distance_from_s_to_t, 3 * threshold)
 
         if_verbose_print("[ViewDistances] Add color coding to visualize error")
-        write_color_distances(target_n_fn, t, distance_from_t_to_s, 3 * threshold)
+        with profile_stage("write_colorized_ply (recall)"):
+            write_color_distances(target_n_fn, t, distance_from_t_to_s, 3 * threshold)
 
         # Get F-score and histogram
         if_verbose_print("[get_f1_score_histo2]")
 
-        # The precision quantifies the accuracy of the reconstruction: how closely the reconstructed points lie to the ground truth.
-        # Precision alone can be maximized by producing a very sparse set of precisely localized landmarks.
-        precision = sum(d < threshold for d in distance_from_s_to_t) / len(distance_from_s_to_t)
-
-        # The recall quantifies the reconstruction's completeness: to what extent all the ground-truth points are covered.
-        # Recall alone can be maximized by densely covering the space with points.
-        recall = sum(d < threshold for d in distance_from_t_to_s) / len(distance_from_t_to_s)
-
-        # Either of these schemes will drive the other measure and the F-score to 0.
-        # A high F-score for a stringent distance threshold can only be achieved by a reconstruction that is both accurate and complete.
-        fscore = 2 * recall * precision / (recall + precision)
-
-        bins = np.arange(0, threshold * plot_stretch, threshold / 100)
-        hist_source, edges_source = np.histogram(distance_from_s_to_t, bins)
-        cum_source = np.cumsum(hist_source).astype(float) / len(distance_from_s_to_t)
-        hist_target, edges_target = np.histogram(distance_from_t_to_s, bins)
-        cum_target = np.cumsum(hist_target).astype(float) / len(distance_from_t_to_s)
-
-        np.savetxt(scene_file_base + ".recall.txt", cum_target)
-        np.savetxt(scene_file_base + ".precision.txt", cum_source)
-        np.savetxt(
-            scene_file_base + ".prf_tau_plotstr.txt",
-            np.array([precision, recall, fscore, threshold, plot_stretch]),
-        )
+        # NOTE distances are sorted once, so that the precision and recall for any threshold (as
+        # well as the cumulative histograms) are computed with binary searches, not full scans
+        with profile_stage("metrics"):
+            sorted_distance_from_s_to_t = sorted_distances(distance_from_s_to_t)
+            sorted_distance_from_t_to_s = sorted_distances(distance_from_t_to_s)
+
+            # The precision quantifies the accuracy of the reconstruction: how closely the reconstructed points lie to the ground truth.
+            # Precision alone can be maximized by producing a very sparse set of precisely localized landmarks.
+            # The recall quantifies the reconstruction's completeness: to what extent all the ground-truth points are covered.
+            # Recall alone can be maximized by densely covering the space with points.
+            # Either of these schemes will drive the other measure and the F-score to 0.
+            # A high F-score for a stringent distance threshold can only be achieved by a reconstruction that is both accurate and complete.
+            [precision], [recall], [fscore] = precision_recall_fscore(
+                sorted_distance_from_s_to_t, sorted_distance_from_t_to_s, [threshold]
+            )
+
+            bins = np.arange(0, threshold * plot_stretch, threshold / 100)
+            edges_source = edges_target = bins
+            cum_source = cumulative_histogram(sorted_distance_from_s_to_t, bins)
+            cum_target = cumulative_histogram(sorted_distance_from_t_to_s, bins)
+
+            if curve_thresholds is None:
+                curve_thresholds = bins[1:]
+            curve_precision, curve_recall, curve_fscore = precision_recall_fscore(
+                sorted_distance_from_s_to_t, sorted_distance_from_t_to_s, curve_thresholds
+            )
+
+            np.savetxt(scene_file_base + ".recall.txt", cum_target)
+            np.savetxt(scene_file_base + ".precision.txt", cum_source)
+            np.savetxt(
+                scene_file_base + ".prf_tau_plotstr.txt",
+                np.array([precision, recall, fscore, threshold, plot_stretch]),
+            )
+            np.savetxt(
+                scene_file_base + ".prf_curve.txt",
+                np.column_stack([curve_thresholds, curve_precision, curve_recall, curve_fscore]),
+                header="tau precision recall fscore",
+            )
 
         return [
             precision,
@@ -470,13 +1259,101 @@ class TanksAndTemplesEvaluator:
         # Function that can be applied to the source and target point clouds after they're parsed
         # with Open3D. Must have parameters ply_pcd: o3d.geometry.PointCloud, is_source_ply: bool
         ply_transform_fn=None,
+        # Folder in which the preprocessed (i.e. cropped and downsampled) target is cached, so that
+        # evaluating many reconstructions of the same scene only pays for preprocessing it once.
+        gt_cache_dir=None,
+        # Identifies what ply_transform_fn does to the target (required to cache it, if not None).
+        target_transform_key=None,
+        # Preprocessed target (e.g. shared by a batch of evaluations), so that target_ply_path isn't
+        # read (unless verbose is True), nor the gt_cache_dir used. It must match
+        # target_crop_json_path and dtau_threshold, as in the cache.
+        registration_pipeline=None,
+        # Backend used to compute nearest neighbor distances (`DISTANCE_BACKENDS`, default: Open3D).
+        distance_backend=None,
+        # Folder in which the evaluation results (i.e. the final alignment, and the distances) are
+        # cached, keyed by the contents of every input file and the parameters which change them
+        # (see `result_cache_path`), so that re-running an evaluation (e.g. with another
+        # plot_stretch) skips registration and distances.
+        result_cache_dir=None,
+        # If True (or if the PROFILE_ENV environment variable is set), the wall time, CPU time and
+        # peak RSS of each stage are written to "{scene_name}.profile.json" (including `plot_graph`,
+        # if it's called after this).
+        profile=False,
     ):
-        source_pcd = o3d.io.read_point_cloud(source_ply_path)
-        target_pcd = o3d.io.read_point_cloud(target_ply_path)
+        StageProfiler.start(
+            os.path.join(output_folder, scene_name + ".profile.json")
+            if profile or is_profiling_enabled()
+            else None
+        )
 
-        if ply_transform_fn is not None:
-            ply_transform_fn(ply_pcd=source_pcd, is_source_ply=True)
-            ply_transform_fn(ply_pcd=target_pcd, is_source_ply=False)
+        result_path = None
+        if result_cache_dir is not None:
+            if ply_transform_fn is not None and target_transform_key is None:
+                print("[ResultCache] disabled (ply_transform_fn requires a target_transform_key)")
+            else:
+                result_path = result_cache_path(
+                    result_cache_dir,
+                    scene_name,
+                    source_ply_path,
+                    target_ply_path,
+                    target_crop_json_path,
+                    use_target_aabb_to_crop,
+                    dtau_threshold,
+                    alignment_paths=[
+                        target_log_to_ply_align_txt_path,
+                        source_log_path,
+                        target_log_path,
+                        source_ply_to_ply_align_txt_path,
+                    ],
+                    skip_refinement=skip_refinement,
+                    max_iteration=max_iteration,
+                    target_transform_key=target_transform_key,
+                    distance_backend=distance_backend,
+                )
+                with profile_stage("load_result_cache"):
+                    cached = load_result(result_path, cutoff=max(plot_stretch, 3) * dtau_threshold)
+                if cached is not None:
+                    print("[ResultCache] loading '%s'" % result_path)
+                    return TanksAndTemplesEvaluator.evaluate_distances(
+                        scene_name,
+                        output_folder,
+                        cached["s"],
+                        cached["t"],
+                        cached["distance_from_s_to_t"],
+                        cached["distance_from_t_to_s"],
+                        threshold=dtau_threshold,
+                        plot_stretch=plot_stretch,
+                        verbose=verbose,
+                    )
+
+        with profile_stage("read_source_ply"):
+            source_pcd = o3d.io.read_point_cloud(source_ply_path)
+            if ply_transform_fn is not None:
+                ply_transform_fn(ply_pcd=source_pcd, is_source_ply=True)
+
+        # NOTE the cache isn't used if the preprocessed target is given (i.e. it's up to the caller)
+        cache_path = None
+        if gt_cache_dir is not None and registration_pipeline is None:
+            if ply_transform_fn is not None and target_transform_key is None:
+                print("[GroundTruthCache] disabled (ply_transform_fn needs a target_transform_key)")
+            else:
+                cache_path = gt_cache_path(
+                    gt_cache_dir,
+                    target_ply_path,
+                    target_crop_json_path,
+                    use_target_aabb_to_crop,
+                    dtau_threshold,
+                    target_transform_key=target_transform_key,
+                )
+        is_gt_cached = cache_path is not None and os.path.isfile(cache_path)
+
+        # NOTE the (full) target is only needed if it isn't cached (or given), or to visualize it
+        target_pcd = None
+        if (registration_pipeline is None and not is_gt_cached) or verbose:
+            with profile_stage("read_target_ply"):
+                target_pcd = o3d.io.read_point_cloud(target_ply_path)
+                if ply_transform_fn is not None:
+                    ply_transform_fn(ply_pcd=target_pcd, is_source_ply=False)
 
         if target_log_to_ply_align_txt_path is not None:
             assert source_log_path is not None  # "source" (the same as in `source_ply_path`)
@@ -487,9 +1364,10 @@ class TanksAndTemplesEvaluator:
 
             # Compute a rough pre-alignment using the camera positions from .log trajectories,
             # since source_traj and source_pcd are assumed to have the same coordinate system.
-            source_pcd_to_target_pcd_align = trajectory_alignment(
-                source_traj, target_traj, target_traj_to_target_pcd_align
-            )
+            with profile_stage("trajectory_alignment"):
+                source_pcd_to_target_pcd_align = trajectory_alignment(
+                    source_traj, target_traj, target_traj_to_target_pcd_align
+                )
 
             source_align_0 = source_pcd_to_target_pcd_align
         else:
@@ -505,49 +1383,52 @@ class TanksAndTemplesEvaluator:
         if target_crop_json_path is not None:
             target_crop_volume = o3d.visualization.read_selection_polygon_volume(target_crop_json_path)
             assert np.asarray(target_crop_volume.bounding_polygon).shape == (4, 3)
-        elif use_target_aabb_to_crop:
-            target_crop_volume = target_pcd.get_axis_aligned_bounding_box()
         else:
             target_crop_volume = None
 
-        if not skip_refinement:
-            # Refine registration in three iterations.
-            source_align_1 = voxel_registration(
-                source_pcd,
-                target_pcd,
-                source_align_0,
-                target_crop_volume,
-                max_iteration=max_iteration,
-                threshold=(dtau_threshold * 80),
-                voxel_size=dtau_threshold,
-                verbose=verbose,
-            )
-            source_align_2 = voxel_registration(
-                source_pcd,
-                target_pcd,
-                source_align_1,
-                target_crop_volume,
-                max_iteration=max_iteration,
-                threshold=(dtau_threshold * 20),
-                voxel_size=(dtau_threshold / 2),
-                verbose=verbose,
-            )
-            source_align_3 = uniform_registration(
-                source_pcd,
+        # NOTE the target is only cropped and downsampled once (for registration and evaluation)
+        if registration_pipeline is None and is_gt_cached:
+            print("[GroundTruthCache] loading '%s'" % cache_path)
+            with profile_stage("load_gt_cache"):
+                registration_pipeline = RegistrationPipeline.load(
+                    cache_path,
+                    target_crop_volume,
+                    dtau_threshold,
+                    max_iteration=max_iteration,
+                    verbose=verbose,
+                )
+        if registration_pipeline is not None:
+            if target_crop_json_path is None and use_target_aabb_to_crop:
+                # NOTE the target is "cropped" by its own AABB, so its AABB doesn't change
+                target_crop_volume = registration_pipeline.target_bounding_box()
+                registration_pipeline.target_crop_volume = target_crop_volume
+        else:
+            if target_crop_json_path is None and use_target_aabb_to_crop:
+                target_crop_volume = target_pcd.get_axis_aligned_bounding_box()
+            registration_pipeline = RegistrationPipeline(
                 target_pcd,
-                source_align_2,
                 target_crop_volume,
+                dtau_threshold,
                 max_iteration=max_iteration,
-                threshold=(2 * dtau_threshold),
                 verbose=verbose,
             )
-            source_align = source_align_3
+        if not verbose:
+            # NOTE the (full) target is only used to visualize it, so it can be freed (unless the
+            # pipeline's cropped target is the same point cloud, i.e. if no points were cropped)
+            target_pcd = None
+
+        if not skip_refinement:
+            # Refine registration in three iterations.
+            source_align = registration_pipeline.register(source_pcd, source_align_0)
         else:
             source_align = source_align_0
 
+        with profile_stage("crop_and_downsample (target)"):
+            target_eval_pcd = registration_pipeline.evaluation_target(dtau_threshold / 2)
+
         # Generate histograms and compute P/R/F1
         # Returns: [precision, recall, fscore, edges_source, cum_source, edges_target, cum_target]
-        return TanksAndTemplesEvaluator.evaluate_histogram(
+        result = TanksAndTemplesEvaluator.evaluate_histogram(
             scene_name,
             output_folder,
             source_pcd,
@@ -558,8 +1439,18 @@ class TanksAndTemplesEvaluator:
             threshold=dtau_threshold,
             plot_stretch=plot_stretch,
             verbose=verbose,
+            target_eval_pcd=target_eval_pcd,
+            distance_backend=distance_backend,
+            result_cache_path=result_path,
         )
 
+        with profile_stage("save_gt_cache"):
+            is_gt_saved = cache_path is not None and registration_pipeline.save(cache_path)
+        if is_gt_saved:
+            print("[GroundTruthCache] saved '%s'" % cache_path)
+
+        return result
+
 
 # ----------------------------------------------------------------------------
 
@@ -575,7 +1466,17 @@ def print_evaluation_result(scene, dTau, precision, recall, fscore):
     print("==============================")
 
 
-def run_evaluation(dataset_dir, traj_path, ply_path, out_dir, dTau=None):
+def run_evaluation(
+    dataset_dir,
+    traj_path,
+    ply_path,
+    out_dir,
+    dTau=None,
+    gt_cache_dir=None,
+    distance_backend=None,
+    result_cache_dir=None,
+    profile=False,
+):
     scene = os.path.basename(os.path.normpath(dataset_dir))
 
     if dTau is None:
@@ -635,6 +1536,10 @@ def run_evaluation(dataset_dir, traj_path, ply_path, out_dir, dTau=None):
         target_log_path=colmap_ref_logfile,
         plot_stretch=plot_stretch,
         verbose=os.getenv("VERBOSE", None) is not None,
+        gt_cache_dir=gt_cache_dir,
+        distance_backend=distance_backend,
+        result_cache_dir=result_cache_dir,
+        profile=profile,
     )
 
     print_evaluation_result(scene, dTau, precision, recall, fscore)
@@ -681,6 +1586,30 @@ if __name__ == "__main__":
         default="",
         help="output directory (default: an evaluation directory is created in the directory of the ply file)",
     )
+    parser.add_argument(
+        "--gt-cache-dir",
+        type=str,
+        default=None,
+        help="directory in which the preprocessed ground-truth is cached (default: no caching)",
+    )
+    parser.add_argument(
+        "--distance-backend",
+        type=str,
+        choices=DISTANCE_BACKENDS,
+        default="open3d",
+        help="how nearest neighbor distances are computed (default: Open3D's KD-tree)",
+    )
+    parser.add_argument(
+        "--result-cache-dir",
+        type=str,
+        default=None,
+        help="directory in which evaluation results (alignment and distances) are cached",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write each stage's time and memory to X.profile.json (or set %s=1)" % PROFILE_ENV,
+    )
     args = parser.parse_args()
 
     if args.out_dir.strip() == "":
@@ -691,4 +1620,8 @@ if __name__ == "__main__":
         traj_path=args.traj_path,
         ply_path=args.ply_path,
         out_dir=args.out_dir,
+        gt_cache_dir=args.gt_cache_dir,
+        distance_backend=args.distance_backend,
+        result_cache_dir=args.result_cache_dir,
+        profile=args.profile,
     )
@@ -0,0 +1,256 @@
+import argparse
+
+from typing import Tuple, Optional
+
+import numpy as np
+
+from ds.pose_array import (
+    quaternion_exp,
+    quaternion_log,
+    quaternion_slerp,
+    quaternion_multiply,
+    quaternion_conjugate,
+    quaternion_normalize,
+)
+from uavmvs_parse_traj import CSV_HEADER, load_uavmvs_pose_array
+
+###############################################################################
+###############################################################################
+
+
+# NOTE this is a (vectorized) replacement for uavmvs' `interpolate-trajectory` app,
+# so that trajectories can be resampled without calling an external binary, i.e.:
+#  - positions are interpolated with a centripetal Catmull-Rom spline, and
+#    reparametrized by arc length, so that waypoints are (roughly) evenly spaced,
+#  - orientations are interpolated with SLERP (or SQUAD) between keyframes,
+#  - keyframes are always kept (with key=1), and the output uses uavmvs' .csv schema.
+
+# ref.: uavmvs/apps/trajectory_tools/interpolate.cpp
+
+CATMULL_ROM_ALPHA = 0.5  # 0.0 = uniform, 0.5 = centripetal, 1.0 = chordal
+ARC_LENGTH_SAMPLES = 32  # samples per segment used to approximate its arc length
+
+
+def catmull_rom_control_points(positions: np.ndarray) -> np.ndarray:
+    """ Returns the `(n - 1, 4, 3)` control points of each spline segment between keyframes,
+        extrapolating (by reflection) a phantom point before the first and after the last one.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+    assert len(positions) >= 2, positions.shape
+
+    padded = np.concatenate(
+        [
+            2 * positions[:1] - positions[1:2],
+            positions,
+            2 * positions[-1:] - positions[-2:-1],
+        ]
+    )
+    n_segments = len(positions) - 1
+    return np.stack([padded[i : i + n_segments] for i in range(4)], axis=1)
+
+
+def catmull_rom(
+    control_points: np.ndarray,
+    segments: np.ndarray,
+    u: np.ndarray,
+    alpha: float = CATMULL_ROM_ALPHA,
+) -> np.ndarray:
+    """ Evaluates the spline at the local parameters `u` (in [0, 1]) of the given `segments`.
+
+        Note: `control_points` is the output of `catmull_rom_control_points`, and the
+        Barry and Goldman's pyramidal formulation is used (ref.: https://doi.org/10.1145/54852.378511).
+    """
+    P = control_points[segments]  # (m, 4, 3)
+    P0, P1, P2, P3 = P[:, 0], P[:, 1], P[:, 2], P[:, 3]
+
+    # NOTE clamp the knot intervals, so that repeated keyframes don't divide by zero
+    dt = np.maximum(np.linalg.norm(np.diff(P, axis=1), axis=-1) ** alpha, 1e-8)  # (m, 3)
+    t0 = np.zeros(len(P))
+    t1 = t0 + dt[:, 0]
+    t2 = t1 + dt[:, 1]
+    t3 = t2 + dt[:, 2]
+    t0, t1, t2, t3 = t0[:, None], t1[:, None], t2[:, None], t3[:, None]
+
+    t = t1 + np.asarray(u, dtype=np.float64).reshape((-1, 1)) * (t2 - t1)
+
+    A1 = ((t1 - t) * P0 + (t - t0) * P1) / (t1 - t0)
+    A2 = ((t2 - t) * P1 + (t - t1) * P2) / (t2 - t1)
+    A3 = ((t3 - t) * P2 + (t - t2) * P3) / (t3 - t2)
+    B1 = ((t2 - t) * A1 + (t - t0) * A2) / (t2 - t0)
+    B2 = ((t3 - t) * A2 + (t - t1) * A3) / (t3 - t1)
+    return ((t2 - t) * B1 + (t - t1) * B2) / (t2 - t1)
+
+
+def arc_length_table(
+    control_points: np.ndarray,
+    samples_per_segment: int = ARC_LENGTH_SAMPLES,
+    alpha: float = CATMULL_ROM_ALPHA,
+) -> np.ndarray:
+    """ Returns the `(n_segments, samples_per_segment + 1)` cumulative (chordal) arc lengths
+        of each segment, sampled at `u = k / samples_per_segment`, for k = 0, ..., samples_per_segment.
+    """
+    n_segments = len(control_points)
+    k = samples_per_segment + 1
+
+    segments = np.repeat(np.arange(n_segments), k)
+    u = np.tile(np.linspace(0.0, 1.0, k), n_segments)
+    points = catmull_rom(control_points, segments, u, alpha).reshape((n_segments, k, 3))
+
+    chords = np.linalg.norm(np.diff(points, axis=1), axis=-1)
+    return np.concatenate([np.zeros((n_segments, 1)), np.cumsum(chords, axis=1)], axis=1)
+
+
+def squad_control_points(quaternions: np.ndarray) -> np.ndarray:
+    """ Returns the inner (SQUAD) control quaternions for each keyframe. """
+    q_prev = np.concatenate([quaternions[:1], quaternions[:-1]])
+    q_next = np.concatenate([quaternions[1:], quaternions[-1:]])
+    q_inv = quaternion_conjugate(quaternions)
+
+    log_next = quaternion_log(quaternion_multiply(q_inv, q_next))
+    log_prev = quaternion_log(quaternion_multiply(q_inv, q_prev))
+    return quaternion_normalize(quaternion_multiply(quaternions, quaternion_exp(-(log_next + log_prev) / 4)))
+
+
+def interpolate_trajectory(
+    positions: np.ndarray,
+    orientations: np.ndarray,
+    resolution: float = 1.0,
+    use_squad: bool = False,
+    alpha: float = CATMULL_ROM_ALPHA,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Resamples the keyframes `positions` (with shape `(n, 3)`) and WXYZ `orientations`
+        (with shape `(n, 4)`) with (approximately) `resolution` waypoints per meter.
+
+        Returns the interpolated `(positions, orientations, is_key)` arrays, where `is_key`
+        marks which of the waypoints are (the original, unmodified) keyframes.
+    """
+    positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+    orientations = quaternion_normalize(np.asarray(orientations, dtype=np.float64).reshape((-1, 4)))
+    assert len(positions) == len(orientations)
+    assert resolution > 0, resolution
+
+    n = len(positions)
+    if n < 2:
+        return positions.copy(), orientations.copy(), np.ones(n, dtype=bool)
+
+    # NOTE flip quaternions into the same hemisphere as their predecessor,
+    # so that each segment is interpolated through its shortest arc
+    signs = np.cumprod(np.where(np.sum(orientations[1:] * orientations[:-1], axis=1) < 0, -1.0, 1.0))
+    orientations = orientations * np.concatenate([[1.0], signs])[:, None]
+
+    control_points = catmull_rom_control_points(positions)
+    table = arc_length_table(control_points, alpha=alpha)  # (n - 1, k + 1)
+    lengths = table[:, -1]
+
+    # waypoints per segment (the first of which is the segment's starting keyframe)
+    counts = np.maximum(np.ceil(lengths * resolution), 1).astype(int)
+    segments = np.repeat(np.arange(n - 1), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    fractions = (np.arange(len(segments)) - starts) / counts[segments]  # in [0, 1)
+
+    # invert the arc length table (i.e. find u such that s(u) = fraction * length)
+    targets = fractions * lengths[segments]
+    seg_table = table[segments]
+    k = np.clip(np.sum(seg_table <= targets[:, None], axis=1) - 1, 0, table.shape[1] - 2)
+    s0 = np.take_along_axis(seg_table, k[:, None], axis=1)[:, 0]
+    s1 = np.take_along_axis(seg_table, k[:, None] + 1, axis=1)[:, 0]
+    ds = s1 - s0
+    u = (k + np.where(ds > 0, (targets - s0) / np.where(ds > 0, ds, 1.0), 0.0)) / (table.shape[1] - 1)
+
+    out_positions = catmull_rom(control_points, segments, u, alpha)
+
+    q0, q1 = orientations[segments], orientations[segments + 1]
+    if use_squad:
+        s = squad_control_points(orientations)
+        a0, a1 = s[segments], s[segments + 1]
+        out_orientations = quaternion_slerp(
+            quaternion_slerp(q0, q1, fractions),
+            quaternion_slerp(a0, a1, fractions),
+            2 * fractions * (1 - fractions),
+        )
+    else:
+        out_orientations = quaternion_slerp(q0, q1, fractions)
+
+    is_key = fractions == 0
+    # NOTE keep the keyframes exact (i.e. avoid floating point drift from the evaluation)
+    out_positions[is_key] = positions[:-1]
+    out_orientations[is_key] = orientations[:-1]
+
+    return (
+        np.concatenate([out_positions, positions[-1:]]),
+        np.concatenate([out_orientations, orientations[-1:]]),
+        np.concatenate([is_key, [True]]),
+    )
+
+
+###############################################################################
+###############################################################################
+
+
+def write_uavmvs_csv(
+    filepath: str,
+    positions: np.ndarray,
+    orientations: np.ndarray,
+    is_key: Optional[np.ndarray] = None,
+) -> None:
+    """ Writes a .csv trajectory file (with `CSV_HEADER` columns) all at once.
+
+        Note: `orientations` should follow the convention of `parse_uavmvs_csv`,
+        i.e. 'w' is negated when writing (so that reading it back is lossless).
+    """
+    n = len(positions)
+    if is_key is None:
+        is_key = np.ones(n, dtype=bool)
+
+    table = np.column_stack(
+        [
+            np.asarray(positions, dtype=np.float64).reshape((-1, 3)),
+            np.asarray(orientations, dtype=np.float64).reshape((-1, 4)) * np.array([-1.0, 1.0, 1.0, 1.0]),
+            np.asarray(is_key, dtype=int).reshape((-1,)),
+        ]
+    )
+    np.savetxt(filepath, table, fmt=["%f"] * 7 + ["%d"], delimiter=",", header=CSV_HEADER, comments="")
+
+
+def interpolate_uavmvs_trajectory(
+    in_trajectory: str,
+    out_csv: str,
+    resolution: float = 1.0,
+    use_squad: bool = False,
+) -> int:
+    """ Interpolates a .traj (or .csv) trajectory file into `out_csv`, returning its length. """
+    pose_array = load_uavmvs_pose_array(in_trajectory)
+
+    positions, orientations, is_key = interpolate_trajectory(
+        pose_array.positions, pose_array.orientations, resolution, use_squad
+    )
+    write_uavmvs_csv(out_csv, positions, orientations, is_key)
+
+    return len(positions)
+
+
+###############################################################################
+###############################################################################
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Interpolate a uavmvs trajectory (like uavmvs' interpolate-trajectory app)."
+    )
+
+    parser.add_argument("in_trajectory", type=str, help="Path to the input .traj (or .csv) file")
+    parser.add_argument("out_csv", type=str, help="Path to the output .csv file")
+
+    parser.add_argument("--resolution", type=float, default=1.0, help="Waypoints per meter")
+    parser.add_argument("--squad", action="store_true", help="Use SQUAD instead of SLERP for rotations")
+
+    args = parser.parse_args()
+
+    n_of_waypoints = interpolate_uavmvs_trajectory(
+        args.in_trajectory, args.out_csv, args.resolution, args.squad
+    )
+    print(f"Wrote {n_of_waypoints} waypoints to '{args.out_csv}'")
+
+
+###############################################################################
+###############################################################################
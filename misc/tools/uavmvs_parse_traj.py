@@ -1,3 +1,5 @@
+import os
+
 from enum import Enum
 from typing import Dict, List, Tuple, Callable, Optional, NamedTuple, cast
 
@@ -312,5 +314,78 @@ def convert_uavmvs_to_airsim_pose(camera: TrajectoryCamera, translation=None, sc
     return pose
 
 
+def pose_array_from_uavmvs(trajectory: List[TrajectoryCamera]):
+    """ Stacks the camera positions and rotations (as WXYZ quaternions) of a .traj or .csv
+        trajectory into a `ds.PoseArray`, with the cameras' indices as its `ids` column.
+    """
+    from ds.pose_array import PoseArray, quaternion_from_matrix
+
+    kinds = set(camera.kind for camera in trajectory)
+    assert kinds <= {TRAJ} or kinds <= {CSV}, kinds
+
+    positions = np.array([camera.position for camera in trajectory], dtype=float).reshape((-1, 3))
+    if TRAJ in kinds:
+        quaternions = quaternion_from_matrix(np.array([camera.rotation for camera in trajectory]))
+    else:
+        quaternions = np.array([camera.rotation for camera in trajectory], dtype=float).reshape((-1, 4))
+
+    pose_array = PoseArray(positions, quaternions, ids=np.arange(len(trajectory)))
+
+    del PoseArray, quaternion_from_matrix
+    return pose_array
+
+
+# NOTE bump this whenever `pose_array_from_uavmvs` changes, to invalidate cached files
+POSE_ARRAY_VERSION = 1
+
+
+def load_uavmvs_pose_array(filepath: str, use_cache: bool = True):
+    """ Same as `pose_array_from_uavmvs(parse_uavmvs[ext](filepath))`, for .traj and .csv files,
+        but the parsed arrays are cached in a .npz sidecar file (see `ie.npzcache`).
+    """
+    from ds.pose_array import PoseArray
+    from ie.npzcache import load_cached
+
+    _, ext = os.path.splitext(filepath)
+    assert ext in [".traj", ".csv"], filepath
+
+    def parse_fn(path):
+        pose_array = pose_array_from_uavmvs(parse_uavmvs[ext](path))
+        return {"positions": pose_array.positions, "orientations": pose_array.orientations}
+
+    columns = load_cached(filepath, f"uavmvs_{ext[1:]}", POSE_ARRAY_VERSION, parse_fn, use_cache)
+    pose_array = PoseArray(
+        columns["positions"], columns["orientations"], ids=np.arange(len(columns["positions"]))
+    )
+
+    del PoseArray, load_cached
+    return pose_array
+
+
+def convert_uavmvs_to_airsim_pose_array(pose_array, translation=None, scaling=None):
+    """ Vectorized version of `convert_uavmvs_to_airsim_pose`, for a `ds.PoseArray`
+        created with `pose_array_from_uavmvs` (it returns a new `ds.PoseArray`).
+    """
+    from ds.pose_array import PoseArray
+
+    flip_yz = np.array([1.0, -1.0, -1.0])
+    positions = pose_array.positions * flip_yz
+    if translation is not None:
+        positions += np.asarray(translation, dtype=float)
+    if scaling is not None:
+        positions *= float(scaling)
+
+    orientations = pose_array.orientations * np.array([1.0, 1.0, -1.0, -1.0])  # WXYZ
+    lengths = np.linalg.norm(orientations, axis=1)
+    assert np.all(np.abs(lengths - 1) <= 0.01), lengths
+
+    converted = PoseArray(
+        positions, orientations, pose_array.time_stamps, pose_array.image_files, pose_array.ids
+    )
+
+    del PoseArray
+    return converted
+
+
 ###############################################################################
 ###############################################################################
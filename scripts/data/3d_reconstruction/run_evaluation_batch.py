@@ -0,0 +1,429 @@
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import _thread
+import argparse
+import threading
+import multiprocessing
+
+from os.path import join, isdir, isfile, abspath, dirname
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import psutil
+import numpy as np
+import open3d as o3d
+
+try:
+    FF_PROJECT_ROOT = abspath(join(abspath(__file__), "..", "..", "..", ".."))
+
+    def include(*relative_path):
+        file_dir_path = dirname(abspath(__file__))
+        absolute_path = abspath(join(file_dir_path, *relative_path))
+        sys.path.append(dirname(absolute_path))
+
+    include(FF_PROJECT_ROOT, "misc", "tools", "tanksandtemples_evaluator")
+    include(FF_PROJECT_ROOT, "scripts", "data", "3d_reconstruction", "run_evaluation_tool")
+    from tanksandtemples_evaluator import RegistrationPipeline, file_hash, gt_cache_path
+
+    import tanksandtemples_evaluator
+    import run_evaluation_tool as tool
+except:
+    raise
+
+# NOTE each job is a (run args .json, $ replacement) pair, i.e. the same as calling:
+#   $ python run_evaluation_tool.py <json_path> --replace <replace>
+# Jobs which share the same (preprocessed) ground-truth are grouped, so that its point cloud
+# is read, cropped and downsampled once (by this process), and then shared with the workers
+# through shared memory (instead of each of them reading the same .ply file), which they only
+# copy the downsampled levels they use from (see `RegistrationPipeline.from_arrays` with `lazy`).
+# While the jobs of a ground-truth are running, the next one is preprocessed (and its jobs queued),
+# so that workers aren't left idle between groups, i.e. at most two shared targets exist at once.
+
+SUMMARY_HEADER = [
+    "scene_name",
+    "json_path",
+    "replace",
+    "dtau_threshold",
+    "precision",
+    "recall",
+    "fscore",
+    "seconds",
+    "error",
+]
+
+GIB = 1 << 30
+
+MEMORY_POLL_SECONDS = 0.1
+
+###############################################################################
+## Jobs #######################################################################
+###############################################################################
+
+
+def find_replacements(json_path):
+    """Returns the values of $ for which the source .ply of `json_path` exists (e.g. "cv")."""
+    with open(json_path, "r") as f:
+        source_ply_path = json.load(f)["source_ply_path"]
+    if "$" not in source_ply_path:
+        return [None]
+
+    prefix, suffix = source_ply_path.split("$", maxsplit=1)
+    replacements = []
+    for path in sorted(glob.glob(join(dirname(abspath(json_path)), glob.escape(prefix) + "*"))):
+        replace = os.path.basename(path)
+        if isdir(path) and isfile(join(dirname(abspath(json_path)), prefix + replace + suffix)):
+            replacements.append(replace)
+    return replacements
+
+
+def make_jobs(json_paths, replacements=None):
+    """Returns the jobs grouped by their ground-truth key, in the order they were found."""
+    groups = {}
+    for json_path in json_paths:
+        for replace in replacements or find_replacements(json_path):
+            tool.load_run_args(json_path, replace)
+            # NOTE these are the run args which determine how the target is preprocessed
+            # (i.e. the same as in `gt_cache_path`), so jobs with the same key can share it
+            gt_key = (
+                tool.TARGET_PLY_PATH,
+                tool.TARGET_CROP_JSON_PATH,
+                tool.USE_TARGET_AABB_TO_CROP,
+                tool.DTAU_THRESHOLD,
+                tool.FLIP_TARGET_PLY_YZ,
+                tool.GT_CACHE_DIR,
+            )
+            groups.setdefault(gt_key, []).append(
+                {
+                    "json_path": abspath(json_path),
+                    "replace": replace,
+                    "scene_name": tool.SCENE_NAME,
+                    "dtau_threshold": tool.DTAU_THRESHOLD,
+                    "skip_refinement": tool.SKIP_REFINEMENT,
+                    "result_cache_dir": tool.RESULT_CACHE_DIR,
+                }
+            )
+    return groups
+
+
+def prepare_target(gt_key, skip_refinement):
+    """Returns the `RegistrationPipeline` (with all of its levels) for the ground-truth `gt_key`,
+    loading it from (and saving it to) its `gt_cache_path`, if the run args have a `gt_cache_dir`.
+    """
+    (
+        target_ply_path,
+        target_crop_json_path,
+        use_target_aabb_to_crop,
+        dtau_threshold,
+        flip_target_ply_yz,
+        gt_cache_dir,
+    ) = gt_key
+
+    if target_crop_json_path is not None:
+        target_crop_volume = o3d.visualization.read_selection_polygon_volume(target_crop_json_path)
+    else:
+        target_crop_volume = None
+
+    # NOTE the cache is only looked up (and saved) here, as jobs don't use it when given a pipeline
+    cache_path = None
+    if gt_cache_dir is not None:
+        cache_path = gt_cache_path(
+            gt_cache_dir,
+            target_ply_path,
+            target_crop_json_path,
+            use_target_aabb_to_crop,
+            dtau_threshold,
+            target_transform_key="flip_target_ply_yz" if flip_target_ply_yz else None,
+        )
+
+    if cache_path is not None and isfile(cache_path):
+        print(f"[GroundTruthCache] loading '{cache_path}'")
+        registration_pipeline = RegistrationPipeline.load(
+            cache_path, target_crop_volume, dtau_threshold, verbose=False
+        )
+        if target_crop_json_path is None and use_target_aabb_to_crop:
+            registration_pipeline.target_crop_volume = registration_pipeline.target_bounding_box()
+    else:
+        target_pcd = o3d.io.read_point_cloud(target_ply_path)
+        assert target_pcd.has_points(), target_ply_path
+        if flip_target_ply_yz:
+            tool.flip_target_ply_yz_fn(ply_pcd=target_pcd, is_source_ply=False)
+        if target_crop_json_path is None and use_target_aabb_to_crop:
+            target_crop_volume = target_pcd.get_axis_aligned_bounding_box()
+        registration_pipeline = RegistrationPipeline(
+            target_pcd, target_crop_volume, dtau_threshold, verbose=False
+        )
+
+    registration_pipeline.precompute_levels(skip_refinement)
+    if cache_path is not None and registration_pipeline.save(cache_path):
+        print(f"[GroundTruthCache] saved '{cache_path}'")
+    return registration_pipeline
+
+
+###############################################################################
+## Shared memory ##############################################################
+###############################################################################
+
+
+def share_arrays(arrays):
+    """Copies `arrays` to a single shared memory block, returning it and its spec."""
+    arrays = {name: np.asarray(array, order="C") for name, array in arrays.items()}
+
+    layout, size = {}, 0
+    for name, array in arrays.items():
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += -(-array.nbytes // 64) * 64  # NOTE keeps every array 64-byte aligned
+
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for name, array in arrays.items():
+        offset, shape, dtype = layout[name]
+        np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)[...] = array
+
+    return shm, (shm.name, layout)
+
+
+def attach_shared_memory(name):
+    """Attaches to an existing shared memory block without registering it with the resource tracker,
+    which would otherwise unlink it (and warn about it having "leaked") when the attaching process
+    exits.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+
+    # NOTE before Python 3.13, SharedMemory always calls resource_tracker.register, and the block
+    # can't be unregistered afterwards, since the tracker is shared with the creating process
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def attach_arrays(spec):
+    """Returns the shared memory block of `spec` (see `share_arrays`) and views of its arrays."""
+    name, layout = spec
+    shm = attach_shared_memory(name)
+    return shm, {
+        array_name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        for array_name, (offset, shape, dtype) in layout.items()
+    }
+
+
+###############################################################################
+## Workers ####################################################################
+###############################################################################
+
+
+# NOTE set while the worker runs a job, and once its memory limit is exceeded (see `watch_memory`)
+job_running = threading.Event()
+memory_limit_exceeded = threading.Event()
+
+
+def watch_memory(limit):
+    """Interrupts the (main thread's) current job once the worker's RSS exceeds `limit` bytes."""
+    process = psutil.Process()
+    while not (job_running.is_set() and process.memory_info().rss > limit):
+        time.sleep(MEMORY_POLL_SECONDS)
+    memory_limit_exceeded.set()
+    _thread.interrupt_main()  # NOTE raises KeyboardInterrupt in `run_job`
+
+
+def init_worker(memory_limit_gib):
+    if memory_limit_gib is not None:
+        # NOTE the RSS is polled (instead of, e.g., limiting the virtual memory with RLIMIT_AS,
+        # which also counts memory that's mapped but never used), so a job can exceed the limit
+        # until it's noticed, or while a native (e.g. Open3D) call runs, since the interrupt is
+        # only raised in Python code. It also counts the pages of the shared target that it reads
+        limit = int(memory_limit_gib * GIB)
+        threading.Thread(target=watch_memory, args=(limit,), daemon=True).start()
+
+
+def run_job(job):
+    start_time = time.perf_counter()
+    row = {
+        "scene_name": job["scene_name"],
+        "json_path": job["json_path"],
+        "replace": job["replace"],
+        "dtau_threshold": job["dtau_threshold"],
+        "error": "",
+    }
+    job_running.set()
+    try:
+        json_string = tool.load_run_args(job["json_path"], job["replace"])
+        tanksandtemples_evaluator._file_hashes.update(
+            job["file_hashes"]
+        )  # NOTE see `submit` in `main`
+        tool.VERBOSE = False  # NOTE otherwise, every worker would open visualization windows
+
+        if job["shared_target"] is None:
+            row["precision"], row["recall"], row["fscore"] = tool.evaluate(json_string)
+        else:
+            if tool.TARGET_CROP_JSON_PATH is not None:
+                target_crop_volume = o3d.visualization.read_selection_polygon_volume(
+                    tool.TARGET_CROP_JSON_PATH
+                )
+            else:
+                target_crop_volume = (
+                    None  # NOTE the target's AABB is used if USE_TARGET_AABB_TO_CROP
+                )
+            shm, arrays = attach_arrays(job["shared_target"])
+            try:
+                # NOTE the pipeline keeps views of the shared block, only copying the levels it uses
+                # (i.e. not the full cropped target, which is never used when its levels are shared)
+                registration_pipeline = RegistrationPipeline.from_arrays(
+                    arrays, target_crop_volume, tool.DTAU_THRESHOLD, verbose=False, lazy=True
+                )
+                row["precision"], row["recall"], row["fscore"] = tool.evaluate(
+                    json_string, registration_pipeline
+                )
+            finally:
+                # NOTE views must be released before closing the block (which they still aren't if
+                # an exception's traceback references them, but it's unmapped once the worker exits)
+                registration_pipeline = arrays = None
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+    except KeyboardInterrupt:
+        if not memory_limit_exceeded.is_set():
+            raise
+        row["error"] = "MemoryLimitExceeded (resident set size exceeded --memory-limit)"
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        job_running.clear()
+
+    row["seconds"] = time.perf_counter() - start_time
+    return row
+
+
+###############################################################################
+## Main #######################################################################
+###############################################################################
+
+
+def main(args):
+    groups = make_jobs(args.json_paths, args.replace)
+    n_of_jobs = sum(len(jobs) for jobs in groups.values())
+    assert n_of_jobs > 0, "no jobs found"
+
+    n_of_workers = min(args.jobs, n_of_jobs)
+    if args.memory_limit is not None and args.total_memory is not None:
+        n_of_workers = max(1, min(n_of_workers, int(args.total_memory // args.memory_limit)))
+
+    print(
+        f"Running {n_of_jobs} job(s) of {len(groups)} ground-truth(s) with {n_of_workers} worker(s)"
+    )
+
+    # NOTE workers are spawned (instead of forked), and replaced after each job, so that memory
+    # isn't held across evaluations (nor inherited from this process, e.g. the shared targets)
+    context = multiprocessing.get_context("spawn")
+    with open(args.summary, "w", newline="") as summary_file, context.Pool(
+        n_of_workers, initializer=init_worker, initargs=(args.memory_limit,), maxtasksperchild=1
+    ) as pool:
+        summary = csv.DictWriter(summary_file, fieldnames=SUMMARY_HEADER)
+        summary.writeheader()
+
+        def submit(gt_key, jobs):
+            # NOTE the target is hashed (for the caches' keys) once, instead of by every job
+            if gt_key[-1] is not None or any(job["result_cache_dir"] is not None for job in jobs):
+                file_hash(gt_key[0])
+
+            shm = None
+            if not args.no_shared_target:
+                print(f"Preprocessing '{gt_key[0]}'")
+                registration_pipeline = prepare_target(
+                    gt_key, all(job["skip_refinement"] for job in jobs)
+                )
+                shm, spec = share_arrays(registration_pipeline.arrays())
+                shared_blocks.append(shm)
+                del registration_pipeline
+            for job in jobs:
+                job["shared_target"] = None if shm is None else spec
+                job["file_hashes"] = tanksandtemples_evaluator._file_hashes
+            return shm, pool.imap_unordered(run_job, jobs)
+
+        n_of_done = 0
+        shared_blocks = []
+        try:
+            # NOTE the next group is submitted before waiting for the current one (see above)
+            pending = None
+            for gt_key, jobs in [*groups.items(), (None, None)]:
+                submitted = None if gt_key is None else submit(gt_key, jobs)
+                if pending is not None:
+                    shm, rows = pending
+                    for row in rows:
+                        n_of_done += 1
+                        summary.writerow(row)
+                        # NOTE so that the summary can be read while jobs are running
+                        summary_file.flush()
+                        if row["error"]:
+                            print(
+                                f"[{n_of_done}/{n_of_jobs}] {row['scene_name']} ({row['replace']}):"
+                                f" {row['error']}"
+                            )
+                        else:
+                            print(
+                                f"[{n_of_done}/{n_of_jobs}] {row['scene_name']} ({row['replace']}):"
+                                f" precision={row['precision']:.4f} recall={row['recall']:.4f}"
+                                f" fscore={row['fscore']:.4f} ({row['seconds']:.1f}s)"
+                            )
+                    if shm is not None:
+                        shared_blocks.remove(shm)
+                        shm.close()
+                        shm.unlink()
+                pending = submitted
+        finally:
+            for shm in shared_blocks:
+                shm.close()
+                shm.unlink()
+
+    print(f"Wrote '{args.summary}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run evaluations of run_evaluation_tool.py in parallel, sharing ground-truths."
+    )
+
+    parser.add_argument(
+        "json_paths", type=str, nargs="+", help="run args (e.g. angel/run_angel_v1_initial.json)"
+    )
+    parser.add_argument(
+        "--replace",
+        type=str,
+        nargs="+",
+        help="values used to change $ (default: every subfolder for which the source .ply exists)",
+    )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count(), help="number of worker processes"
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=float,
+        help="maximum resident memory (in GiB) of each job, which fails if it exceeds it",
+    )
+    parser.add_argument(
+        "--total-memory",
+        type=float,
+        help="available memory (in GiB), used with --memory-limit to cap --jobs",
+    )
+    parser.add_argument(
+        "--summary", type=str, default="evaluation_summary.csv", help="output .csv table"
+    )
+    parser.add_argument(
+        "--no-shared-target",
+        action="store_true",
+        help="let each job read (and preprocess) its ground-truth",
+    )
+
+    args = parser.parse_args()
+
+    for json_path in args.json_paths:
+        assert isfile(json_path), f"invalid file path: '{json_path}'"
+
+    main(args)
@@ -2,6 +2,8 @@ import sys
 import json
 import argparse
 
+from contextlib import redirect_stdout
+
 from os.path import join, exists, isfile, abspath, dirname
 
 import numpy as np
@@ -23,6 +25,7 @@ except:
 
 VERBOSE = True
 DEBUG = False  # HACK
+PROFILE = False  # NOTE writes SCENE_NAME.profile.json to OUTPUT_FOLDER (see `StageProfiler`)
 FLIP_TARGET_PLY_YZ = True  # HACK to avoid re-generating point clouds sampled from UE4
 
 SCENE_NAME = None
@@ -57,6 +60,13 @@ TARGET_LOG_TO_PLY_ALIGN_TXT_PATH = None
 # trajectory files (i.e. source_ply_path and target_ply_path).
 SOURCE_PLY_TO_PLY_ALIGN_TXT_PATH = None
 
+# Folder in which the preprocessed ground-truth (i.e. target_ply_path) is cached (optional).
+GT_CACHE_DIR = None
+
+# Folder in which evaluation results (i.e. the final alignment and distances) are cached (optional),
+# so that re-running an evaluation with the same inputs (e.g. to change plot_stretch) is instant.
+RESULT_CACHE_DIR = None
+
 
 def update_run_args(run_args, json_path, dollar_replace=None):
     if dollar_replace is None:
@@ -88,6 +98,8 @@ def update_run_args(run_args, json_path, dollar_replace=None):
     global TARGET_LOG_PATH
     global SOURCE_PLY_TO_PLY_ALIGN_TXT_PATH
     global FLIP_TARGET_PLY_YZ
+    global GT_CACHE_DIR
+    global RESULT_CACHE_DIR
 
     def abspath_if(path):
         if path is None:
@@ -123,6 +135,14 @@ def update_run_args(run_args, json_path, dollar_replace=None):
 
     FLIP_TARGET_PLY_YZ = run_args.get("flip_target_ply_yz", FLIP_TARGET_PLY_YZ)
 
+    GT_CACHE_DIR = run_args.get("gt_cache_dir", GT_CACHE_DIR)
+    if GT_CACHE_DIR is not None:
+        GT_CACHE_DIR = abspath(join(dirname(json_path), GT_CACHE_DIR))  # NOTE it may not exist yet
+
+    RESULT_CACHE_DIR = run_args.get("result_cache_dir", RESULT_CACHE_DIR)
+    if RESULT_CACHE_DIR is not None:
+        RESULT_CACHE_DIR = abspath(join(dirname(json_path), RESULT_CACHE_DIR))  # NOTE it may not exist yet
+
 
 def print_run_args():
     print(f"{SCENE_NAME = }")
@@ -139,34 +159,38 @@ def print_run_args():
     print(f"{TARGET_LOG_TO_PLY_ALIGN_TXT_PATH = }")
     print(f"{SOURCE_PLY_TO_PLY_ALIGN_TXT_PATH = }")
     print(f"{FLIP_TARGET_PLY_YZ = }")
+    print(f"{GT_CACHE_DIR = }")
+    print(f"{RESULT_CACHE_DIR = }")
 
 
-def main(args):
-    with open(args.json_path, "r") as f:
+def load_run_args(json_path, dollar_replace=None, verbose=False):
+    """Updates the run args (i.e. this module's globals) from `json_path`, returning its JSON string."""
+    with open(json_path, "r") as f:
         run_args = json.load(f)
         json_string = json.dumps(run_args, indent=2)
-        if args.verbose:
+        if verbose:
             print(json_string)
-        update_run_args(run_args, abspath(args.json_path), args.replace)
+        update_run_args(run_args, abspath(json_path), dollar_replace)
 
     assert SCENE_NAME is not None
     assert OUTPUT_FOLDER is not None
     assert SOURCE_PLY_PATH is not None
     assert TARGET_PLY_PATH is not None
 
-    if args.verbose:
-        print_run_args()
+    return json_string
 
-    if DEBUG:
-        return
 
-    def flip_target_ply_yz_fn(ply_pcd, is_source_ply):
-        if not is_source_ply:
-            print("NOTE: flipping Y and Z values of the target point cloud!")
-            ply_pcd_points = np.asarray(ply_pcd.points)
-            ply_pcd_points[:, [1, 2]] *= -1
-            ply_pcd.points = o3d.utility.Vector3dVector(ply_pcd_points)
+def flip_target_ply_yz_fn(ply_pcd, is_source_ply):
+    if not is_source_ply:
+        print("NOTE: flipping Y and Z values of the target point cloud!")
+        ply_pcd_points = np.asarray(ply_pcd.points)
+        ply_pcd_points[:, [1, 2]] *= -1
+        ply_pcd.points = o3d.utility.Vector3dVector(ply_pcd_points)
 
+
+def evaluate(json_string, registration_pipeline=None):
+    """Evaluates the reconstruction described by the current run args (see `load_run_args`),
+    returning its `(precision, recall, fscore)`."""
     [
         precision,
         recall,
@@ -202,7 +226,14 @@ def main(args):
         verbose=VERBOSE,
         # Function that can be applied to the source and target point clouds after they're parsed
         # with Open3D. Must have parameters ply_pcd: o3d.geometry.PointCloud, is_source_ply: bool
-        ply_transform_fn=flip_target_ply_yz_fn,
+        # NOTE the same rule as in `run_evaluation_batch.prepare_target` (which must match the caches' key)
+        ply_transform_fn=flip_target_ply_yz_fn if FLIP_TARGET_PLY_YZ else None,
+        gt_cache_dir=GT_CACHE_DIR,
+        target_transform_key="flip_target_ply_yz" if FLIP_TARGET_PLY_YZ else None,
+        # Preprocessed target, e.g. shared by `run_evaluation_batch.py` (optional).
+        registration_pipeline=registration_pipeline,
+        result_cache_dir=RESULT_CACHE_DIR,
+        profile=PROFILE,
     )
 
     print_evaluation_result(SCENE_NAME, DTAU_THRESHOLD, precision, recall, fscore)
@@ -220,15 +251,32 @@ def main(args):
         show_figure=False,
     )
 
-    sys.stdout = open(join(OUTPUT_FOLDER, "run_evaluation_tool.log"), "w")
-    print()
-    print_evaluation_result(SCENE_NAME, DTAU_THRESHOLD, precision, recall, fscore)
-    print()
-    print(json_string)
-    print()
-    print_run_args()
-    print()
-    sys.stdout.close()
+    # NOTE sys.stdout is restored afterwards, so that evaluate can be called more than once
+    with open(join(OUTPUT_FOLDER, "run_evaluation_tool.log"), "w") as f, redirect_stdout(f):
+        print()
+        print_evaluation_result(SCENE_NAME, DTAU_THRESHOLD, precision, recall, fscore)
+        print()
+        print(json_string)
+        print()
+        print_run_args()
+        print()
+
+    return precision, recall, fscore
+
+
+def main(args):
+    global PROFILE
+    PROFILE = args.profile
+
+    json_string = load_run_args(args.json_path, args.replace, args.verbose)
+
+    if args.verbose:
+        print_run_args()
+
+    if DEBUG:
+        return
+
+    evaluate(json_string)
 
 
 if __name__ == "__main__":
@@ -239,6 +287,7 @@ if __name__ == "__main__":
     parser.add_argument("json_path", type=str, help="run args")
     parser.add_argument("--replace", type=str, help="change $")
     parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="write the time and memory used by each stage")
 
     args = parser.parse_args()
     if DEBUG:
@@ -262,5 +311,7 @@ if __name__ == "__main__":
 #     "source_ply_to_ply_align_txt_path": null,
 #     "skip_refinement": false,
 #     "plot_stretch": 5,
-#     "flip_target_ply_yz": true
+#     "flip_target_ply_yz": true,
+#     "gt_cache_dir": null,
+#     "result_cache_dir": null
 # }
@@ -11,6 +11,8 @@ import ie.open3dy as o3dy
 from ie.airsimy import AirSimRecord
 from ie.meshroomy import MeshroomParser
 
+from ds.image_join import join_image_paths
+
 from solve_helmert_transform_lstsq import (
     compute_helmert_A_b,
     solve_helmert_lstsq,
@@ -84,35 +86,30 @@ def compute_points_pair_distances(source, target, transformation):
 
 
 def main(args: argparse.Namespace) -> None:
-    airsim_records = AirSimRecord.dict_from(args.airsim_rec)
-    meshroom_views, meshroom_poses = MeshroomParser.extract_views_and_poses(
-        *MeshroomParser.parse_cameras(args.meshroom_sfm)
-    )
+    airsim_records = AirSimRecord.table_from(args.airsim_rec)
+    meshroom_views, meshroom_poses = MeshroomParser.parse_views_and_poses(args.meshroom_sfm)
 
     # NOTE do *not* assume that the points we read from Meshroom's cameras.sfm
     # come in the same order as AirSim's *rec.txt, they *must* be paired based
     # on the image filenames: views[id]["path"] <-> ImageFile
-    def path_matches_image_file(meshroom_path, airsim_image_file):
-        meshroom_name = os.path.basename(meshroom_path)
-        airsim_name = os.path.basename(airsim_image_file)
-        return meshroom_name.endswith(airsim_name)
-
-    record_view_pose_matches = []
-    for image_file, record in airsim_records.items():
-        [(view, pose)] = [
-            (view, meshroom_poses[view.pose_id])
-            for view in meshroom_views.values()
-            if path_matches_image_file(view.path, image_file)
-        ]
-        record_view_pose_matches.append((record, view, pose))
+    record_indices = np.array(sorted(airsim_records.image_index().values()), dtype=int)
+    view_list = [view for view in meshroom_views.values() if view.pose_id in meshroom_poses]
+
+    join = join_image_paths(
+        left=airsim_records.image_files[record_indices],
+        right=[view.path for view in view_list],
+    )
+    print(f"Matched AirSim records to Meshroom views: {join.report('records', 'views')}")
+    assert len(join) > 0, "No AirSim image file matches Meshroom's views"
 
     # print(f"{airsim_records = }")
     # print(f"{meshroom_views = }")
     # print(f"{meshroom_poses = }")
-    # print(f"{record_view_pose_matches = }")
+    # print(f"{join = }")
 
-    airsim_points, meshroom_points = zip(
-        *[(r.position.to_numpy_array(), np.array(p.center)) for r, _, p in record_view_pose_matches]
+    airsim_points = airsim_records.positions[record_indices[join.left_indices]]
+    meshroom_points = np.array(
+        [meshroom_poses[view_list[j].pose_id].center for j in join.right_indices], dtype=np.float64
     )
     pcd_airsim = o3d.geometry.PointCloud(o3dy.v3d(np.asarray(airsim_points)))  # target
     pcd_meshroom = o3d.geometry.PointCloud(o3dy.v3d(np.asarray(meshroom_points)))  # source
@@ -1,14 +1,14 @@
 import os
-import json
 import argparse
 
-from typing import List
-
 import numpy as np
 import open3d as o3d
 
+from ie.airsimy import AirSimRecord
+from ie.meshroomy import MeshroomParser, write_binary_ply
+
 
-def convert_to_ply(input, output, np_points_from_lines_fn):
+def convert_to_ply(input, output, np_points_from_path_fn):
     assert os.path.isfile(input), f"Invalid input path: '{input}'"
 
     if output is None:
@@ -18,8 +18,7 @@ def convert_to_ply(input, output, np_points_from_lines_fn):
         output = os.path.join(output, f"{os.path.splitext(os.path.basename(input))[0]}.ply")
 
     # Parse the camera poses into a `float64` array of shape `(num_points, 3)`.
-    with open(input, "r") as f:
-        np_points = np_points_from_lines_fn(f.readlines())
+    np_points = np_points_from_path_fn(input)
 
     # NOTE to convert data points between numpy and open3d use:
     #   |
@@ -37,22 +36,14 @@ def convert_to_ply(input, output, np_points_from_lines_fn):
     return pcd, output
 
 
-def np_points_from_airsim_rec(lines: List[str]) -> np.ndarray:
-    def np_pos_from(line: str) -> np.ndarray:
-        _, pos_x, pos_y, pos_z, *_ = line.rstrip("\n").split("\t")
-        return np.fromiter(map(float, [pos_x, pos_y, pos_z]), dtype=float)
-
-    # NOTE skip the header "TimeStamp POS_X POS_Y POS_Z Q_W Q_X Q_Y Q_Z ImageFile"
-    return np.array([np_pos_from(line) for line in lines[1:]], dtype=float)
+def np_points_from_airsim_rec(path: str) -> np.ndarray:
+    # NOTE the parsed recording is cached (see `ie.npzcache`)
+    return AirSimRecord.table_from(path).positions
 
 
-def np_points_from_cameras_sfm(lines: List[str]) -> np.ndarray:
-    def np_pos_from(pose: dict) -> np.ndarray:
-        center = pose["pose"]["transform"]["center"]
-        return np.fromiter(map(float, center), dtype=float)
-
-    poses_json = json.loads("".join(lines))["poses"]
-    return np.array([np_pos_from(pose) for pose in poses_json])
+def np_points_from_cameras_sfm(path: str) -> np.ndarray:
+    # NOTE the parsed cameras are cached (see `ie.npzcache`)
+    return MeshroomParser.load_pose_arrays(path).centers
 
 
 ###############################################################################
@@ -63,9 +54,9 @@ def np_points_from_cameras_sfm(lines: List[str]) -> np.ndarray:
 def main(args: argparse.Namespace) -> None:
     point_clouds = []
 
-    def save_ply(input, output, np_points_from_lines_fn):
+    def save_ply(input, output, np_points_from_path_fn):
         nonlocal point_clouds
-        pcd, output_path = convert_to_ply(input, output, np_points_from_lines_fn)
+        pcd, output_path = convert_to_ply(input, output, np_points_from_path_fn)
         point_clouds.append(pcd)
         o3d.io.write_point_cloud(output_path, pcd)
         print(f"{pcd} Saved to '{output_path}'.")
@@ -76,6 +67,17 @@ def main(args: argparse.Namespace) -> None:
     if args.sfm is not None:
         save_ply(args.sfm, args.ply or "converted_sfm.ply", np_points_from_cameras_sfm)
 
+    if args.landmarks is not None:
+        # NOTE landmarks are written directly (i.e. without open3d), keeping their colors
+        landmarks = MeshroomParser.parse_landmarks(args.landmarks)
+        output_path = args.ply or "converted_landmarks.ply"
+        write_binary_ply(output_path, landmarks.positions, landmarks.colors, comments=[args.landmarks])
+        print(f"{len(landmarks.positions)} landmarks saved to '{output_path}'.")
+        if args.view:
+            pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(landmarks.positions))
+            pcd.colors = o3d.utility.Vector3dVector(landmarks.colors / 255.0)
+            point_clouds.append(pcd)
+
     if point_clouds and args.view:
         o3d.visualization.draw_geometries(point_clouds)
 
@@ -88,11 +90,12 @@ def main(args: argparse.Namespace) -> None:
 def get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Converts the camera positions from AirSim's recording log"
-        " or Meshroom's reconstruction file to point cloud data in PLY format."
+        " or Meshroom's reconstruction file (or its landmarks) to point cloud data in PLY format."
     )
 
     parser.add_argument("--rec", type=str, help="Path to the input airsim_rec.txt")
     parser.add_argument("--sfm", type=str, help="Path to the input cameras.sfm")
+    parser.add_argument("--landmarks", type=str, help="Path to the input sfm.json (or sfm.abc) with a structure")
     parser.add_argument("--ply", type=str, help="Path to the output file")
     parser.add_argument("--view", action="store_true", help="Visualize the point clouds")
 
@@ -13,6 +13,8 @@ import open3d as o3d
 from ie.airsimy import AirSimRecord
 from ie.meshroomy import MeshroomParser
 
+from ds.image_join import join_image_paths
+
 try:
     from include_in_path import include, FF_PROJECT_ROOT
 
@@ -38,8 +40,9 @@ try:
     from registration import registration_unif, registration_vol_ds, trajectory_alignment
     from trajectory_io import read_trajectory
 
-    include(*python_toolbox_path, "convert_to_logfile")
-    from convert_to_logfile import quat2rotmat, write_SfM_log
+    # NOTE the same as python_toolbox's `write_SfM_log(T, i_map, filename)`, but it formats all poses at once
+    include(FF_PROJECT_ROOT, "misc", "tools", "tanksandtemples_evaluator")
+    from tanksandtemples_evaluator import write_log
 except:
     raise
 
@@ -78,9 +81,6 @@ def convert_to_log(
     input_images.sort()
     n_of_images = len(input_images)
 
-    T, i_map = [], []
-    TF, i_mapF = [], []
-
     camera_poses = []
 
     def transform(rotation, center):
@@ -91,8 +91,7 @@ def convert_to_log(
         return transformation
 
     if from_method == Method.Meshroom:
-        views, poses = MeshroomParser.parse_cameras(cameras_sfm_path)
-        views_dict, poses_dict = MeshroomParser.extract_views_and_poses(views, poses)
+        views_dict, poses_dict = MeshroomParser.parse_views_and_poses(cameras_sfm_path)
         for id, pose in poses_dict.items():
             # FIXME triple-check this (shouldn't we use MeshroomTransform.rotation?)
             # 3x3 (column-major) rotation matrix
@@ -105,46 +104,39 @@ def convert_to_log(
             )
 
     elif from_method == Method.AirSim:
-        for record in AirSimRecord.list_from(airsim_rec_path):
-            # FIXME triple-check this (note that quat2rotmat expects wxyz, not xyzw)
-            rotation = quat2rotmat(
-                np.array(
-                    [
-                        record.orientation.w_val,
-                        record.orientation.x_val,
-                        record.orientation.y_val,
-                        record.orientation.z_val,
-                    ]
-                )
-            )
-            # rotation[:, 1:] *= -1
-            center = record.position.to_numpy_array()
-            camera_poses.append(
-                TanksAndTemples.LogCameraPose(
-                    record.time_stamp, record.image_file, transform(rotation, center)
-                )
-            )
+        records = AirSimRecord.table_from(airsim_rec_path)
+        # FIXME triple-check this (note that PoseArray uses the same wxyz convention as quat2rotmat)
+        # rotation[:, 1:] *= -1
+        for time_stamp, image_file, matrix in zip(
+            records.time_stamps, records.image_files, records.matrices()
+        ):
+            camera_poses.append(TanksAndTemples.LogCameraPose(time_stamp, image_file, matrix))
+
+    # NOTE poses are matched to the input images by their (normalized) basenames, and the
+    # first pose is used when more than one matches the same image (e.g. repeated records)
+    join = join_image_paths(
+        left=[pose.image_path for pose in camera_poses],
+        right=input_images,
+    )
+    print(f"Matched camera poses to input images: {join.report('poses', 'images')}")
+
+    matched_images, first_match = np.unique(join.right_indices, return_index=True)
+    matched_poses = join.left_indices[first_match]
+
+    log_matrices = np.array([camera_poses[i].log_matrix for i in matched_poses], dtype=np.float64)
+    T = np.linalg.inv(log_matrices.reshape((-1, 4, 4)))
+
+    # NOTE the log file needs an entry for every image, so we assign the
+    # identity matrix to the ones that don't have a matching camera pose
+    TF = np.tile(np.identity(4), (n_of_images, 1, 1))
+    TF[matched_images] = T
+
+    i_mapF = np.zeros((n_of_images, 3), dtype="int")
+    i_mapF[:, 0] = np.arange(n_of_images)
+    i_mapF[:, 1] = -1
+    i_mapF[matched_images, 1] = matched_images
 
-    for pose in camera_poses:
-        A = np.matrix(pose.log_matrix)
-        T.append(A.I)
-        image_name = os.path.basename(pose.image_path)
-        matching = [i for i, s in enumerate(input_images) if image_name in s]
-        i_map.append([pose.id, matching[0], 0])
-
-    for k in range(n_of_images):
-        try:
-            # find the k-th view id
-            view_id = [i for i, item in enumerate(i_map) if k == item[1]][0]
-            i_mapF.append(np.array([k, k, 0], dtype="int"))
-            TF.append(T[view_id])
-        except IndexError:
-            # assign the identity matrix to the k-th view id
-            # as the log file needs an entry for every image
-            i_mapF.append(np.array([k, -1, 0], dtype="int"))
-            TF.append(np.identity(4))
-
-    write_SfM_log(TF, i_mapF, logfile_out)
+    write_log(logfile_out, TF, i_mapF)
 
 
 def convert_meshroom_to_log(cameras_sfm_path, image_folder):
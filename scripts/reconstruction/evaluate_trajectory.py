@@ -8,8 +8,9 @@ from typing import Tuple, Optional, NamedTuple
 import numpy as np
 import matplotlib.pyplot as plt
 
+from ds.pose_array import PoseArray
 from ie.airsimy import AirSimRecord
-from ie.meshroomy import MeshroomParser, MeshroomTransform
+from ie.meshroomy import MeshroomParser
 
 try:
     from include_in_path import include, FF_PROJECT_ROOT
@@ -113,16 +114,11 @@ def make_record_line(timestamp, position, orientation, as_string=True):
 def convert_meshroom_to_log(cameras_sfm_path):
     assert os.path.isfile(cameras_sfm_path), f"File not found: '{cameras_sfm_path}'"
 
-    views, poses = MeshroomParser.parse_cameras(cameras_sfm_path)
-    views_dict, poses_dict = MeshroomParser.extract_views_and_poses(views, poses)
+    pose_arrays = MeshroomParser.load_pose_arrays(cameras_sfm_path)
 
     record_lines = []
-    for _, view in views_dict.items():
-        timestamp = os.path.splitext(os.path.basename(view.path))[0].split("_")[-1]  # HACK
-
-        pose = poses_dict[view.pose_id]
-        position = MeshroomTransform.translation(pose.center)
-        orientation = MeshroomTransform.rotation(pose.rotation, as_xyzw_quaternion=True)
+    for path, position, orientation in zip(pose_arrays.paths, pose_arrays.centers, pose_arrays.quaternions):
+        timestamp = os.path.splitext(os.path.basename(path))[0].split("_")[-1]  # HACK
 
         line_str = make_record_line(timestamp, position, orientation)
         record_lines.append((timestamp, line_str))  # store a tuple
@@ -142,16 +138,16 @@ def convert_meshroom_to_log(cameras_sfm_path):
 def convert_airsim_to_log(airsim_rec_path):
     assert os.path.isfile(airsim_rec_path), f"File not found: '{airsim_rec_path}'"
 
+    records = AirSimRecord.table_from(airsim_rec_path)
+
     record_lines = []
-    for record in AirSimRecord.list_from(airsim_rec_path):
+    for image_file, row in zip(records.image_files, records.to_xyz_xyzw_array()):
         # FIXME what convert_meshroom_to_log gets (see HACK in it) is not actually
         # the timestamp... but since it's only used for matching, this should work:
-        timestamp = os.path.splitext(os.path.basename(record.image_file))[0].split("_")[-1]  # HACK
+        timestamp = os.path.splitext(os.path.basename(image_file))[0].split("_")[-1]  # HACK
         # timestamp = record.time_stamp
 
-        position = record.position.to_numpy_array()
-        orientation = record.orientation.to_numpy_array()
-        assert np.isclose(orientation[3], record.orientation.w_val)
+        position, orientation = row[:3], row[3:]  # tx ty tz, qx qy qz qw
 
         line_str = make_record_line(timestamp, position, orientation)
         record_lines.append((timestamp, line_str))  # store a tuple
@@ -167,6 +163,12 @@ def convert_airsim_to_log(airsim_rec_path):
 
 
 def evaluate(gt_traj, est_traj, scale=True):
+    # NOTE TartanAir's evaluator expects (n, 7) arrays with rows `tx ty tz qx qy qz qw`
+    if isinstance(gt_traj, PoseArray):
+        gt_traj = gt_traj.to_xyz_xyzw_array()
+    if isinstance(est_traj, PoseArray):
+        est_traj = est_traj.to_xyz_xyzw_array()
+
     result = TartanAir.evaluate_trajectory(gt_traj, est_traj, scale)
     print(
         "\n==> ATE: %.4f,\tRPE-R/t: %.4f, %.4f,\tKITTI-R/t: %.4f, %.4f"
@@ -1,11 +1,12 @@
 import os
-import json
 import argparse
 
 from collections import namedtuple
 
 from ie.airsimy import AirSimRecord
-from ie.meshroomy import MeshroomParser, MeshroomTransform, MeshroomQuaternion
+from ie.meshroomy import MeshroomParser, MeshroomQuaternion
+
+from ds.image_join import join_image_paths
 
 SHOW_CORRESPONDENCES = True  # FIXME
 
@@ -31,75 +32,45 @@ def main(args: argparse.Namespace) -> None:
         print(f"airsim_rec.txt path: '{args.rec}'")
         print()
 
-    record_dict = AirSimRecord.dict_from(args.rec)
-    view_dict, _pose_dict = MeshroomParser.extract_views_and_poses(
-        *MeshroomParser.parse_cameras(args.sfm)
-    )
+    records = AirSimRecord.table_from(args.rec)
+    record_index = records.image_index()  # NOTE keeps the last row of repeated image files
+    views_dict, poses_dict = MeshroomParser.parse_views_and_poses(args.sfm)
 
     # NOTE Meshroom uses absolute paths, while AirSim uses relative
-    airsim_images = [os.path.basename(_) for _ in record_dict.keys()]
-    meshroom_images = [os.path.basename(_.path) for _ in view_dict.values()]
-
-    matching_images = set(airsim_images).intersection(set(meshroom_images))
-    match_count = len(matching_images)
+    airsim_paths = list(record_index.keys())
+    meshroom_pose_ids = list(poses_dict.keys())  # NOTE in the same order as in the .sfm file
+    join = join_image_paths(
+        left=[views_dict[pose_id].path for pose_id in meshroom_pose_ids],  # 'poseId' is equal to 'viewId'
+        right=airsim_paths,
+    )
+    match_count = len(join)
 
-    print(f"cameras.sfm: {match_count} out of {len(meshroom_images)} images matched")
-    print(f"airsim_rec.txt: {match_count} out of {len(airsim_images)} images matched")
+    print(f"cameras.sfm: {match_count} out of {len(views_dict)} images matched")
+    print(f"airsim_rec.txt: {match_count} out of {len(airsim_paths)} images matched")
     print()
+    assert len(join.unmatched_left) == 0, "Every pose in cameras.sfm must have a matching record"
 
     # Generate a new cameras.sfm file matching poses from airsim.rec, to be
     # used with the `FeatureMatching > matchFromKnownCameraPoses` node option
     # https://github.com/alicevision/meshroom/wiki/Using-known-camera-positions
-    cameras_sfm = json.loads(open(args.sfm, "r").read())
-    assert list(cameras_sfm.keys()) == [
-        "version",          # keep
-        "featuresFolders",  # remove
-        "matchesFolders",   # remove
-        "views",            # keep
-        "intrinsics",       # keep (TODO find AirSim's camera intrinsics)
-        "poses",            # update 'transform' and set 'locked' from 0 to 1
-    ]
-
-    del cameras_sfm["featuresFolders"]
-    del cameras_sfm["matchesFolders"]
-
-    for pose in cameras_sfm["poses"]:
-        # Replace the 'transform's 'center' with `position`, and 'rotation' with
-        # `orientation` (converted from WXYZ quaternion to a 3x3 rotation matrix)
-        pose_id, _rotation, _center = MeshroomParser.Pose.extract_from(pose)
-
-        # NOTE 'poseId' is equal to 'viewId', so we can use it to index into the view dict
-        image_file = os.path.basename(view_dict[pose_id].path)  # FIXME this isn't a "general" solution
-        record = record_dict[image_file]
-
-        new_center = [record.position.x_val, record.position.y_val, record.position.z_val]
-        new_rotation = MeshroomTransform.unparse_rotation(
-            MeshroomQuaternion.XYZW.to_rotation_matrix(
-                record.orientation.to_numpy_array()  # returned in XYZW order
-            )
-        )
+    #
+    # NOTE cameras.sfm has the keys: "version" (kept), "featuresFolders" (removed),
+    # "matchesFolders" (removed), "views" (kept), "intrinsics" (kept, TODO find AirSim's
+    # camera intrinsics), and "poses" (updated 'transform' and set 'locked' from 0 to 1)
 
-        # Update 'transform' values and set 'locked' to 1
-        pose["pose"]["transform"]["center"] = list(map(str, new_center))
-        pose["pose"]["transform"]["rotation"] = list(map(str, new_rotation))
-        pose["pose"]["locked"] = "1"
+    # Replace the 'transform's 'center' with `position`, and 'rotation' with
+    # `orientation` (converted from WXYZ quaternion to a 3x3 rotation matrix)
+    rows = [record_index[airsim_paths[j]] for j in join.right_indices]
+    new_centers = records.positions[rows]
+    new_rotations = MeshroomQuaternion.WXYZ.to_rotation_matrices(records.orientations[rows])
 
     if SHOW_CORRESPONDENCES:
         # NOTE this is used by align_with_icp.py
         Correspondence = namedtuple("Correspondence", ["source_idx", "target_idx"])
-        correspondences = []
-
-        # FIXME this assumes `record_dict.keys()` have the same order as in airsim_rec.txt
-        indexed_airsim_paths = list(enumerate(record_dict.keys()))
-        for meshroom_idx, pose in enumerate(cameras_sfm["poses"]):
-            meshroom_path = view_dict[pose["poseId"]].path
-            [(i, airsim_idx)] = [
-                (i, airsim_idx)
-                for i, (airsim_idx, airsim_path) in enumerate(indexed_airsim_paths)
-                if os.path.basename(airsim_path) == os.path.basename(meshroom_path)
-            ]
-            del indexed_airsim_paths[i]  # remove images that have already been matched
-            correspondences.append(Correspondence(source_idx=meshroom_idx, target_idx=airsim_idx))
+        correspondences = [
+            Correspondence(source_idx=meshroom_idx, target_idx=airsim_idx)
+            for meshroom_idx, airsim_idx in zip(join.left_indices.tolist(), join.right_indices.tolist())
+        ]
 
         print(f"{len(correspondences)} [meshroom (source), airsim (target)] correspondences:")
         print("[")
@@ -115,8 +86,18 @@ def main(args: argparse.Namespace) -> None:
             else os.path.join(args.output, new_file_path)  # dir
         )
 
-    with open(new_file_path, "w") as f:
-        print(json.dumps(cameras_sfm, indent=4), file=f)
+    pose_ids = [meshroom_pose_ids[i] for i in join.left_indices]
+    updated_pose_count = MeshroomParser.write_sfm(
+        args.sfm,
+        new_file_path,
+        pose_ids=pose_ids,
+        rotations=new_rotations,
+        centers=new_centers,
+        lock_poses=True,
+        skip_sections=["featuresFolders", "matchesFolders"],
+    )
+    # NOTE poses missing from the .sfm would otherwise be silently left untransformed
+    assert updated_pose_count == len(pose_ids), f"only {updated_pose_count} of {len(pose_ids)} poses were updated"
     print(f"Saved output to '{new_file_path}'")
 
     # TODO see https://github.com/alicevision/meshroom/issues/655
@@ -3,7 +3,8 @@ import argparse
 
 import numpy as np
 
-from evaluate_trajectory import evaluate, make_record_line
+from ds.pose_array import PoseArray
+from evaluate_trajectory import evaluate
 
 try:
     from include_in_path import FF_PROJECT_ROOT, include
@@ -29,27 +30,17 @@ def main(airsim_log_path, uavmvs_out_path):
     assert os.path.isfile(uavmvs_out_path), f"File not found: '{uavmvs_out_path}'"
     assert os.path.splitext(uavmvs_out_path)[1] in [".traj", ".csv"]
 
-    uavmvs_traj = np.zeros_like(airsim_traj)
-    for i, camera in enumerate(uavmvs.parse_uavmvs_traj(uavmvs_out_path)):
-        position = camera.position
-
-        # NOTE .traj stores a 3x3 rotation matrix, while .csv uses WXYZ quaternions
-        camera = camera.into(uavmvs.TrajectoryCameraKind.Csv)
-        assert np.allclose(camera.position, position)  # sanity check
-        assert camera.rotation.shape == (4,)  # sanity check
-        w, x, y, z = camera.rotation
-
-        # Apply the transformations used to trace uavmvs' trajectory in AirSim
-        # to the original data now, so that they refer to the same coordinates.
-        # TODO apply orientation transforms as well...
-        position = uavmvs.convert_uavmvs_to_airsim_position(
-            position, translation=args.offset, scaling=args.scale
-        )
-        position = position.to_numpy_array()
-
-        # NOTE we skip the timestamp anyway (when calling evaluate)
-        line_tuple = make_record_line(i, position, orientation=(x, y, z, w), as_string=False)
-        uavmvs_traj[i] = np.array(line_tuple[1:], dtype=uavmvs_traj.dtype)
+    # NOTE .traj stores 3x3 rotation matrices, which are converted to WXYZ quaternions
+    uavmvs_poses = uavmvs.load_uavmvs_pose_array(uavmvs_out_path)
+    assert len(uavmvs_poses) == len(airsim_traj)
+
+    # Apply the transformations used to trace uavmvs' trajectory in AirSim
+    # to the original data now, so that they refer to the same coordinates.
+    # TODO apply orientation transforms as well...
+    airsim_positions = uavmvs.convert_uavmvs_to_airsim_pose_array(
+        uavmvs_poses, translation=args.offset, scaling=args.scale
+    ).positions
+    uavmvs_traj = PoseArray(airsim_positions, uavmvs_poses.orientations)
 
     evaluate(gt_traj=airsim_traj, est_traj=uavmvs_traj, scale=True)
 
@@ -27,6 +27,9 @@ def path_to(*relative_path):
 
 ASSETS_DIR = path_to(HERE, "assets")
 
+# NOTE uavmvs_interpolate_traj.py replaces uavmvs' interpolate-trajectory app
+INTERPOLATE_TRAJ_PY = path_to(FF_PROJECT_ROOT, "misc", "tools", "uavmvs_interpolate_traj.py")
+
 
 def setup_args(args: argparse.Namespace) -> None:
     args.scene = path_to(args.scene)
@@ -223,12 +226,18 @@ def main(args: argparse.Namespace) -> None:
         if args.no_interpolate:
             if args.verbose:
                 print(f"\n# skipped interpolate_trajectory")
-        else:
+        elif args.uavmvs_interpolate:
             Uavmvs.interpolate_trajectory(
                 in_trajectory   = fn_out("shortened"),
                 out_csv         = fn_out("interpolated", ext=".csv"),
                 resolution      = RESOLUTION,
             )
+        else:
+            print(
+                f"\npython {INTERPOLATE_TRAJ_PY}"
+                f" {fn_out('shortened')} {fn_out('interpolated', ext='.csv')}"
+                f" --resolution={RESOLUTION}"
+            )
 
     if args.verbose:
         print("\n#\n# geometric scene proxy\n#")
@@ -320,6 +329,7 @@ if __name__ == "__main__":
 
     parser.add_argument("--no_optimize", action="store_true", help="Shorten the initial trajectory")
     parser.add_argument("--no_interpolate", action="store_true", help="Skip spline interpolation")
+    parser.add_argument("--uavmvs_interpolate", action="store_true", help="Use uavmvs' (instead of our) spline interpolation")
 
     parser.add_argument("--verbose", "-v", action="store_true", help="Increase verbosity")
 
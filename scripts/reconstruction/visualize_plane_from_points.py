@@ -1,56 +1,48 @@
 import numpy as np
 import open3d as o3d
 
-from ie.open3dy import plane_from_points
+import ie.open3dy as o3dy
 
 if __name__ == "__main__":
     def debug_color(unit_vector):
         return (unit_vector + 1) * 0.5
 
-    def radial_noise():
-        return 1 + np.random.normal(0.0, 0.01)
+    def radial_noise(n):
+        return 1 + np.random.normal(0.0, 0.01, size=(n, 1))
 
     v3d = o3d.utility.Vector3dVector  # float64 numpy array of shape (n, 3) -> Open3D format
     v3i = o3d.utility.Vector3iVector  #   int32 numpy array of shape (n, 3) -> Open3D format
     v2i = o3d.utility.Vector2iVector  #   int32 numpy array of shape (n, 2) -> Open3D format
 
     def points_on_sphere(n):
-        points = []
-        colors = []
-        for _ in range(n):
-            while True:
-                point = np.random.rand(3) * 2 - 1
-                norm = np.linalg.norm(point)
-                if 0.0001 < norm <= 1:
-                    break
-            point /= norm
-            points.append(point * radial_noise())
-            colors.append(debug_color(point))
-        pcd = o3d.geometry.PointCloud()
-        pcd.points = v3d(points)
-        pcd.colors = v3d(colors)
-        return pcd
+        return o3dy.create_unit_sphere_point_cloud(
+            n, point_fn=lambda points: points * radial_noise(len(points)), color_fn=debug_color
+        )
 
     N, NN = 50000, 32
 
     pcd1 = points_on_sphere(N)
     kdtree = o3d.geometry.KDTreeFlann(pcd1)
 
+    # NOTE only the k-nearest neighbors search is done per point,
+    # planes are then fitted to all of the neighborhoods at once
     neighbors_indices = []
-    planes = []
-    colors = []
     for i, point in enumerate(pcd1.points):
         k, indices, distance2 = kdtree.search_knn_vector_3d(query=point, knn=NN)
         assert k == NN and i in indices
-        neighbors = pcd1.select_by_index(indices)
         neighbors_indices.append(indices)
-        [*abc, d] = plane_from_points(np.asarray(neighbors.points))
-        normal = np.asarray(abc)
-        if np.dot(normal, point) < 0:
-            normal = -normal
-            d = -d
-        planes.append((normal, d))
-        colors.append(debug_color(normal))
+
+    points = np.asarray(pcd1.points)
+    neighbors_indices = np.asarray(neighbors_indices)
+    fitted_planes = o3dy.planes_from_neighbors(points[neighbors_indices])
+
+    # orient normals "outwards" (i.e. away from the sphere's center)
+    normals, ds = fitted_planes[:, :3], fitted_planes[:, 3]
+    flip = np.sum(normals * points, axis=1) < 0
+    normals[flip] *= -1
+    ds[flip] *= -1
+    planes = list(zip(normals, ds))
+    colors = debug_color(normals)
 
     pcd2 = o3d.geometry.PointCloud(pcd1)
     pcd2.colors = v3d(colors)
@@ -88,7 +80,7 @@ if __name__ == "__main__":
     normal, d = planes[INDEX]
     n_indices = neighbors_indices[INDEX]
 
-    neighbors, pcd1 = split_points_by_index(pcd1, neighbors_indices[INDEX])
+    neighbors, pcd1 = split_points_by_index(pcd1, neighbors_indices[INDEX].tolist())
     draw_list.append(pcd1)
     draw_list.append(neighbors.paint_uniform_color([0, 0, 0]))
 
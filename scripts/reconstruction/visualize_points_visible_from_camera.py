@@ -1,33 +1,17 @@
 import numpy as np
 import open3d as o3d
+import ie.open3dy as o3dy
 
 if __name__ == "__main__":
     def debug_color(unit_vector):
         return (unit_vector + 1) * 0.5
 
-    def radial_noise():
-        return 1 + np.random.normal(0.0, 0.01)
-
     v3d = o3d.utility.Vector3dVector  # float64 numpy array of shape (n, 3) -> Open3D format
     v3i = o3d.utility.Vector3iVector  #   int32 numpy array of shape (n, 3) -> Open3D format
     v2i = o3d.utility.Vector2iVector  #   int32 numpy array of shape (n, 2) -> Open3D format
 
     def points_on_sphere(n):
-        points = []
-        colors = []
-        for _ in range(n):
-            while True:
-                point = np.random.rand(3) * 2 - 1
-                norm = np.linalg.norm(point)
-                if 0.0001 < norm <= 1:
-                    break
-            point /= norm
-            points.append(point)  # * radial_noise())
-            colors.append(debug_color(point))
-        pcd = o3d.geometry.PointCloud()
-        pcd.points = v3d(points)
-        pcd.colors = v3d(colors)
-        return pcd
+        return o3dy.create_unit_sphere_point_cloud(n, color_fn=debug_color)
 
     N, NN = 50000, 32
     pcd = points_on_sphere(N)
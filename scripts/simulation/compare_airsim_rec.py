@@ -3,6 +3,7 @@ import argparse
 
 import numpy as np
 
+from ds.pose_array import PoseArray
 from ie.airsimy import AirSimRecord
 
 if __name__ == "__main__":
@@ -17,15 +18,11 @@ if __name__ == "__main__":
     assert os.path.isfile(args.rec1), f"Invalid file path: '{args.rec1}'"
     assert os.path.isfile(args.rec2), f"Invalid file path: '{args.rec2}'"
 
-    args.recording1 = AirSimRecord.dict_from(rec_file=args.rec1)
-    args.recording2 = AirSimRecord.dict_from(rec_file=args.rec2)
+    args.recording1 = PoseArray.from_records(AirSimRecord.dict_from(rec_file=args.rec1).values())
+    args.recording2 = PoseArray.from_records(AirSimRecord.dict_from(rec_file=args.rec2).values())
 
-    distance_error = np.asarray(
-        [
-            r1.position.distance_to(r2.position)
-            for r1, r2 in zip(args.recording1.values(), args.recording2.values())
-        ]
-    )
+    n = min(len(args.recording1), len(args.recording2))
+    distance_error = args.recording1[:n].distances_to(args.recording2[:n])
 
     print(f"     N: {len(distance_error)}")
     print(f"   min: {np.amin(distance_error):.4f}")
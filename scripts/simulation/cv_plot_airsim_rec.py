@@ -6,8 +6,8 @@ import numpy as np
 import airsim
 
 from ds.rgba import Rgba
+from ds.pose_array import PoseArray
 from ie.airsimy import AirSimRecord, AirSimNedTransform, connect
-from airsim.types import Pose, Vector3r
 
 ###############################################################################
 ## preflight (called before connecting) #######################################
@@ -36,18 +36,15 @@ def fly(client: airsim.MultirotorClient, args: argparse.Namespace) -> None:
     if args.flush:
         client.simFlushPersistentMarkers()
 
-    if not args.transformation:
-        poses = [Pose(record.position, record.orientation) for record in args.recording.values()]
-        positions = [record.position for record in args.recording.values()]
-    else:
+    pose_array = PoseArray.from_records(args.recording.values())
+    if args.transformation:
         matrix = np.loadtxt(args.transformation)  # load the 4x4 transformation matrix
         print(matrix)
-        poses = []
-        positions = []
-        for record in args.recording.values():
-            pos = Vector3r(*np.matmul(matrix, np.append(record.position, 1)))
-            poses.append(Pose(pos, record.orientation))
-            positions = [pos]
+        # NOTE only the positions are transformed, orientations are kept as recorded
+        pose_array = pose_array.transformed(matrix, rotate_orientations=False)
+
+    poses = pose_array.to_poses()
+    positions = pose_array.to_vector3r_list()
 
     if args.axes:
         client.simPlotTransforms(poses, scale=100.0, thickness=2.5, is_persistent=True)
@@ -1,5 +1,4 @@
 import os
-import sys
 import time
 import argparse
 
@@ -12,7 +11,7 @@ from ff.types import to_xyz_str, to_xyz_tuple
 from ie.airsimy import (
     YAW_N,
     AirSimImage,
-    AirSimRecord,
+    AirSimRecordWriter,
     AirSimNedTransform,
     connect,
     viewport_vectors,
@@ -91,7 +90,7 @@ def fly(client: airsim.MultirotorClient, args: argparse.Namespace) -> None:
             client.simPlotPoints(camera_positions, Rgba.Red, is_persistent=True)
             client.simPlotLineStrip(camera_positions, Rgba.Magenta, thickness=2.5, is_persistent=True)
 
-    airsim_record = []
+    airsim_record = None  # NOTE opened when the first image is captured
 
     def do_stuff_at_uavmvs_viewpoint(i, pose):
         nonlocal client, camera_poses, airsim_record
@@ -112,24 +111,22 @@ def fly(client: airsim.MultirotorClient, args: argparse.Namespace) -> None:
             path = os.path.join(args.capture_dir, path)
             airsim.write_png(path, AirSimImage.get_mono(client, ff.CameraName.front_center))
             log_string += f' saved image to "{path}"'
-            record_line = AirSimRecord.make_line_string(p, q, time_stamp=str(i), image_file=path)
-            airsim_record.append(record_line)
+            if airsim_record is None:
+                airsim_record = AirSimRecordWriter(args.record_path)
+                airsim_record.open()
+            airsim_record.write(p, q, time_stamp=i, image_file=path)
         ff.log(log_string)
 
-    for i, camera_pose in enumerate(camera_poses):
-        client.simSetVehiclePose(camera_pose, ignore_collision=True)
-        do_stuff_at_uavmvs_viewpoint(i, camera_pose)
-        time.sleep(CV_SLEEP_SEC)
-
-    if airsim_record:
-        print_to_file = args.record_path is not None
-        file = open(args.record_path, "w") if print_to_file else None
-        print(AirSimRecord.make_header_string(), file=(file if print_to_file else sys.stdout))
-        for line in airsim_record:
-            print(line, file=(file if print_to_file else sys.stdout))
-        if print_to_file:
-            file.close()
-            ff.log_info(f'Saved AirSim record to "{args.record_path}"')
+    try:
+        for i, camera_pose in enumerate(camera_poses):
+            client.simSetVehiclePose(camera_pose, ignore_collision=True)
+            do_stuff_at_uavmvs_viewpoint(i, camera_pose)
+            time.sleep(CV_SLEEP_SEC)
+    finally:
+        if airsim_record is not None:
+            airsim_record.close()
+            if args.record_path is not None:
+                ff.log_info(f'Saved AirSim record to "{args.record_path}"')
 
 
 ###############################################################################
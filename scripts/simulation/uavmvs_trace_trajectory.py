@@ -1,5 +1,4 @@
 import os
-import sys
 import time
 import argparse
 
@@ -12,7 +11,7 @@ from ff.types import to_xyz_str, to_xyz_tuple
 from ie.airsimy import (
     YAW_N,
     AirSimImage,
-    AirSimRecord,
+    AirSimRecordWriter,
     AirSimNedTransform,
     connect,
     viewport_vectors,
@@ -149,7 +148,7 @@ def fly(client: airsim.MultirotorClient, args: argparse.Namespace) -> None:
         client.simPlotPoints(camera_positions, Rgba.Blue, is_persistent=True)
         client.simPlotLineStrip(camera_positions, Rgba.Cyan, thickness=2.5, is_persistent=True)
 
-    airsim_record = []
+    airsim_record = None  # NOTE opened when the first image is captured
 
     def do_stuff_at_uavmvs_viewpoint(i, pose):
         nonlocal client, camera_poses, airsim_record
@@ -167,68 +166,66 @@ def fly(client: airsim.MultirotorClient, args: argparse.Namespace) -> None:
             path = os.path.join(args.capture_dir, path)
             airsim.write_png(path, AirSimImage.get_mono(client, CAPTURE_CAMERA))
             log_string += f' saved image to "{path}"'
-            record_line = AirSimRecord.make_line_string(p, q, time_stamp=str(i), image_file=path)
-            airsim_record.append(record_line)
+            if airsim_record is None:
+                airsim_record = AirSimRecordWriter(args.record_path)
+                airsim_record.open()
+            airsim_record.write(p, q, time_stamp=i, image_file=path)
         ff.log(log_string)
 
-    if IS_CV_MODE:
-        for i, camera_pose in enumerate(camera_poses):
-            client.simSetVehiclePose(camera_pose, ignore_collision=True)
-            do_stuff_at_uavmvs_viewpoint(i, camera_pose)
-            time.sleep(CV_SLEEP_SEC)
-    else:
-        # hover_z = -50
-        hover_z = -10
-        client.moveToZAsync(z=hover_z, velocity=max(10, VELOCITY)).join()  # XXX avoid colliding on take off
-        client.hoverAsync().join()
-        mean_position_error = 0.0
-
-        for i, camera_pose in enumerate(camera_poses):
-            client.moveToPositionAsync(
-                *to_xyz_tuple(camera_pose.position),
-                velocity=VELOCITY,
-                drivetrain=DrivetrainType.MaxDegreeOfFreedom,
-                yaw_mode=YawMode(is_rate=False, yaw_or_rate=YAW_N),
-            ).join()
-
-            with pose_at_simulation_pause(client) as real_pose:
-                # NOTE when we pre-compute the viewpoint's camera orientation, we use the
-                # expected drone position, which (should be close, but) is not the actual
-                # drone position. Hence, we could experiment with using fake orientation:
-                # quaternion_orientation_from_eye_to_look_at(real_pose.position, LOOK_AT_TARGET)
-                fake_pose = Pose(real_pose.position, camera_pose.orientation)
-
-                # if CAPTURE_CAMERA == ff.CameraName.bottom_center:
-                #     fake_pose = Pose(real_pose.position, Quaternionr())  # XXX XXX XXX
-                # client.simSetVehiclePose(fake_pose, ignore_collision=True)
-                # client.simContinueForFrames(1)  # NOTE ensures pose change
-                # do_stuff_at_uavmvs_viewpoint(i, fake_pose)
-                # client.simSetVehiclePose(real_pose, ignore_collision=True)
-
-                if CAPTURE_CAMERA == ff.CameraName.bottom_center:
-                    do_stuff_at_uavmvs_viewpoint(i, fake_pose)  # XXX XXX XXX
-                else:
-                    client.simSetVehiclePose(fake_pose, ignore_collision=True)
-                    client.simContinueForFrames(1)  # NOTE ensures pose change
-                    do_stuff_at_uavmvs_viewpoint(i, fake_pose)
-                    client.simSetVehiclePose(real_pose, ignore_collision=True)
-
-                position_error = real_pose.position.distance_to(camera_pose.position)
-                mean_position_error += position_error
-                ff.log_debug(f"{position_error = }")
-
-        mean_position_error /= len(camera_poses)
-        ff.log_debug(f"{mean_position_error = }")
-
-    if airsim_record:
-        print_to_file = args.record_path is not None
-        file = open(args.record_path, "w") if print_to_file else None
-        print(AirSimRecord.make_header_string(), file=(file if print_to_file else sys.stdout))
-        for line in airsim_record:
-            print(line, file=(file if print_to_file else sys.stdout))
-        if print_to_file:
-            file.close()
-            ff.log_info(f'Saved AirSim record to "{args.record_path}"')
+    try:
+        if IS_CV_MODE:
+            for i, camera_pose in enumerate(camera_poses):
+                client.simSetVehiclePose(camera_pose, ignore_collision=True)
+                do_stuff_at_uavmvs_viewpoint(i, camera_pose)
+                time.sleep(CV_SLEEP_SEC)
+        else:
+            # hover_z = -50
+            hover_z = -10
+            client.moveToZAsync(z=hover_z, velocity=max(10, VELOCITY)).join()  # XXX avoid colliding on take off
+            client.hoverAsync().join()
+            mean_position_error = 0.0
+
+            for i, camera_pose in enumerate(camera_poses):
+                client.moveToPositionAsync(
+                    *to_xyz_tuple(camera_pose.position),
+                    velocity=VELOCITY,
+                    drivetrain=DrivetrainType.MaxDegreeOfFreedom,
+                    yaw_mode=YawMode(is_rate=False, yaw_or_rate=YAW_N),
+                ).join()
+
+                with pose_at_simulation_pause(client) as real_pose:
+                    # NOTE when we pre-compute the viewpoint's camera orientation, we use the
+                    # expected drone position, which (should be close, but) is not the actual
+                    # drone position. Hence, we could experiment with using fake orientation:
+                    # quaternion_orientation_from_eye_to_look_at(real_pose.position, LOOK_AT_TARGET)
+                    fake_pose = Pose(real_pose.position, camera_pose.orientation)
+
+                    # if CAPTURE_CAMERA == ff.CameraName.bottom_center:
+                    #     fake_pose = Pose(real_pose.position, Quaternionr())  # XXX XXX XXX
+                    # client.simSetVehiclePose(fake_pose, ignore_collision=True)
+                    # client.simContinueForFrames(1)  # NOTE ensures pose change
+                    # do_stuff_at_uavmvs_viewpoint(i, fake_pose)
+                    # client.simSetVehiclePose(real_pose, ignore_collision=True)
+
+                    if CAPTURE_CAMERA == ff.CameraName.bottom_center:
+                        do_stuff_at_uavmvs_viewpoint(i, fake_pose)  # XXX XXX XXX
+                    else:
+                        client.simSetVehiclePose(fake_pose, ignore_collision=True)
+                        client.simContinueForFrames(1)  # NOTE ensures pose change
+                        do_stuff_at_uavmvs_viewpoint(i, fake_pose)
+                        client.simSetVehiclePose(real_pose, ignore_collision=True)
+
+                    position_error = real_pose.position.distance_to(camera_pose.position)
+                    mean_position_error += position_error
+                    ff.log_debug(f"{position_error = }")
+
+            mean_position_error /= len(camera_poses)
+            ff.log_debug(f"{mean_position_error = }")
+    finally:
+        if airsim_record is not None:
+            airsim_record.close()
+            if args.record_path is not None:
+                ff.log_info(f'Saved AirSim record to "{args.record_path}"')
 
 
 ###############################################################################
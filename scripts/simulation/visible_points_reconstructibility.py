@@ -121,13 +121,17 @@ if __name__ == "__main__":
     import ie.airsimy as airsimy
     import ie.open3dy as o3dy
 
-    from visible_points_with_normals import visible_points_with_normals
+    from visible_points_with_normals import visible_points_with_normals, visible_points_by_zbuffer
 
     parser = argparse.ArgumentParser()
     parser.add_argument("pcd_path", type=str)
     parser.add_argument("rec_path", type=str)
     parser.add_argument("--align_path", type=str)
     parser.add_argument("--max_points", type=int, default=10_000)
+    parser.add_argument("--zbuffer", action="store_true", help="Use a depth buffer instead of HPR")
+    parser.add_argument("--zbuffer_width", type=int, default=160, help="Depth buffer width")
+    parser.add_argument("--hfov", type=float, default=90, help="Horizontal field of view (in degrees)")
+    parser.add_argument("--aspect_ratio", type=float, default=16 / 9, help="Image width / height")
     args = parser.parse_args()
 
     pcd = o3d.io.read_point_cloud(args.pcd_path, print_progress=True)
@@ -147,10 +151,7 @@ if __name__ == "__main__":
     else:
         align_pcd_to_airsim = None
 
-    view_poses = [
-        airsim.Pose(rec.position, rec.orientation)
-        for rec in airsimy.AirSimRecord.list_from(args.rec_path)
-    ]
+    view_poses = airsimy.AirSimRecord.table_from(args.rec_path)
 
     client = airsimy.connect(ff.SimMode.ComputerVision)
     # client = airsimy.connect(ff.SimMode.Multirotor)
@@ -160,32 +161,47 @@ if __name__ == "__main__":
     # client.simPlotTransforms(view_poses, 200, 3, -1, True)
 
     for i, pose in enumerate(view_poses):
-        tl, tr, bl, br = airsimy.viewport_vectors(pose, hfov_degrees=90, aspect_ratio=(16 / 9))
+        tl, tr, bl, br = airsimy.viewport_vectors(pose, hfov_degrees=args.hfov, aspect_ratio=args.aspect_ratio)
         viewport_points = airsimy.frustum_plot_list_from_viewport_vectors(pose, tl, tr, bl, br)
         client.simPlotLineList(viewport_points, [1, 1, 1, 1], 3, 30, False)
         client.simPlotTransformsWithNames(
             [pose], [f"pose #{i}"], 200, 3, 1, [0, 0, 0, 1], 30
         )
 
-    # ref.: https://stackoverflow.com/a/60291167
-    visibility_matrix = np.array(
-        [
-            np.array(
-                np.isin(
-                    np.arange(len(pcd_points)),
-                    visible_points_with_normals(
-                        view.position.to_numpy_array(), pcd_points, align_pcd_to_airsim
-                    ).points_indices_in_original_pcd,
+    if args.zbuffer:
+        zbuffer_width = args.zbuffer_width
+        zbuffer_height = int(round(zbuffer_width / args.aspect_ratio))
+        visibility_matrix = visible_points_by_zbuffer(
+            view_poses.positions,
+            view_poses.orientations,
+            pcd_points,
+            align_pcd_to_airsim,
+            airsimy.AirSimImage.compute_camera_intrinsics(
+                zbuffer_width, zbuffer_height, fov=args.hfov, is_degrees=True
+            ),
+            zbuffer_width,
+            zbuffer_height,
+        )
+    else:
+        # ref.: https://stackoverflow.com/a/60291167
+        visibility_matrix = np.array(
+            [
+                np.array(
+                    np.isin(
+                        np.arange(len(pcd_points)),
+                        visible_points_with_normals(
+                            view_position, pcd_points, align_pcd_to_airsim
+                        ).points_indices_in_original_pcd,
+                    )
                 )
-            )
-            for view in view_poses
-        ]
-    )
+                for view_position in view_poses.positions
+            ]
+        )
     assert visibility_matrix.shape == (len(view_poses), len(pcd_points))
 
-    pcd.orient_normals_towards_camera_location(view_poses[0].position.to_numpy_array())  # FIXME flip y and z
+    pcd.orient_normals_towards_camera_location(view_poses.positions[0])  # FIXME flip y and z
 
-    view_positions = np.array([view.position.to_numpy_array() for view in view_poses])
+    view_positions = view_poses.positions
 
     camera_indices_mask = [i for i in range(len(view_positions))]
     # camera_indices_mask = [0, 1]
@@ -1,4 +1,4 @@
-from typing import Optional, NamedTuple
+from typing import List, Tuple, Optional, NamedTuple
 
 import numpy as np
 
@@ -6,6 +6,21 @@ KNN_MAX = 24
 KNN_RADIUS = None
 FAST_NORMAL_COMPUTATION = True
 
+ZBUFFER_NEAR = 0.1  # minimum depth (i.e. distance along the camera's forward axis)
+ZBUFFER_DEPTH_TOLERANCE = 0.05  # relative depth, for points splatted onto the same pixel
+ZBUFFER_VIEWS_PER_CHUNK = 16  # number of views that are projected at once
+
+
+def _transformed_points(pcd_points: np.ndarray, transform_pcd_points: Optional[np.ndarray]) -> np.ndarray:
+    if transform_pcd_points is None:
+        return pcd_points
+
+    n, _ = pcd_points.shape
+    assert transform_pcd_points.shape == (4, 4)
+    points = np.hstack((pcd_points, np.ones((n, 1))))
+    points = np.einsum("ij,nj->ni", transform_pcd_points, points)
+    return points[:, :3]
+
 
 class CameraVisible(NamedTuple):
     points: np.ndarray
@@ -26,13 +41,7 @@ def visible_points_with_normals(
     assert pcd_points.shape[1] == 3
     assert camera_position.shape == (3,)
 
-    if transform_pcd_points is None:
-        points = pcd_points
-    else:
-        assert transform_pcd_points.shape == (4, 4)
-        points = np.hstack((pcd_points, np.ones((n, 1))))
-        points = np.einsum("ij,nj->ni", transform_pcd_points, points)
-        points = points[:, :3]
+    points = _transformed_points(pcd_points, transform_pcd_points)
 
     points_squared_distance_to_camera = np.array(
         [np.dot(camera_position - point, camera_position - point) for point in points]
@@ -76,6 +85,106 @@ def visible_points_with_normals(
     )
 
 
+###############################################################################
+###############################################################################
+
+
+def project_points(
+    points: np.ndarray,
+    camera_positions: np.ndarray,
+    camera_orientations: np.ndarray,
+    intrinsics: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """ Projects `points` (with shape `(p, 3)`) onto each of the `n` cameras (i.e. pinhole
+        models with the given `intrinsics` matrix, e.g. from `AirSimImage.compute_camera_intrinsics`).
+
+        Returns the `(n, p, 2)` pixel coordinates and the `(n, p)` depths of the points.
+
+        Note: `camera_orientations` are WXYZ quaternions, and cameras follow AirSim's convention
+        of looking down their (NED) local +x axis, with +y pointing right and +z pointing down.
+    """
+    from ds.pose_array import quaternion_to_matrix
+
+    camera_positions = np.asarray(camera_positions, dtype=np.float64).reshape((-1, 3))
+    R = quaternion_to_matrix(np.asarray(camera_orientations, dtype=np.float64).reshape((-1, 4)))
+
+    # world -> camera, i.e. R^T (p - t), for each camera (with row vectors)
+    points_in_camera = (points[None, :, :] - camera_positions[:, None, :]) @ R
+    depth = points_in_camera[..., 0]
+
+    f_u, f_v = intrinsics[0, 0], intrinsics[1, 1]
+    c_u, c_v = intrinsics[0, 2], intrinsics[1, 2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u = c_u + f_u * points_in_camera[..., 1] / depth
+        v = c_v + f_v * points_in_camera[..., 2] / depth
+
+    return np.stack([u, v], axis=-1), depth
+
+
+def visible_points_by_zbuffer(
+    camera_positions: np.ndarray,
+    camera_orientations: np.ndarray,
+    pcd_points: np.ndarray,
+    transform_pcd_points: Optional[np.ndarray],
+    intrinsics: np.ndarray,
+    image_width: int,
+    image_height: int,
+    near: float = ZBUFFER_NEAR,
+    depth_tolerance: float = ZBUFFER_DEPTH_TOLERANCE,
+    views_per_chunk: int = ZBUFFER_VIEWS_PER_CHUNK,
+) -> np.ndarray:
+    """ Splats the points into a (low resolution) depth buffer for each camera, keeping the
+        closest depth per pixel, and returns the `(n, p)` boolean visibility matrix, where a
+        point is visible if it lies within the view and (roughly) at the pixel's depth.
+
+        Note: this is an alternative to the hidden point removal in `visible_points_with_normals`
+        that (also) takes into account the camera orientation and field of view, and it is
+        deterministic, since it doesn't depend on convex hulls of (spherically flipped) points.
+    """
+    points = _transformed_points(pcd_points, transform_pcd_points)
+    camera_positions = np.asarray(camera_positions, dtype=np.float64).reshape((-1, 3))
+    camera_orientations = np.asarray(camera_orientations, dtype=np.float64).reshape((-1, 4))
+
+    n, p = len(camera_positions), len(points)
+    n_pixels = image_width * image_height
+    visible = np.zeros((n, p), dtype=bool)
+
+    for start in range(0, n, views_per_chunk):
+        stop = min(start + views_per_chunk, n)
+        uv, depth = project_points(
+            points, camera_positions[start:stop], camera_orientations[start:stop], intrinsics
+        )
+
+        with np.errstate(invalid="ignore"):
+            col = np.floor(uv[..., 0])
+            row = np.floor(uv[..., 1])
+            in_view = (depth > near) & (col >= 0) & (col < image_width) & (row >= 0) & (row < image_height)
+
+        # NOTE each (view, pixel) pair gets a single slot in a flattened depth buffer
+        view_index, point_index = np.nonzero(in_view)
+        pixel = view_index * n_pixels + (row[in_view] * image_width + col[in_view]).astype(np.int64)
+        point_depth = depth[in_view]
+
+        zbuffer = np.full((stop - start) * n_pixels, np.inf)
+        np.minimum.at(zbuffer, pixel, point_depth)
+
+        is_closest = point_depth <= zbuffer[pixel] * (1 + depth_tolerance)
+        visible[start + view_index[is_closest], point_index[is_closest]] = True
+
+    return visible
+
+
+def visible_point_indices_by_zbuffer(*args, **kwargs) -> List[np.ndarray]:
+    """ Returns the indices of the visible points (in the original `pcd_points`) for each view.
+        See `visible_points_by_zbuffer`, which takes the same arguments.
+    """
+    return [np.flatnonzero(row) for row in visible_points_by_zbuffer(*args, **kwargs)]
+
+
+###############################################################################
+###############################################################################
+
+
 if __name__ == "__main__":
     import sys
     import argparse
@@ -3,4 +3,6 @@ from .rgba import *
 from .edit_mode import *
 #from .move_args import *
 from .controller import *
+from .pose_array import *
+from .image_join import *
 #from .debug_draw import *
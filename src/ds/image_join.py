@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import os
+import re
+
+from typing import Dict, List, Callable, Optional, Sequence, NamedTuple
+
+import numpy as np
+
+###############################################################################
+## Join keys ##################################################################
+###############################################################################
+
+
+def image_name_key(path: str) -> str:
+    """ Returns the normalized (lowercase) basename of `path`, which can be either a Windows path
+        (e.g. from AirSim's recordings) or a POSIX path (e.g. from Meshroom's cameras.sfm).
+    """
+    return os.path.basename(path.replace("\\", "/")).lower()
+
+
+def capture_index_key(path: str) -> Optional[int]:
+    """ Returns the last number in the basename of `path` (without its extension), e.g. the
+        capture index of `"pose_012.png"` is 12, or None if there's no number in it.
+    """
+    stem, _ = os.path.splitext(image_name_key(path))
+    numbers = re.findall(r"\d+", stem)
+    return int(numbers[-1]) if numbers else None
+
+
+###############################################################################
+## Hash join ##################################################################
+###############################################################################
+
+
+class ImageJoin(NamedTuple):
+    """ Result of joining two sequences of image paths (see `join_image_paths`). """
+
+    left_indices: np.ndarray  # (m,) indices of matched items in `left`
+    right_indices: np.ndarray  # (m,) indices of matched items in `right`, aligned with `left_indices`
+    unmatched_left: np.ndarray  # indices of items in `left` without a match in `right`
+    unmatched_right: np.ndarray  # indices of items in `right` without a match in `left`
+
+    def __len__(self) -> int:
+        return len(self.left_indices)
+
+    def report(self, left_name: str = "left", right_name: str = "right") -> str:
+        return (
+            f"{len(self.left_indices)} matches"
+            f" ({len(self.unmatched_left)} unmatched {left_name},"
+            f" {len(self.unmatched_right)} unmatched {right_name})"
+        )
+
+
+def join_image_paths(
+    left: Sequence[str],
+    right: Sequence[str],
+    key_fn: Callable[[str], object] = image_name_key,
+) -> ImageJoin:
+    """ Matches the items of `left` and `right` that have the same (non-None) `key_fn(path)`,
+        by hashing the keys of `right` once, so it runs in linear time (instead of quadratic).
+
+        Note: keys must be unique in `right`, while keys in `left` can repeat (e.g. when a
+        recording has more than one row for the same image file).
+    """
+    right_index: Dict[object, int] = {}
+    for j, path in enumerate(right):
+        key = key_fn(path)
+        if key is None:
+            continue
+        assert key not in right_index, f"Ambiguous key {key!r} for '{right[right_index[key]]}' and '{path}'"
+        right_index[key] = j
+
+    left_indices: List[int] = []
+    right_indices: List[int] = []
+    unmatched_left: List[int] = []
+    for i, path in enumerate(left):
+        j = right_index.get(key_fn(path), None)
+        if j is None:
+            unmatched_left.append(i)
+        else:
+            left_indices.append(i)
+            right_indices.append(j)
+
+    is_matched_right = np.zeros(len(right), dtype=bool)
+    is_matched_right[right_indices] = True
+
+    return ImageJoin(
+        np.array(left_indices, dtype=np.int64),
+        np.array(right_indices, dtype=np.int64),
+        np.array(unmatched_left, dtype=np.int64),
+        np.flatnonzero(~is_matched_right),
+    )
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+from typing import Dict, List, Union, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+from airsim.types import Pose, Vector3r, Quaternionr
+
+###############################################################################
+## Batched quaternion math ####################################################
+###############################################################################
+
+
+# NOTE quaternions are stored as (n, 4) arrays in WXYZ order, which matches the
+# column order of AirSim's airsim_rec.txt (Q_W Q_X Q_Y Q_Z) and of uavmvs' .csv
+# files (qw,qx,qy,qz), but *not* the order of `Quaternionr.to_numpy_array()`.
+
+
+def quaternion_normalize(q: np.ndarray) -> np.ndarray:
+    """ Returns the unit quaternions of `q` (WXYZ, with shape `(..., 4)`). """
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def quaternion_conjugate(q: np.ndarray) -> np.ndarray:
+    """ Returns the conjugates of `q` (WXYZ, with shape `(..., 4)`). """
+    return q * np.array([1.0, -1.0, -1.0, -1.0])
+
+
+def quaternion_multiply(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """ Returns the (broadcasted) Hamilton product `a * b` of WXYZ quaternions. """
+    aw, ax, ay, az = np.moveaxis(np.asarray(a, dtype=np.float64), -1, 0)
+    bw, bx, by, bz = np.moveaxis(np.asarray(b, dtype=np.float64), -1, 0)
+    return np.stack(
+        [
+            aw * bw - ax * bx - ay * by - az * bz,
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+        ],
+        axis=-1,
+    )
+
+
+def quaternion_rotate(q: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """ Rotates the vectors `v` (with shape `(..., 3)`) by the unit quaternions `q`.
+
+        Note: this is a batched version of `ie.airsimy.vector_rotated_by_quaternion`.
+    """
+    q = np.asarray(q, dtype=np.float64)
+    s, u = q[..., :1], q[..., 1:]
+    # ref.: https://gitlab.com/libeigen/eigen/-/blob/master/Eigen/src/Geometry/Quaternion.h (_transformVector)
+    uv = 2 * np.cross(u, v)
+    return v + s * uv + np.cross(u, uv)
+
+
+def quaternion_to_matrix(q: np.ndarray) -> np.ndarray:
+    """ Converts unit WXYZ quaternions with shape `(..., 4)` to `(..., 3, 3)` rotation matrices. """
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=np.float64), -1, 0)
+
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+
+    return np.stack(
+        [
+            np.stack([1 - 2 * (yy + zz),     2 * (xy - wz),     2 * (xz + wy)], axis=-1),
+            np.stack([    2 * (xy + wz), 1 - 2 * (xx + zz),     2 * (yz - wx)], axis=-1),
+            np.stack([    2 * (xz - wy),     2 * (yz + wx), 1 - 2 * (xx + yy)], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+def quaternion_from_matrix(R: np.ndarray) -> np.ndarray:
+    """ Converts `(..., 3, 3)` rotation matrices to unit WXYZ quaternions with shape `(..., 4)`.
+
+        Note: all four candidate solutions are computed and the most numerically
+        stable one is selected per matrix, so there's no Python-level branching.
+    """
+    R = np.asarray(R, dtype=np.float64)
+    r00, r11, r22 = R[..., 0, 0], R[..., 1, 1], R[..., 2, 2]
+
+    # ref.: https://www.euclideanspace.com/maths/geometry/rotations/conversions/matrixToQuaternion/
+    candidates = np.stack(
+        [
+            [1 + r00 + r11 + r22, R[..., 2, 1] - R[..., 1, 2], R[..., 0, 2] - R[..., 2, 0], R[..., 1, 0] - R[..., 0, 1]],
+            [R[..., 2, 1] - R[..., 1, 2], 1 + r00 - r11 - r22, R[..., 0, 1] + R[..., 1, 0], R[..., 0, 2] + R[..., 2, 0]],
+            [R[..., 0, 2] - R[..., 2, 0], R[..., 0, 1] + R[..., 1, 0], 1 - r00 + r11 - r22, R[..., 1, 2] + R[..., 2, 1]],
+            [R[..., 1, 0] - R[..., 0, 1], R[..., 0, 2] + R[..., 2, 0], R[..., 1, 2] + R[..., 2, 1], 1 - r00 - r11 + r22],
+        ]
+    )  # (4, 4, ...), where candidates[i, i] == 4 * q[i] ** 2
+    candidates = np.moveaxis(candidates, (0, 1), (-2, -1))  # (..., 4, 4)
+
+    i = np.argmax(np.diagonal(candidates, axis1=-2, axis2=-1), axis=-1)
+    q = np.take_along_axis(candidates, i[..., None, None], axis=-2)[..., 0, :]
+    q = quaternion_normalize(q)
+
+    # NOTE keep the scalar part non-negative, since q and -q represent the same rotation
+    return np.where(q[..., :1] < 0, -q, q)
+
+
+def quaternion_log(q: np.ndarray) -> np.ndarray:
+    """ Returns the logarithms of the unit quaternions `q` (i.e. pure WXYZ quaternions). """
+    q = np.asarray(q, dtype=np.float64)
+    v_norm = np.linalg.norm(q[..., 1:], axis=-1, keepdims=True)
+    theta = np.arctan2(v_norm, q[..., :1])
+    scale = np.where(v_norm > 1e-12, theta / np.maximum(v_norm, 1e-12), 1.0)
+    return np.concatenate([np.zeros_like(theta), q[..., 1:] * scale], axis=-1)
+
+
+def quaternion_exp(q: np.ndarray) -> np.ndarray:
+    """ Returns the exponentials of the pure quaternions `q` (i.e. unit WXYZ quaternions). """
+    q = np.asarray(q, dtype=np.float64)
+    theta = np.linalg.norm(q[..., 1:], axis=-1, keepdims=True)
+    scale = np.where(theta > 1e-12, np.sin(theta) / np.maximum(theta, 1e-12), 1.0)
+    return np.concatenate([np.cos(theta), q[..., 1:] * scale], axis=-1)
+
+
+def quaternion_slerp(q0: np.ndarray, q1: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """ Spherical linear interpolation between the unit quaternions `q0` and `q1` at `t`.
+
+        Note: `q1` is negated wherever needed so that the shortest arc is taken, and
+        `q0`, `q1` (with shape `(..., 4)`) and `t` (with shape `(...)`) are broadcasted.
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., None]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.clip(np.abs(dot), 0.0, 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # NOTE fall back to (normalized) linear interpolation for nearly parallel quaternions
+    is_close = sin_theta < 1e-6
+    sin_theta = np.where(is_close, 1.0, sin_theta)
+    w0 = np.where(is_close, 1 - t, np.sin((1 - t) * theta) / sin_theta)
+    w1 = np.where(is_close, t, np.sin(t * theta) / sin_theta)
+
+    return quaternion_normalize(w0 * q0 + w1 * q1)
+
+
+###############################################################################
+## Pose array #################################################################
+###############################################################################
+
+
+class PoseArray:
+    """ Structure-of-arrays representation of a sequence of (camera or vehicle) poses.
+
+        Stores `positions` as a `(n, 3)` array, `orientations` as `(n, 4)` WXYZ quaternions
+        and `time_stamps` as `(n,)` integers, with optional `image_files` and `ids` columns.
+        Conversion to (and from) `airsim.Pose` objects should only happen at API boundaries.
+    """
+
+    def __init__(
+        self,
+        positions: np.ndarray,
+        orientations: Optional[np.ndarray] = None,
+        time_stamps: Optional[np.ndarray] = None,
+        image_files: Optional[Sequence[str]] = None,
+        ids: Optional[np.ndarray] = None,
+    ):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape((-1, 3))
+        n = len(self.positions)
+
+        if orientations is None:
+            orientations = np.tile([1.0, 0.0, 0.0, 0.0], (n, 1))
+        self.orientations = np.asarray(orientations, dtype=np.float64).reshape((-1, 4))
+        assert self.orientations.shape == (n, 4), self.orientations.shape
+
+        if time_stamps is None:
+            time_stamps = np.arange(n)
+        self.time_stamps = np.asarray(time_stamps, dtype=np.int64).reshape((-1,))
+        assert self.time_stamps.shape == (n,), self.time_stamps.shape
+
+        # NOTE image paths are kept as Python strings (i.e. an object array), so that
+        # they are shared with the caller instead of being copied into fixed-width rows
+        self.image_files = None if image_files is None else np.asarray(image_files, dtype=object).reshape((-1,))
+        assert self.image_files is None or self.image_files.shape == (n,), self.image_files.shape
+
+        self.ids = None if ids is None else np.asarray(ids, dtype=np.int64).reshape((-1,))
+        assert self.ids is None or self.ids.shape == (n,), self.ids.shape
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __repr__(self) -> str:
+        columns = ["positions", "orientations", "time_stamps"]
+        if self.image_files is not None: columns.append("image_files")
+        if self.ids is not None: columns.append("ids")
+        return f"PoseArray(n={len(self)}, columns=[{', '.join(columns)}])"
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray, List[int]]) -> PoseArray:
+        """ Returns a new `PoseArray` with the selected rows (`index` can be an int, a slice,
+            an array of indices or a boolean mask).
+
+            Note: use `pose(i)` to get the i-th row as an `airsim.Pose`.
+        """
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, (index + 1) or None)  # NOTE (-1 + 1) or None == None
+        return PoseArray(
+            self.positions[index],
+            self.orientations[index],
+            self.time_stamps[index],
+            None if self.image_files is None else self.image_files[index],
+            None if self.ids is None else self.ids[index],
+        )
+
+    def __iter__(self) -> Iterator[Pose]:
+        """ Yields each row as an `airsim.Pose` (see `to_poses`). """
+        return iter(self.to_poses())
+
+    def copy(self) -> PoseArray:
+        return PoseArray(
+            self.positions.copy(),
+            self.orientations.copy(),
+            self.time_stamps.copy(),
+            None if self.image_files is None else self.image_files.copy(),
+            None if self.ids is None else self.ids.copy(),
+        )
+
+    ###########################################################################
+    ## Conversions ############################################################
+    ###########################################################################
+
+    @staticmethod
+    def from_poses(
+        poses: Iterable[Pose],
+        time_stamps: Optional[np.ndarray] = None,
+        image_files: Optional[Sequence[str]] = None,
+        ids: Optional[np.ndarray] = None,
+    ) -> PoseArray:
+        """ Creates a `PoseArray` from a sequence of `airsim.Pose` objects. """
+        poses = list(poses)
+        return PoseArray(
+            [(p.position.x_val, p.position.y_val, p.position.z_val) for p in poses],
+            [(p.orientation.w_val, p.orientation.x_val, p.orientation.y_val, p.orientation.z_val) for p in poses],
+            time_stamps,
+            image_files,
+            ids,
+        )
+
+    @staticmethod
+    def from_records(records: Iterable) -> PoseArray:
+        """ Creates a `PoseArray` from a sequence of `ie.airsimy.AirSimRecord` objects. """
+        records = list(records)
+        return PoseArray.from_poses(
+            [Pose(r.position, r.orientation) for r in records],
+            time_stamps=[r.time_stamp for r in records],
+            image_files=[r.image_file for r in records],
+        )
+
+    def image_index(self) -> Dict[str, int]:
+        """ Returns a dictionary mapping image file to row index (like `AirSimRecord.dict_from`,
+            the last row is kept for repeated image files).
+        """
+        assert self.image_files is not None
+        return {image_file: i for i, image_file in enumerate(self.image_files.tolist())}
+
+    def pose(self, i: int) -> Pose:
+        """ Returns the i-th row as an `airsim.Pose`. """
+        (x, y, z), (qw, qx, qy, qz) = self.positions[i].tolist(), self.orientations[i].tolist()
+        return Pose(Vector3r(x, y, z), Quaternionr(qx, qy, qz, qw))
+
+    def to_poses(self) -> List[Pose]:
+        """ Converts every row into an `airsim.Pose` (e.g. to call AirSim's plotting APIs). """
+        return [
+            Pose(Vector3r(x, y, z), Quaternionr(qx, qy, qz, qw))
+            for (x, y, z), (qw, qx, qy, qz) in zip(self.positions.tolist(), self.orientations.tolist())
+        ]
+
+    def to_vector3r_list(self) -> List[Vector3r]:
+        """ Converts every position into a `Vector3r` (e.g. to call `client.simPlotPoints`). """
+        return [Vector3r(x, y, z) for x, y, z in self.positions.tolist()]
+
+    def to_xyz_xyzw_array(self) -> np.ndarray:
+        """ Returns a `(n, 7)` array with rows `tx ty tz qx qy qz qw` (e.g. for TartanAir's evaluator). """
+        return np.hstack((self.positions, self.orientations[:, [1, 2, 3, 0]]))
+
+    def rotation_matrices(self) -> np.ndarray:
+        """ Returns the orientations as `(n, 3, 3)` rotation matrices. """
+        return quaternion_to_matrix(self.orientations)
+
+    def matrices(self) -> np.ndarray:
+        """ Returns the poses as `(n, 4, 4)` homogeneous transformation matrices. """
+        matrices = np.zeros((len(self), 4, 4))
+        matrices[:, :3, :3] = self.rotation_matrices()
+        matrices[:, :3, 3] = self.positions
+        matrices[:, 3, 3] = 1
+        return matrices
+
+    ###########################################################################
+    ## Vectorized operations ##################################################
+    ###########################################################################
+
+    @staticmethod
+    def concatenate(pose_arrays: Sequence[PoseArray]) -> PoseArray:
+        """ Concatenates the rows of `pose_arrays` (optional columns are only
+            kept if they are present in every one of the arrays).
+        """
+        assert len(pose_arrays) > 0
+        has_image_files = all(_.image_files is not None for _ in pose_arrays)
+        has_ids = all(_.ids is not None for _ in pose_arrays)
+        return PoseArray(
+            np.concatenate([_.positions for _ in pose_arrays]),
+            np.concatenate([_.orientations for _ in pose_arrays]),
+            np.concatenate([_.time_stamps for _ in pose_arrays]),
+            np.concatenate([_.image_files for _ in pose_arrays]) if has_image_files else None,
+            np.concatenate([_.ids for _ in pose_arrays]) if has_ids else None,
+        )
+
+    def _with(self, positions: np.ndarray, orientations: np.ndarray) -> PoseArray:
+        # NOTE the remaining columns are immutable in practice, so they can be shared
+        return PoseArray(positions, orientations, self.time_stamps, self.image_files, self.ids)
+
+    def translated(self, offset: np.ndarray) -> PoseArray:
+        """ Returns a copy with `offset` added to all positions. """
+        return self._with(self.positions + np.asarray(offset, dtype=np.float64), self.orientations)
+
+    def scaled(self, scale: float, center: Optional[np.ndarray] = None) -> PoseArray:
+        """ Returns a copy with all positions scaled around `center` (or the origin, if None). """
+        if center is None:
+            return self._with(self.positions * scale, self.orientations)
+        center = np.asarray(center, dtype=np.float64)
+        return self._with((self.positions - center) * scale + center, self.orientations)
+
+    def rotated(self, rotation: np.ndarray, center: Optional[np.ndarray] = None) -> PoseArray:
+        """ Returns a copy with all poses rotated around `center` (or the origin, if None),
+            where `rotation` is either a WXYZ quaternion or a 3x3 rotation matrix.
+        """
+        rotation = np.asarray(rotation, dtype=np.float64)
+        if rotation.shape == (3, 3):
+            rotation = quaternion_from_matrix(rotation)
+        assert rotation.shape == (4,), rotation
+
+        positions = self.positions if center is None else self.positions - center
+        positions = quaternion_rotate(rotation, positions)
+        if center is not None:
+            positions += center
+
+        return self._with(positions, quaternion_multiply(rotation, self.orientations))
+
+    def transformed(self, matrix: np.ndarray, rotate_orientations: bool = True) -> PoseArray:
+        """ Returns a copy with the 4x4 (similarity) transformation `matrix` applied to all
+            positions, and its rotation part to all orientations (if `rotate_orientations`).
+        """
+        matrix = np.asarray(matrix, dtype=np.float64)
+        assert matrix.shape == (4, 4), matrix
+
+        positions = self.positions @ matrix[:3, :3].T + matrix[:3, 3]
+        if not rotate_orientations:
+            return self._with(positions, self.orientations)
+
+        # NOTE remove the (uniform) scaling factor before converting the rotation
+        scale = np.cbrt(np.linalg.det(matrix[:3, :3]))
+        rotation = quaternion_from_matrix(matrix[:3, :3] / scale)
+        return self._with(positions, quaternion_multiply(rotation, self.orientations))
+
+    def distances_to(self, other: Union[PoseArray, np.ndarray]) -> np.ndarray:
+        """ Returns the `(n,)` row-wise Euclidean distances between positions. """
+        other_positions = other.positions if isinstance(other, PoseArray) else np.asarray(other)
+        return np.linalg.norm(self.positions - other_positions, axis=1)
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import io
+import os
+import sys
+import mmap
+
 from enum import Enum
-from typing import Dict, List, Tuple, Union, Optional, cast
+from typing import Dict, List, Tuple, Union, Iterator, Optional, cast
 from contextlib import contextmanager
 
 import ff
@@ -10,6 +15,8 @@ import airsim
 
 from airsim.types import Pose, Vector3r, Quaternionr
 
+from ie.npzcache import load_cached
+
 ###############################################################################
 ###############################################################################
 
@@ -61,7 +68,8 @@ class AirSimImage:
         if is_degrees:
             fov = np.deg2rad(fov)
 
-        f = image_width / (2 * np.tan(fov))
+        # NOTE `fov` is the horizontal field of view, so we use half of it for the focal length
+        f = image_width / (2 * np.tan(fov / 2))
         cu = image_width / 2
         cv = image_height / 2
 
@@ -645,6 +653,76 @@ class AirSimRecord:
                 record_dict[record.image_file] = record
         return record_dict
 
+    # NOTE bump this whenever `_table_columns_from` changes, to invalidate cached tables
+    TABLE_VERSION = 1
+
+    @staticmethod
+    def table_from(rec_file: str, use_cache: bool = True):
+        """ Parses `airsim_rec.txt` into a `ds.PoseArray` (i.e. in bulk, without a record per row),
+            with the file's `time_stamps` and `image_files` columns (see `image_index()`, and
+            `dict_from`).
+
+            Note: parsed columns are cached in a .npz sidecar file (see `ie.npzcache`), unless
+            `use_cache` is False.
+        """
+        from ds.pose_array import PoseArray
+
+        columns = load_cached(
+            rec_file,
+            "airsim_rec",
+            AirSimRecord.TABLE_VERSION,
+            AirSimRecord._table_columns_from,
+            use_cache,
+        )
+        pose_array = PoseArray(
+            columns["positions"],
+            columns["orientations"],
+            columns.get("time_stamps", None),
+            columns["image_files"].tolist() if "image_files" in columns else None,
+        )
+
+        del PoseArray
+        return pose_array
+
+    @staticmethod
+    def _table_columns_from(rec_file: str) -> Dict[str, np.ndarray]:
+        with open(rec_file, "r") as f:
+            header = f.readline().rstrip("\n").split("\t")
+            lines = f.read().splitlines()
+
+        has_time_stamp = header[0] == "TimeStamp"
+        has_image_file = header[-1] == "ImageFile"
+        n_numeric_columns = 7 + int(has_time_stamp)
+
+        if has_image_file:
+            # NOTE the image file column is the last one, and it may be empty or contain ';'
+            numeric_rows, _, image_files = (
+                zip(*[line.rpartition("\t") for line in lines]) if lines else ((), (), ())
+            )
+        else:
+            numeric_rows, image_files = lines, None
+
+        # NOTE parsing a single string is much faster than calling float() for each value
+        table = (
+            np.fromstring("\t".join(numeric_rows), dtype=np.float64, sep="\t")
+            if lines
+            else np.zeros(0)
+        )
+        assert table.size == len(lines) * n_numeric_columns, f"malformed recording file: {rec_file}"
+        table = table.reshape((-1, n_numeric_columns))
+
+        columns = {}
+        if has_time_stamp:
+            # NOTE time stamps are milliseconds (since epoch), so they're exactly representable as
+            # doubles (i.e. float64)
+            columns["time_stamps"], table = table[:, 0].astype(np.int64), table[:, 1:]
+        columns["positions"] = table[:, :3]
+        columns["orientations"] = table[:, 3:7]
+        if has_image_file:
+            columns["image_files"] = np.array(image_files, dtype=object)
+
+        return columns
+
     @staticmethod
     def make_header_string(skip_time_stamp: bool = False, skip_image_file: bool = False) -> str:
         # return "TimeStamp\tPOS_X\tPOS_Y\tPOS_Z\tQ_W\tQ_X\tQ_Y\tQ_Z\tImageFile"
@@ -674,6 +752,285 @@ class AirSimRecord:
         )
 
 
+class AirSimRecordWriter:
+    def __init__(
+        self,
+        rec_file: Optional[str] = None,
+        buffer_size: int = 256,
+        skip_time_stamp: bool = False,
+        skip_image_file: bool = False,
+    ):
+        """ Writes rows in the format of `airsim_rec.txt` to `rec_file` as they are captured,
+            buffering at most `buffer_size` rows, which are then formatted all at once.
+
+            If `rec_file` is None, the whole record is printed to stdout when the writer is closed,
+            so that it isn't interleaved with other output (i.e. so it can be copied or redirected).
+
+            Note: buffered rows are flushed on exit, even on exceptions (e.g. `KeyboardInterrupt`),
+            so the file holds every row written up to that point (instead of being empty).
+        """
+        assert buffer_size > 0
+        self.rec_file = rec_file
+        self.buffer_size = buffer_size
+        self.skip_time_stamp = skip_time_stamp
+        self.skip_image_file = skip_image_file
+
+        self._file = None
+        # POS_X POS_Y POS_Z Q_W Q_X Q_Y Q_Z
+        self._values = np.empty((buffer_size, 7), dtype=np.float64)
+        self._time_stamps = []
+        self._image_files = []
+        self._n_buffered = 0
+        self.n_written = 0
+
+        # NOTE "%r" matches `make_line_string`, since str() and repr() are the same for floats
+        row_format = "\t".join(["%r"] * 7)
+        if not skip_time_stamp:
+            row_format = "%s\t" + row_format
+        if not skip_image_file:
+            row_format = row_format + "\t%s"
+        self._row_format = row_format + "\n"
+
+    def __enter__(self) -> AirSimRecordWriter:
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open(self) -> None:
+        assert self._file is None, "already open"
+        self._file = io.StringIO() if self.rec_file is None else open(self.rec_file, "w")
+        self._file.write(
+            AirSimRecord.make_header_string(self.skip_time_stamp, self.skip_image_file) + "\n"
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        if self.rec_file is None:
+            sys.stdout.write(self._file.getvalue())
+            sys.stdout.flush()
+        self._file.close()
+        self._file = None
+
+    def write(
+        self,
+        position: Vector3r,
+        orientation: Quaternionr,
+        time_stamp: Optional[Union[int, str]] = None,
+        image_file: Optional[str] = None,
+    ) -> None:
+        """ Appends a row (see `make_line_string`), flushing the buffer if it's full. """
+        assert self._file is not None, "not open"
+        assert self.skip_time_stamp == (time_stamp is None)
+        assert self.skip_image_file == (image_file is None)
+
+        self._values[self._n_buffered] = (
+            position.x_val,
+            position.y_val,
+            position.z_val,
+            orientation.w_val,
+            orientation.x_val,
+            orientation.y_val,
+            orientation.z_val,
+        )
+        self._time_stamps.append(time_stamp)
+        self._image_files.append(image_file)
+        self._n_buffered += 1
+
+        if self._n_buffered == self.buffer_size:
+            self.flush()
+
+    def write_pose_array(self, pose_array) -> None:
+        """ Appends every row of a `ds.PoseArray` (with its time stamps and image files). """
+        assert self.skip_image_file == (pose_array.image_files is None)
+        self.flush()
+        values = np.hstack((pose_array.positions, pose_array.orientations))
+        image_files = (
+            [None] * len(values) if self.skip_image_file else pose_array.image_files.tolist()
+        )
+        for start in range(0, len(values), self.buffer_size):
+            self._write_rows(
+                values[start : start + self.buffer_size],
+                pose_array.time_stamps[start : start + self.buffer_size].tolist(),
+                image_files[start : start + self.buffer_size],
+            )
+
+    def flush(self) -> None:
+        """ Formats and writes every buffered row, then flushes the file. """
+        if self._n_buffered > 0:
+            self._write_rows(self._values[: self._n_buffered], self._time_stamps, self._image_files)
+            self._time_stamps = []
+            self._image_files = []
+            self._n_buffered = 0
+        self._file.flush()
+
+    def _write_rows(self, values: np.ndarray, time_stamps: List, image_files: List) -> None:
+        n_of_rows = len(values)
+        columns = [values.astype(object)]  # NOTE so that floats are formatted as Python floats
+        if not self.skip_time_stamp:
+            columns.insert(0, np.array(time_stamps, dtype=object).reshape((n_of_rows, 1)))
+        if not self.skip_image_file:
+            columns.append(np.array(image_files, dtype=object).reshape((n_of_rows, 1)))
+
+        # NOTE every row is formatted in a single % operation, with one row format per row
+        rows = np.concatenate(columns, axis=1).ravel().tolist()
+        self._file.write((self._row_format * n_of_rows) % tuple(rows))
+        self.n_written += n_of_rows
+
+
+class AirSimRecordReader:
+    def __init__(self, rec_file: str, index_stride: int = 1024):
+        """ Lazily reads `airsim_rec.txt`, by memory-mapping it and indexing the byte offset (and
+            `TimeStamp`) of every `index_stride`-th row, so that rows can be accessed by index or
+            time window (see `between`) without parsing the whole file, and streamed one
+            `AirSimRecord` at a time.
+
+            Note: rows are assumed to be sorted by time stamp (as in AirSim's recordings).
+        """
+        assert index_stride > 0
+        self.rec_file = rec_file
+        self.index_stride = index_stride
+
+        self._file = open(rec_file, "rb")
+        # NOTE empty files can't be memory-mapped, so we use an empty buffer instead
+        is_empty = os.fstat(self._file.fileno()).st_size == 0
+        self._mm = b"" if is_empty else mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_end = self._mm.find(b"\n")
+        header = (
+            (self._mm[:header_end] if header_end != -1 else self._mm[:])
+            .decode()
+            .rstrip("\r")
+            .split("\t")
+        )
+        self.has_time_stamp = header[0] == "TimeStamp"
+
+        self._n_rows, self._offsets = self._build_index(
+            header_end + 1 if header_end != -1 else len(self._mm)
+        )
+        self._time_stamps = (
+            np.array(
+                [int(self._mm[o : self._mm.find(b"\t", o)]) for o in self._offsets.tolist()],
+                dtype=np.int64,
+            )
+            if self.has_time_stamp
+            else None
+        )
+
+    def _build_index(
+        self, first_row_offset: int, chunk_size: int = 1 << 26
+    ) -> Tuple[int, np.ndarray]:
+        """ Counts the rows and returns the byte offsets of every `index_stride`-th row (scanning
+            the file in chunks of `chunk_size` bytes, so memory use is bounded by the sparse index).
+        """
+        size = len(self._mm)
+        buffer = (
+            np.frombuffer(self._mm, dtype=np.uint8) if size > 0 else np.zeros(0, dtype=np.uint8)
+        )
+
+        offsets = []
+        n_rows = 0
+        for chunk_start in range(first_row_offset, size, chunk_size):
+            chunk = buffer[chunk_start : chunk_start + chunk_size]
+            # NOTE rows start right after a newline (unless it's the file's last byte), or at the
+            # first row's offset
+            row_starts = np.flatnonzero(chunk == ord("\n")) + (chunk_start + 1)
+            if chunk_start == first_row_offset:
+                row_starts = np.concatenate([[first_row_offset], row_starts])
+            row_starts = row_starts[row_starts < size]
+
+            first_indexed = (-n_rows) % self.index_stride
+            offsets.append(row_starts[first_indexed :: self.index_stride])
+            n_rows += len(row_starts)
+
+        del buffer
+        return n_rows, np.concatenate(offsets) if offsets else np.zeros(0, dtype=np.int64)
+
+    def __enter__(self) -> AirSimRecordReader:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self._n_rows
+
+    def __getitem__(self, row: int) -> AirSimRecord:
+        if row < 0:
+            row += self._n_rows
+        if not 0 <= row < self._n_rows:
+            raise IndexError(row)
+        return next(self._records_from(row, row + 1))
+
+    def __iter__(self) -> Iterator[AirSimRecord]:
+        return self._records_from(0, self._n_rows)
+
+    def _lines_from(self, start: int, stop: int) -> Iterator[bytes]:
+        """ Yields the (raw) lines of rows `start` (inclusive) to `stop` (exclusive). """
+        if start >= min(stop, self._n_rows):
+            return
+        block, skip = divmod(start, self.index_stride)
+        offset = int(self._offsets[block])
+        for _ in range(skip):
+            offset = self._mm.find(b"\n", offset) + 1
+
+        for _ in range(start, min(stop, self._n_rows)):
+            end = self._mm.find(b"\n", offset)
+            end = len(self._mm) if end == -1 else end
+            yield self._mm[offset:end]
+            offset = end + 1
+
+    def _records_from(self, start: int, stop: int, step: int = 1) -> Iterator[AirSimRecord]:
+        for i, line in enumerate(self._lines_from(start, stop)):
+            if i % step == 0:
+                yield AirSimRecord._parse(*line.decode().rstrip("\r").split("\t"))
+
+    def rows(
+        self, start: int = 0, stop: Optional[int] = None, step: int = 1
+    ) -> Iterator[AirSimRecord]:
+        """ Yields the records of rows `range(start, stop, step)`, i.e. every `step`-th row. """
+        start, stop, step = slice(start, stop, step).indices(self._n_rows)
+        assert step > 0
+        if step < self.index_stride:
+            return self._records_from(start, stop, step)
+        # NOTE jump (through the index) to each row, instead of scanning the rows in between
+        return (self[row] for row in range(start, stop, step))
+
+    def row_range_between(self, t0: int, t1: int) -> Tuple[int, int]:
+        """ Returns the `(start, stop)` rows with time stamps in the closed interval `[t0, t1]`. """
+        assert self._time_stamps is not None, "the recording file has no TimeStamp column"
+
+        def first_row_after(t: int, inclusive: bool) -> int:
+            # bisect the sparse index, then scan the rows of a single block
+            bisect = np.searchsorted(self._time_stamps, t, side=("left" if inclusive else "right"))
+            block = max(0, int(bisect) - 1)
+            row = block * self.index_stride
+            for line in self._lines_from(row, (block + 1) * self.index_stride):
+                time_stamp = int(line[: line.find(b"\t")])
+                if time_stamp > t or (inclusive and time_stamp == t):
+                    return row
+                row += 1
+            return row
+
+        start = first_row_after(t0, inclusive=True)
+        stop = first_row_after(t1, inclusive=False)
+        return start, max(start, stop)
+
+    def between(self, t0: int, t1: int, step: int = 1) -> Iterator[AirSimRecord]:
+        """ Yields every `step`-th record with a time stamp in the closed interval `[t0, t1]`. """
+        start, stop = self.row_range_between(t0, t1)
+        return self.rows(start, stop, step)
+
+
 ###############################################################################
 ###############################################################################
 
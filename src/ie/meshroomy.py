@@ -1,10 +1,13 @@
 import os
+import re
 import json
 
-from typing import List
+from typing import Dict, List, Tuple, Iterator, NamedTuple
 
 import numpy as np
 
+from ie.npzcache import load_cached
+
 ###############################################################################
 ###############################################################################
 
@@ -15,12 +18,120 @@ class MeshroomParser:
         """ Parses `cameras.json`, converted from `StructureFromMotion > outputViewAndPoses`.\n
             Returns a tuple of lists `(views, poses)`.
         """
-        with open(cameras_file_path, "r") as cameras_file:
-            cameras = json.loads(cameras_file.read())  # { version featuresFolders matchesFolders views intrinsics poses }
-        views = cameras["views"]  # { viewId poseId intrinsicId resectionId path width height metadata }
-        poses = cameras["poses"]  # { poseId pose { transform { rotation center } locked } }
+        # { version featuresFolders matchesFolders views intrinsics poses }
+        views, poses = [], []
+        for section, item in MeshroomParser.iter_sfm(
+            cameras_file_path, sections=["views", "poses"]
+        ):
+            if section == "views":
+                # { viewId poseId intrinsicId resectionId path width height metadata }
+                views.append(item)
+            else:
+                poses.append(item)  # { poseId pose { transform { rotation center } locked } }
         return views, poses
 
+    # NOTE .sfm files are read in chunks of this many characters when streaming them
+    SFM_CHUNK_SIZE = 1 << 20
+
+    @staticmethod
+    def iter_sfm(sfm_file_path, sections=("views", "intrinsics", "poses", "structure")):
+        """ Streams the items of the `sections` arrays of a .sfm (or .json) file, one at a time.\n
+            Yields `(section, item)` tuples, in the same order as they appear in the file.
+
+            Note: only a single item is decoded at once (instead of the whole JSON tree), and
+            reading stops as soon as every section was seen, so `structure` (which usually is the
+            largest array, and comes last) is never parsed when it isn't one of the `sections`.
+        """
+        sections = set(sections)
+        with open(sfm_file_path, "r") as sfm_file:
+            stream = _JsonStream(sfm_file, MeshroomParser.SFM_CHUNK_SIZE)
+            for key in stream.iter_object_keys():
+                if key in sections and stream.peek() == "[":
+                    for item in stream.iter_array():
+                        yield key, item
+                    sections.remove(key)
+                    if not sections:
+                        break
+                else:
+                    stream.skip_value()
+
+    @staticmethod
+    def parse_sfm_arrays(sfm_file_path, sections=("views", "intrinsics", "poses")):
+        """ Streams the `sections` of a .sfm (or .json) file straight into numpy arrays.\n
+            Returns a dictionary with (some of) the following arrays (one row per item):
+            - views: `view_ids`, `view_pose_ids`, `view_intrinsic_ids`, `view_paths`,
+              `view_widths`, `view_heights`
+            - intrinsics: `intrinsic_ids`, `intrinsic_widths`, `intrinsic_heights`,
+              `intrinsic_focal_lengths` (in pixels, or NaN if missing),
+              `intrinsic_principal_points` (n, 2)
+            - poses: `pose_ids`, `pose_rotations` (n, 9) and `pose_centers` (n, 3)
+
+            Note: ids, widths and heights keep the same type as in the JSON file (i.e. strings).
+        """
+        strings = {
+            "views": [
+                "view_ids",
+                "view_pose_ids",
+                "view_intrinsic_ids",
+                "view_paths",
+                "view_widths",
+                "view_heights",
+            ],
+            "intrinsics": ["intrinsic_ids", "intrinsic_widths", "intrinsic_heights"],
+            "poses": ["pose_ids"],
+        }
+        floats = {
+            "intrinsics": {"intrinsic_focal_lengths": (), "intrinsic_principal_points": (2,)},
+            "poses": {"pose_rotations": (9,), "pose_centers": (3,)},
+        }
+        assert set(sections) <= set(strings.keys()), sections
+
+        string_columns = {name: [] for section in sections for name in strings[section]}
+        float_columns = {
+            name: _ArrayBuilder(row_shape)
+            for section in sections
+            for name, row_shape in floats.get(section, {}).items()
+        }
+
+        for section, item in MeshroomParser.iter_sfm(sfm_file_path, sections):
+            if section == "views":
+                view_id, pose_id, path, width, height = MeshroomParser.View.extract_from(item)
+                for name, value in zip(
+                    strings["views"], [view_id, pose_id, item["intrinsicId"], path, width, height]
+                ):
+                    string_columns[name].append(value)
+
+            elif section == "intrinsics":
+                for name, value in zip(
+                    strings["intrinsics"], [item["intrinsicId"], item["width"], item["height"]]
+                ):
+                    string_columns[name].append(value)
+                # NOTE older Meshroom versions have `pxFocalLength`, newer ones `focalLength` (mm)
+                focal_length = item.get("pxFocalLength", None)
+                if focal_length is None and "focalLength" in item and "sensorWidth" in item:
+                    focal_length = (
+                        float(item["focalLength"])
+                        * float(item["width"])
+                        / float(item["sensorWidth"])
+                    )
+                float_columns["intrinsic_focal_lengths"].append(
+                    np.nan if focal_length is None else float(focal_length)
+                )
+                float_columns["intrinsic_principal_points"].append(
+                    list(map(float, item["principalPoint"]))
+                )
+
+            else:
+                pose_id, rotation, center = MeshroomParser.Pose.extract_from(item)
+                string_columns["pose_ids"].append(pose_id)
+                float_columns["pose_rotations"].append(rotation)
+                float_columns["pose_centers"].append(center)
+
+        return {
+            **{name: np.array(column, dtype=str) for name, column in string_columns.items()},
+            **{name: builder.array() for name, builder in float_columns.items()},
+        }
+
     @staticmethod
     def extract_views_and_poses(views=None, poses=None):
         """ Returns two dictionaries, mapping:
@@ -43,6 +154,276 @@ class MeshroomParser:
 
         return _views, _poses
 
+    # NOTE bump this whenever `_views_and_poses_columns_from` changes, to invalidate cached files
+    VIEWS_AND_POSES_VERSION = 1
+
+    @staticmethod
+    def parse_views_and_poses(cameras_file_path, use_cache=True):
+        """ Same as `extract_views_and_poses(*parse_cameras(cameras_file_path))`, but the parsed
+            values are cached in a .npz sidecar file (see `ie.npzcache`), unless `use_cache` is
+            False.
+        """
+        columns = load_cached(
+            cameras_file_path,
+            "meshroom_views_and_poses",
+            MeshroomParser.VIEWS_AND_POSES_VERSION,
+            MeshroomParser._views_and_poses_columns_from,
+            use_cache,
+        )
+
+        _poses = {}
+        for pose_id, rotation, center in zip(
+            columns["pose_ids"].tolist(),
+            columns["pose_rotations"].tolist(),
+            columns["pose_centers"].tolist(),
+        ):
+            _poses[pose_id] = MeshroomParser.Pose(rotation, center)
+
+        _views = {}
+        for view_id, pose_id, path, width, height in zip(
+            columns["view_ids"].tolist(),
+            columns["view_pose_ids"].tolist(),
+            columns["view_paths"].tolist(),
+            columns["view_widths"].tolist(),
+            columns["view_heights"].tolist(),
+        ):
+            _views[view_id] = MeshroomParser.View(pose_id, path, width, height)
+            if _poses:
+                assert pose_id in _poses, f"Unexpected poseId value for {view_id=}"
+
+        return _views, _poses
+
+    class PoseArrays(NamedTuple):
+        view_index: Dict[str, int]  # maps a `view_id` to its row in the arrays below
+        view_ids: np.ndarray  # (n,) views which have a pose (note that `view_id == pose_id`)
+        paths: np.ndarray  # (n,) image file paths
+        centers: np.ndarray  # (n, 3) camera centers in world coordinates
+        rotations: np.ndarray  # (n, 3, 3) rotation matrices (see `MeshroomTransform.rotations`)
+        quaternions: np.ndarray  # (n, 4) XYZW quaternions (see `MeshroomQuaternion.XYZW`)
+
+    @staticmethod
+    def load_pose_arrays(cameras_file_path, use_cache=True):
+        """ Vectorized version of `parse_views_and_poses`, followed by `MeshroomTransform` methods
+            `translation` and `rotation` for each view's pose, returning a `PoseArrays` tuple.
+
+            Note: views without a (reconstructed) pose are skipped.
+        """
+        columns = load_cached(
+            cameras_file_path,
+            "meshroom_views_and_poses",
+            MeshroomParser.VIEWS_AND_POSES_VERSION,
+            MeshroomParser._views_and_poses_columns_from,
+            use_cache,
+        )
+
+        pose_index = {pose_id: i for i, pose_id in enumerate(columns["pose_ids"].tolist())}
+        view_rows, pose_rows = [], []
+        for i, pose_id in enumerate(columns["view_pose_ids"].tolist()):
+            if pose_id in pose_index:
+                view_rows.append(i)
+                pose_rows.append(pose_index[pose_id])
+
+        view_ids = columns["view_ids"][view_rows]
+        rotations = MeshroomTransform.rotations(columns["pose_rotations"][pose_rows])
+
+        return MeshroomParser.PoseArrays(
+            view_index={view_id: i for i, view_id in enumerate(view_ids.tolist())},
+            view_ids=view_ids,
+            paths=columns["view_paths"][view_rows],
+            centers=columns["pose_centers"][pose_rows].reshape((-1, 3)),
+            rotations=rotations,
+            quaternions=MeshroomQuaternion.XYZW.from_rotation_matrices(rotations),
+        )
+
+    @staticmethod
+    def _views_and_poses_columns_from(cameras_file_path):
+        columns = MeshroomParser.parse_sfm_arrays(cameras_file_path, sections=["views", "poses"])
+        del columns["view_intrinsic_ids"]
+        return columns
+
+    @staticmethod
+    def write_sfm(
+        sfm_file_path,
+        output_file_path,
+        pose_ids,
+        rotations,
+        centers,
+        lock_poses=True,
+        skip_sections=(),
+    ):
+        """ Copies a .sfm file into `output_file_path` in a single streaming pass, replacing the
+            `transform` of the poses in `pose_ids` with the `(n, 3, 3)` `rotations` and `(n, 3)`
+            `centers` (and setting them as `locked`, if `lock_poses` is True), while everything else
+            is kept as is. Returns the number of poses that were updated.
+
+            Note: the output is formatted like `json.dumps(sfm, indent=4)` would, but items are only
+            decoded (and encoded) one at a time, and `skip_sections` (e.g. "featuresFolders") are
+            removed.
+        """
+        pose_index = {pose_id: i for i, pose_id in enumerate(np.asarray(pose_ids).tolist())}
+        assert len(pose_index) == len(rotations) == len(centers), (
+            len(pose_index),
+            len(rotations),
+            len(centers),
+        )
+
+        # NOTE values are stored as strings, as Meshroom does
+        rotation_values = [
+            list(map(str, _)) for _ in MeshroomTransform.unparse_rotations(rotations).tolist()
+        ]
+        center_values = [
+            list(map(str, _))
+            for _ in np.asarray(centers, dtype=np.float64).reshape((-1, 3)).tolist()
+        ]
+
+        def dumps(value, depth):
+            return json.dumps(value, indent=4).replace("\n", "\n" + " " * (4 * depth))
+
+        updated_pose_count = 0
+        with open(sfm_file_path, "r") as sfm_file, open(output_file_path, "w") as output_file:
+            stream = _JsonStream(sfm_file, MeshroomParser.SFM_CHUNK_SIZE)
+            separator = "{\n"
+            for key in stream.iter_object_keys():
+                if key in skip_sections:
+                    stream.skip_value()
+                    continue
+                output_file.write(f"{separator}    {json.dumps(key)}: ")
+                separator = ",\n"
+
+                if stream.peek() != "[":
+                    output_file.write(dumps(stream.decode(), depth=1))
+                    continue
+
+                item_separator = "[\n"
+                for item in stream.iter_array():
+                    if key == "poses" and (i := pose_index.get(item["poseId"], None)) is not None:
+                        item["pose"]["transform"]["rotation"] = rotation_values[i]
+                        item["pose"]["transform"]["center"] = center_values[i]
+                        if lock_poses:
+                            item["pose"]["locked"] = "1"
+                        updated_pose_count += 1
+                    output_file.write(f"{item_separator}        {dumps(item, depth=2)}")
+                    item_separator = ",\n"
+                output_file.write("[]" if item_separator == "[\n" else "\n    ]")
+
+            output_file.write("{}\n" if separator == "{\n" else "\n}\n")
+
+        return updated_pose_count
+
+    class Landmarks(NamedTuple):
+        ids: np.ndarray  # (n,) landmark ids (as strings)
+        positions: np.ndarray  # (n, 3) 3D points (in Meshroom's world coordinates)
+        colors: np.ndarray  # (n, 3) RGB colors (as uint8)
+        observation_counts: np.ndarray  # (n,) number of views in which each landmark was observed
+
+    # NOTE bump this whenever `_landmarks_columns_from` changes, to invalidate cached files
+    LANDMARKS_VERSION = 1
+
+    @staticmethod
+    def parse_landmarks(sfm_file_path, use_cache=True):
+        """ Parses the `structure` of a .sfm (or .json) file, or of an Alembic .abc file (which
+            requires the `alembic` Python bindings), into a `Landmarks` tuple of numpy arrays.
+
+            Note: the parsed arrays are cached in a .npz sidecar file (see `ie.npzcache`), unless
+            `use_cache` is False.
+        """
+        columns = load_cached(
+            sfm_file_path,
+            "meshroom_landmarks",
+            MeshroomParser.LANDMARKS_VERSION,
+            MeshroomParser._landmarks_columns_from,
+            use_cache,
+        )
+        return MeshroomParser.Landmarks(
+            ids=columns["ids"],
+            positions=columns["positions"],
+            colors=columns["colors"],
+            observation_counts=columns["observation_counts"],
+        )
+
+    @staticmethod
+    def _landmarks_columns_from(sfm_file_path):
+        if os.path.splitext(sfm_file_path)[1].lower() == ".abc":
+            return MeshroomParser._landmarks_columns_from_abc(sfm_file_path)
+
+        ids = []
+        positions = _ArrayBuilder((3,))
+        colors = _ArrayBuilder((3,), dtype=np.uint8)
+        observation_counts = _ArrayBuilder((), dtype=np.int64)
+
+        # { landmarkId descType color X observations [{ observationId featureId x }] }
+        for _, landmark in MeshroomParser.iter_sfm(sfm_file_path, sections=["structure"]):
+            ids.append(landmark["landmarkId"])
+            positions.append(list(map(float, landmark["X"])))
+            colors.append(list(map(int, landmark["color"])))
+            observation_counts.append(len(landmark.get("observations", [])))
+
+        return {
+            "ids": np.array(ids, dtype=str),
+            "positions": positions.array(),
+            "colors": colors.array(),
+            "observation_counts": observation_counts.array(),
+        }
+
+    @staticmethod
+    def _landmarks_columns_from_abc(abc_file_path):
+        # NOTE AliceVision's AlembicExporter stores landmarks in the "mvgPointCloud" points object,
+        # with their positions' Y and Z axes negated, and their colors scaled to [0, 1]
+        # ref.: https://github.com/alicevision/AliceVision/blob/develop/src/aliceVision/sfmDataIO/AlembicExporter.cpp
+        from alembic import Abc, AbcGeom
+
+        def find_object(obj, name):
+            if obj.getName() == name:
+                return obj
+            for i in range(obj.getNumChildren()):
+                if (found := find_object(obj.getChild(i), name)) is not None:
+                    return found
+            return None
+
+        archive = Abc.IArchive(abc_file_path)
+        obj = find_object(archive.getTop(), "mvgPointCloud")
+        assert obj is not None, f"No landmarks (i.e. 'mvgPointCloud') in '{abc_file_path}'"
+
+        schema = AbcGeom.IPoints(obj, Abc.WrapExistingFlag.kWrapExisting).getSchema()
+        sample = schema.getValue()
+
+        positions = np.array(
+            [[p[0], p[1], p[2]] for p in sample.getPositions()], dtype=np.float64
+        ).reshape((-1, 3))
+        positions[:, 1:] *= -1
+        n = len(positions)
+
+        arb_geom_params = schema.getArbGeomParams()
+        if arb_geom_params.valid() and arb_geom_params.getPropertyHeader("color") is not None:
+            color_values = (
+                AbcGeom.IC3fGeomParam(arb_geom_params, "color").getExpandedValue().getVals()
+            )
+            colors = np.array([[c[0], c[1], c[2]] for c in color_values], dtype=np.float64).reshape(
+                (-1, 3)
+            )
+            colors = np.clip(np.round(255 * colors), 0, 255).astype(np.uint8)
+        else:
+            colors = np.zeros((n, 3), dtype=np.uint8)
+
+        user_properties = schema.getUserProperties()
+        if (
+            user_properties.valid()
+            and user_properties.getPropertyHeader("mvg_visibilitySize") is not None
+        ):
+            visibility_sizes = Abc.IUInt32ArrayProperty(
+                user_properties, "mvg_visibilitySize"
+            ).getValue()
+            observation_counts = np.array(list(visibility_sizes), dtype=np.int64)
+        else:
+            observation_counts = np.zeros(n, dtype=np.int64)
+
+        return {
+            "ids": np.array([str(i) for i in sample.getIds()], dtype=str),
+            "positions": positions,
+            "colors": colors,
+            "observation_counts": observation_counts,
+        }
+
     class View:
         def __init__(self, pose_id, path, width, height):
             """ E.g.: `_, pose_id, path, width, height = extract_from(views_dict)` """
@@ -87,6 +468,159 @@ class MeshroomParser:
 ###############################################################################
 
 
+def write_binary_ply(ply_file_path, points, colors=None, comments=()):
+    """ Writes `points` (and, optionally, uint8 RGB `colors`) as a (little-endian) binary PLY file,
+        e.g. `write_binary_ply("sfm.ply", landmarks.positions, landmarks.colors)`.
+
+        Note: points are written as float32 (so float64 positions are rounded to single precision,
+        i.e. to ~7 significant digits), and `comments` are written on a single line each, as ASCII
+        text (newlines are replaced by spaces, and non-ASCII characters by "?").
+    """
+    points = np.asarray(points).reshape((-1, 3))
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if colors is not None:
+        colors = np.asarray(colors).reshape((-1, 3))
+        assert len(colors) == len(points), (colors.shape, points.shape)
+        fields += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+
+    vertices = np.empty(len(points), dtype=fields)
+    vertices["x"], vertices["y"], vertices["z"] = points.T
+    if colors is not None:
+        vertices["red"], vertices["green"], vertices["blue"] = colors.T
+
+    ply_types = {"<f4": "float", "u1": "uchar"}
+    header = [
+        "ply",
+        "format binary_little_endian 1.0",
+        *[f"comment {' '.join(str(comment).splitlines())}" for comment in comments],
+        f"element vertex {len(points)}",
+        *[f"property {ply_types[field_type]} {name}" for name, field_type in fields],
+        "end_header",
+    ]
+    header = ("\n".join(header) + "\n").encode("ascii", "replace")  # NOTE before opening the file
+
+    with open(ply_file_path, "wb") as ply_file:
+        ply_file.write(header)
+        vertices.tofile(ply_file)
+
+
+###############################################################################
+###############################################################################
+
+
+class _JsonStream:
+    """ Incrementally decodes a (large) JSON file, keeping only one value in memory at once. """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, file, chunk_size: int):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _read_chunk(self) -> bool:
+        """ Appends the next chunk of the file to the buffer (or returns False if there's none). """
+        if self.pos >= self.chunk_size:
+            self.buffer = self.buffer[self.pos :]  # NOTE drop what has already been consumed
+            self.pos = 0
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self) -> str:
+        """ Returns the next non-whitespace character (without consuming it), or "" at the end. """
+        while True:
+            self.pos = _JsonStream._WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_chunk():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """ Consumes (and returns) the next non-whitespace character, which must be in `chars`. """
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expected one of {list(chars)}", self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ Decodes (and consumes) the next JSON value. """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # NOTE values that end with the buffer (e.g. numbers) may have been cut in half
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._read_chunk()
+
+    def iter_array(self) -> Iterator:
+        """ Decodes the next JSON array, one item at a time. """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+    def iter_object_keys(self) -> Iterator[str]:
+        """ Decodes the keys of the next JSON object, leaving their values to the caller. """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+    def skip_value(self) -> None:
+        """ Consumes the next JSON value (arrays item by item, so they're never fully loaded). """
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                pass
+        else:
+            self.decode()
+
+
+class _ArrayBuilder:
+    """ Appends rows of `row_shape` to a preallocated array, doubling its capacity when full. """
+
+    def __init__(self, row_shape: Tuple[int, ...], dtype=np.float64, capacity: int = 1024):
+        self.data = np.empty((capacity, *row_shape), dtype=dtype)
+        self.size = 0
+
+    def append(self, row) -> None:
+        if self.size == len(self.data):
+            data = np.empty((2 * len(self.data), *self.data.shape[1:]), dtype=self.data.dtype)
+            data[: self.size] = self.data
+            self.data = data
+        self.data[self.size] = row
+        self.size += 1
+
+    def array(self) -> np.ndarray:
+        return self.data[: self.size].copy()
+
+
+###############################################################################
+###############################################################################
+
+
 # TODO group View and Pose into this single class (and possibly remove them)
 # https://github.com/alicevision/meshroom/blob/develop/meshroom/ui/reconstruction.py#L1100
 # https://github.com/alicevision/meshroom/blob/develop/meshroom/ui/reconstruction.py#L169
@@ -156,12 +690,28 @@ class MeshroomTransform:
             return MeshroomQuaternion.XYZW.from_rotation_matrix(matrix)
         return matrix
 
+    @staticmethod
+    def rotations(Rs: np.ndarray) -> np.ndarray:
+        """ Vectorized version of `rotation(R, as_xyzw_quaternion=False)`, converting `(n, 9)`
+            values into `(n, 3, 3)` matrices.
+        """
+        matrices = np.array(Rs, dtype=np.float64).reshape((-1, 3, 3))  # NOTE copies `Rs`
+        matrices[:, :, 1:] *= -1
+        return matrices
+
     @staticmethod
     def unparse_rotation(R: np.ndarray) -> List[float]:
         """ Converts a 3x3 rotation matrix back into Meshroom's list representation of it. """
         assert R.shape == (3, 3), R
-        R[:, 1:] *= -1  # undo the negation of the middle and last rows
-        return R.flatten().tolist()  # NOTE flattens in row-major order
+        return MeshroomTransform.unparse_rotations(R)[0].tolist()
+
+    @staticmethod
+    def unparse_rotations(Rs: np.ndarray) -> np.ndarray:
+        """ Vectorized `unparse_rotation`, converting `(n, 3, 3)` matrices into `(n, 9)` values. """
+        # NOTE copies `Rs` (i.e. doesn't modify it)
+        values = np.array(Rs, dtype=np.float64).reshape((-1, 3, 3))
+        values[:, :, 1:] *= -1  # undo the negation of the middle and last columns
+        return values.reshape((-1, 9))  # NOTE flattens in row-major order
 
     @staticmethod
     def pose(R: List[float], T: List[float]) -> np.ndarray:
@@ -203,12 +753,24 @@ class MeshroomQuaternion:
             x, y, z, w = Q
             return MeshroomQuaternion.WXYZ.to_rotation_matrix(np.array([w, x, y, z]))
 
+        @staticmethod
+        def to_rotation_matrices(Qs: np.ndarray) -> np.ndarray:
+            """ Vectorized version of `to_rotation_matrix`, for `(n, 4)` quaternions. """
+            return MeshroomQuaternion.WXYZ.to_rotation_matrices(
+                np.asarray(Qs).reshape((-1, 4))[:, [3, 0, 1, 2]]
+            )
+
         @staticmethod
         def from_rotation_matrix(R: np.ndarray) -> np.ndarray:
             """ Creates a quaternion that corresponds to the (row-major) 3x3 rotation matrix. """
             w, x, y, z = MeshroomQuaternion.WXYZ.from_rotation_matrix(R)
             return np.array([x, y, z, w])
 
+        @staticmethod
+        def from_rotation_matrices(Rs: np.ndarray) -> np.ndarray:
+            """ Vectorized version of `from_rotation_matrix`, for `(n, 3, 3)` matrices. """
+            return MeshroomQuaternion.WXYZ.from_rotation_matrices(Rs)[:, [1, 2, 3, 0]]
+
     class WXYZ:
         @staticmethod
         def to_rotation_matrix(Q: np.ndarray) -> np.ndarray:
@@ -232,6 +794,27 @@ class MeshroomQuaternion:
                 ]
             )
 
+        @staticmethod
+        def to_rotation_matrices(Qs: np.ndarray) -> np.ndarray:
+            """ Vectorized version of `to_rotation_matrix`, for `(n, 4)` quaternions. """
+            w, x, y, z = np.asarray(Qs, dtype=np.float64).reshape((-1, 4)).T
+
+            # fmt: off
+            xx = x * x
+            xy = x * y; yy = y * y
+            xz = x * z; yz = y * z; zz = z * z
+            xw = x * w; yw = y * w; zw = z * w
+
+            return np.stack(
+                [
+                    np.stack([1 - 2 * (yy + zz),     2 * (xy + zw),     2 * (xz - yw)], axis=-1),
+                    np.stack([    2 * (xy - zw), 1 - 2 * (xx + zz),     2 * (yz + xw)], axis=-1),
+                    np.stack([    2 * (xz + yw),     2 * (yz - xw), 1 - 2 * (xx + yy)], axis=-1),
+                ],
+                axis=1,
+            )
+            # fmt: on
+
         @staticmethod
         def from_rotation_matrix(R: np.ndarray) -> np.ndarray:
             """ See http://www.j3d.org/matrix_faq/matrfaq_latest.html#Q55
@@ -267,6 +850,45 @@ class MeshroomQuaternion:
 
             return np.array([scalar, *axis])
 
+        @staticmethod
+        def from_rotation_matrices(Rs: np.ndarray) -> np.ndarray:
+            """ Vectorized (branch-free) version of `from_rotation_matrix`, for `(n, 3, 3)` arrays.
+
+                Note: both branches are evaluated for every matrix, and the one that
+                `from_rotation_matrix` would take is then selected, so results (including its choice
+                of `i`) are the same.
+            """
+            R = np.asarray(Rs, dtype=np.float64).reshape((-1, 3, 3))
+            n = np.arange(len(R))
+
+            trace = np.trace(R, axis1=1, axis2=2)
+            use_trace = trace > 0.00000001
+
+            # NOTE `from_rotation_matrix` only compares R[1, 1] and R[2, 2] (i.e. i is never 0)
+            i = np.where(R[:, 2, 2] > R[:, 1, 1], 2, 1)
+            j = np.array([1, 2, 0])[i]
+            k = np.array([1, 2, 0])[j]
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                s_trace = 2 * np.sqrt(trace + 1)
+                trace_quaternions = np.column_stack(
+                    [
+                        0.25 * s_trace,
+                        (R[:, 1, 2] - R[:, 2, 1]) / s_trace,
+                        (R[:, 2, 0] - R[:, 0, 2]) / s_trace,
+                        (R[:, 0, 1] - R[:, 1, 0]) / s_trace,
+                    ]
+                )
+
+                s = 2 * np.sqrt(R[n, i, i] - R[n, j, j] - R[n, k, k] + 1)
+                axis_quaternions = np.empty((len(R), 4))
+                axis_quaternions[:, 0] = (R[n, j, k] - R[n, k, j]) / s
+                axis_quaternions[n, 1 + i] = 0.25 * s
+                axis_quaternions[n, 1 + j] = (R[n, i, j] + R[n, j, i]) / s
+                axis_quaternions[n, 1 + k] = (R[n, i, k] + R[n, k, i]) / s
+
+            return np.where(use_trace[:, None], trace_quaternions, axis_quaternions)
+
 
 ###############################################################################
 ###############################################################################
@@ -0,0 +1,155 @@
+import os
+import glob
+import json
+import zipfile
+import argparse
+
+from typing import Dict, List, Callable
+
+import numpy as np
+
+###############################################################################
+###############################################################################
+
+
+# NOTE parsed arrays are cached in a "sidecar" .npz file, saved next to the parsed
+# one (i.e. at `{path}.{name}.cache.npz`), which is (re)written whenever:
+#  - there's no sidecar file yet, or it can't be read (e.g. it's corrupted),
+#  - the parsed file's mtime or size changed (i.e. it was modified),
+#  - the parsed file was moved (i.e. its absolute path changed),
+#  - the parser's name or version changed (i.e. cached arrays may be outdated).
+# So, parsers should bump their version whenever the arrays they return change.
+
+# NOTE caching can be disabled by setting the FF_NPZ_CACHE environment variable to 0
+NPZ_CACHE_ENV = "FF_NPZ_CACHE"
+NPZ_CACHE_SUFFIX = ".cache.npz"
+
+_CACHE_KEY = "__cache_key__"  # stores the JSON-serialized cache key (see `cache_key`)
+
+
+def is_enabled() -> bool:
+    return os.environ.get(NPZ_CACHE_ENV, "1").lower() not in ["0", "false", "no", "off"]
+
+
+def sidecar_path(path: str, name: str) -> str:
+    """ Returns the path of the .npz sidecar file of `path` for the parser `name`. """
+    return f"{path}.{name}{NPZ_CACHE_SUFFIX}"
+
+
+def cache_key(path: str, name: str, version: int) -> str:
+    stat = os.stat(path)
+    return json.dumps(
+        {
+            "path": os.path.abspath(path),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "name": name,
+            "version": version,
+        },
+        sort_keys=True,
+    )
+
+
+###############################################################################
+###############################################################################
+
+
+def load_cached(
+    path: str,
+    name: str,
+    version: int,
+    parse_fn: Callable[[str], Dict[str, np.ndarray]],
+    use_cache: bool = True,
+) -> Dict[str, np.ndarray]:
+    """ Returns `parse_fn(path)`, reading it from the sidecar file if it's up-to-date,
+        or (re)writing it otherwise (so that the next call can skip text parsing).
+
+        Note: object arrays (e.g. of Python strings) are saved as unicode arrays,
+        so that the sidecar files can be loaded without pickle (i.e. `allow_pickle=False`).
+    """
+    if not (use_cache and is_enabled()):
+        return parse_fn(path)
+
+    key = cache_key(path, name, version)  # NOTE computed before parsing the file
+    sidecar = sidecar_path(path, name)
+
+    try:
+        with np.load(sidecar, allow_pickle=False) as npz:
+            if str(npz[_CACHE_KEY]) == key:
+                return {array_name: npz[array_name] for array_name in npz.files if array_name != _CACHE_KEY}
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+        pass  # NOTE missing, outdated or corrupted sidecar files are simply rewritten
+
+    arrays = parse_fn(path)
+    save_cached(sidecar, key, arrays)
+    return arrays
+
+
+def save_cached(sidecar: str, key: str, arrays: Dict[str, np.ndarray]) -> bool:
+    """ Atomically (re)writes a sidecar file, returning False if it couldn't be written. """
+    assert _CACHE_KEY not in arrays
+    arrays = {array_name: np.asarray(array) for array_name, array in arrays.items()}
+    arrays = {
+        array_name: (array.astype(str) if array.dtype == object else array)
+        for array_name, array in arrays.items()
+    }
+
+    temp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            np.savez(f, **{_CACHE_KEY: np.array(key)}, **arrays)
+        os.replace(temp, sidecar)
+        return True
+    except OSError:
+        # NOTE e.g. read-only experiment folders, in which case we just don't cache
+        if os.path.isfile(temp):
+            os.remove(temp)
+        return False
+
+
+###############################################################################
+###############################################################################
+
+
+def find_sidecars(paths: List[str], recursive: bool = False) -> List[str]:
+    """ Returns the sidecar files in (or of) `paths`, which can be folders or parsed files. """
+    sidecars = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, "**" if recursive else "", f"*{NPZ_CACHE_SUFFIX}")
+            sidecars.extend(glob.glob(pattern, recursive=recursive))
+        elif path.endswith(NPZ_CACHE_SUFFIX):
+            sidecars.append(path)
+        else:
+            sidecars.extend(glob.glob(f"{glob.escape(path)}.*{NPZ_CACHE_SUFFIX}"))
+    return sorted(set(sidecars))
+
+
+def clear(paths: List[str], recursive: bool = False, dry_run: bool = False) -> List[str]:
+    """ Deletes the sidecar files in (or of) `paths`, returning their paths. """
+    sidecars = find_sidecars(paths, recursive)
+    if not dry_run:
+        for sidecar in sidecars:
+            os.remove(sidecar)
+    return sidecars
+
+
+###############################################################################
+###############################################################################
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Lists or clears the .npz sidecar files that cache parsed (text) files."
+    )
+
+    parser.add_argument("command", choices=["list", "clear"])
+    parser.add_argument("paths", type=str, nargs="*", default=["."], help="Folders or parsed files")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Search folders recursively")
+
+    args = parser.parse_args()
+
+    sidecars = clear(args.paths, args.recursive, dry_run=(args.command == "list"))
+    for sidecar in sidecars:
+        print(sidecar)
+    print(f"{'Found' if args.command == 'list' else 'Deleted'} {len(sidecars)} sidecar file(s)")
@@ -116,6 +116,108 @@ def plane_from_points(points: np.ndarray, use_old_method: bool = False) -> Optio
     return plane_from_point_and_normal(centroid, normal / norm)
 
 
+PLANES_CHUNK_SIZE = 1 << 16  # number of neighborhoods fitted at once by `planes_from_*`
+
+
+def planes_from_covariances(centroids: np.ndarray, covariances: np.ndarray) -> np.ndarray:
+    """Vectorized version of the (weighted direction) method used by `plane_from_points`,
+    for `(n, 3)` centroids and `(n, 6)` covariance sums `[xx, xy, xz, yy, yz, zz]`.
+    Returns `(n, 4)` planes, where rows for which `plane_from_points` would return None are NaN.
+    """
+    xx, xy, xz, yy, yz, zz = covariances.T
+
+    det_x = yy * zz - yz * yz
+    det_y = xx * zz - xz * xz
+    det_z = xx * yy - xy * xy
+
+    x_axis_dir = np.stack([det_x, xz * yz - xy * zz, xy * yz - xz * yy], axis=-1)
+    y_axis_dir = np.stack([xz * yz - xy * zz, det_y, xy * xz - yz * xx], axis=-1)
+    z_axis_dir = np.stack([xy * yz - xz * yy, xy * xz - yz * xx, det_z], axis=-1)
+
+    def sign(is_negative):
+        return np.where(is_negative, -1.0, +1.0)[:, None]
+
+    weighted_dir = (det_x * det_x)[:, None] * x_axis_dir
+    weighted_dir += (
+        (det_y * det_y)[:, None] * y_axis_dir * sign(np.sum(weighted_dir * y_axis_dir, axis=1) < 0)
+    )
+    weighted_dir += (
+        (det_z * det_z)[:, None] * z_axis_dir * sign(np.sum(weighted_dir * z_axis_dir, axis=1) < 0)
+    )
+
+    norm = np.linalg.norm(weighted_dir, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normals = weighted_dir / np.where(norm == 0, np.nan, norm)[:, None]
+
+    return np.column_stack([normals, -np.sum(normals * centroids, axis=1)])
+
+
+def planes_from_neighbors(neighbors: np.ndarray, chunk_size: int = PLANES_CHUNK_SIZE) -> np.ndarray:
+    """Fits a plane to each of the `(n, k, 3)` neighborhoods (e.g. the k-nearest neighbors of n
+    points). Returns `(n, 4)` planes, like calling `plane_from_points` for each neighborhood (but
+    with NaN instead of None).
+    """
+    assert neighbors.ndim == 3 and neighbors.shape[2] == 3, neighbors.shape
+    n, k, _ = neighbors.shape
+    if k < 3:
+        return np.full((n, 4), np.nan)
+
+    planes = np.empty((n, 4))
+    for start in range(0, n, chunk_size):
+        chunk = np.asarray(neighbors[start : start + chunk_size], dtype=np.float64)
+        centroids = np.sum(chunk, axis=1) / k
+        xs, ys, zs = np.moveaxis(chunk - centroids[:, None], -1, 0)
+        covariances = np.stack(
+            [
+                np.sum(a * b, axis=1)
+                for a, b in [(xs, xs), (xs, ys), (xs, zs), (ys, ys), (ys, zs), (zs, zs)]
+            ],
+            axis=-1,
+        )
+        planes[start : start + chunk_size] = planes_from_covariances(centroids, covariances)
+
+    return planes
+
+
+def planes_from_csr_neighbors(
+    points: np.ndarray, indptr: np.ndarray, indices: np.ndarray, chunk_size: int = PLANES_CHUNK_SIZE
+) -> np.ndarray:
+    """Fits a plane to each neighborhood `points[indices[indptr[i] : indptr[i + 1]]]` (i.e. a CSR
+    neighbor list, which allows neighborhoods of different sizes, e.g. from radius searches).
+    Returns `(len(indptr) - 1, 4)` planes.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape((-1, 3))
+    indptr = np.asarray(indptr, dtype=np.int64)
+    indices = np.asarray(indices, dtype=np.int64)
+    n = len(indptr) - 1
+
+    planes = np.full((n, 4), np.nan)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        counts = np.diff(indptr[start : stop + 1])
+        rows = np.flatnonzero(counts >= 3)  # NOTE `plane_from_points` needs at least 3 points
+        if len(rows) == 0:
+            continue
+
+        # NOTE segments of "empty" (skipped) rows are dropped, so that `reduceat` sums each row
+        is_kept = np.repeat(counts >= 3, counts)
+        chunk = points[indices[indptr[start] : indptr[stop]][is_kept]]
+        kept_counts = counts[rows]
+        offsets = np.cumsum(kept_counts) - kept_counts
+
+        centroids = np.add.reduceat(chunk, offsets, axis=0) / kept_counts[:, None]
+        xs, ys, zs = (chunk - np.repeat(centroids, kept_counts, axis=0)).T
+        covariances = np.column_stack(
+            [
+                np.add.reduceat(a * b, offsets)
+                for a, b in [(xs, xs), (xs, ys), (xs, zs), (ys, ys), (ys, zs), (zs, zs)]
+            ]
+        )
+        planes[start + rows] = planes_from_covariances(centroids, covariances)
+
+    return planes
+
+
 def points_above_planes_mask(points: np.ndarray, planes: np.ndarray) -> np.ndarray:
     if planes.ndim == 1:
         planes = planes.reshape((1, -1))
@@ -138,31 +240,90 @@ def points_above_planes_mask(points: np.ndarray, planes: np.ndarray) -> np.ndarr
 ###############################################################################
 
 
-def create_unit_sphere_point_cloud(n, point_fn=None, color_fn=None, eps=0.0001):
-    if point_fn is None:
-        point_fn = lambda point: point
-    if color_fn is None:
-        color_fn = lambda point: [0, 0, 0]
-
-    points = []
-    colors = []
-    for _ in range(n):
-        while True:
-            point = np.random.rand(3) * 2.0 - 1.0
-            norm = np.linalg.norm(point)
-            if eps < norm <= 1.0:
-                break
-        point /= norm
-        points.append(point_fn(point))
-        colors.append(color_fn(point))
+# NOTE the functions below generate synthetic point clouds (e.g. for tests and benchmarks), where
+# `point_fn` and `color_fn` are applied to all points at once, i.e. they map `(n, 3)` arrays of
+# (unit) points to `(n, 3)` arrays of points and colors, respectively, and `seed` is passed to
+# `np.random.default_rng` (so it can also be a `np.random.Generator`, or None for a random seed)
+
+
+def sample_unit_sphere(n: int, seed=None, eps: float = 0.0001) -> np.ndarray:
+    """Samples `n` points uniformly on the unit sphere, by normalizing Gaussian samples."""
+    rng = np.random.default_rng(seed)
+    points = rng.standard_normal((n, 3))
+    norms = np.linalg.norm(points, axis=1)
+    while np.any(small := norms <= eps):  # NOTE (very) unlikely, but avoids dividing by ~0
+        points[small] = rng.standard_normal((np.count_nonzero(small), 3))
+        norms[small] = np.linalg.norm(points[small], axis=1)
+    points /= norms[:, None]
+    return points
+
+
+def sample_fibonacci_sphere(n: int) -> np.ndarray:
+    """Returns `n` evenly distributed points on the unit sphere, along a (deterministic) spiral."""
+    i = np.arange(n, dtype=np.float64) + 0.5
+    z = 1.0 - 2.0 * i / n
+    r = np.sqrt(1.0 - z * z)
+    theta = np.pi * (3.0 - np.sqrt(5.0)) * i  # golden angle increments
+    return np.column_stack([r * np.cos(theta), r * np.sin(theta), z])
+
+
+def sample_box(
+    n: int, min_bound=(-1.0, -1.0, -1.0), max_bound=(1.0, 1.0, 1.0), seed=None
+) -> np.ndarray:
+    """Samples `n` points uniformly inside the axis-aligned box from `min_bound` to `max_bound`."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(
+        np.asarray(min_bound, dtype=np.float64), np.asarray(max_bound, dtype=np.float64), (n, 3)
+    )
 
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = v3d(points)
-    pcd.colors = v3d(colors)
 
+def sample_plane(
+    n: int, point=(0.0, 0.0, 0.0), normal=(0.0, 0.0, 1.0), size: float = 2.0, seed=None
+) -> np.ndarray:
+    """Samples `n` points uniformly on a `size` by `size` square of the `point`, `normal` plane."""
+    rng = np.random.default_rng(seed)
+    normal = np.asarray(normal, dtype=np.float64)
+    normal = normal / np.linalg.norm(normal)
+
+    # NOTE same choice of orthogonal axes as in `create_plane_triangle_mesh`
+    dummy = [1, 0, 0] if np.dot(normal, [1, 0, 0]) > 0.01 else [0, 1, 0]
+    ortho1 = np.cross(normal, dummy)
+    ortho1 /= np.linalg.norm(ortho1)
+    ortho2 = np.cross(normal, ortho1)
+
+    uv = rng.uniform(-size / 2, size / 2, (n, 2))
+    return np.asarray(point, dtype=np.float64) + uv[:, :1] * ortho1 + uv[:, 1:] * ortho2
+
+
+def add_surface_noise(
+    points: np.ndarray, normals: np.ndarray, sigma: float, seed=None
+) -> np.ndarray:
+    """Displaces each point along its (unit) normal by zero-mean Gaussian noise (with `sigma`)."""
+    rng = np.random.default_rng(seed)
+    return points + rng.normal(0.0, sigma, (len(points), 1)) * normals
+
+
+def create_point_cloud(points: np.ndarray, point_fn=None, color_fn=None):
+    """Creates an Open3D point cloud with `point_fn(points)` and `color_fn(points)` (if given)."""
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = v3d(points if point_fn is None else point_fn(points))
+    if color_fn is not None:
+        pcd.colors = v3d(color_fn(points))
     return pcd
 
 
+def create_unit_sphere_point_cloud(
+    n, point_fn=None, color_fn=None, eps=0.0001, seed=None, fibonacci=False
+):
+    """Creates a point cloud with `n` points on the unit sphere (see `sample_unit_sphere`
+    and `sample_fibonacci_sphere`), colored in black if `color_fn` is None.
+    """
+    points = sample_fibonacci_sphere(n) if fibonacci else sample_unit_sphere(n, seed, eps)
+    if color_fn is None:
+        color_fn = lambda points: np.zeros_like(points)
+    return create_point_cloud(points, point_fn, color_fn)
+
+
 def create_plane_triangle_mesh(point, normal, eps=0.01):
     dummy = [1, 0, 0] if np.dot(normal, [1, 0, 0]) > eps else [0, 1, 0]
     ortho1 = np.cross(normal, dummy)